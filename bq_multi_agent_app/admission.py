@@ -0,0 +1,299 @@
+"""
+Admission control for the quotas that all sessions of a worker share.
+
+Every session in a worker competes for the same toolbox, BigQuery slots,
+Gemini quota and code-execution sessions. Each of these resources gets a
+`ResourceLimiter` with:
+- a concurrency limit (ADMISSION_<RESOURCE>_CONCURRENCY),
+- an optional token bucket (ADMISSION_<RESOURCE>_RATE requests per second,
+  bursting to ADMISSION_<RESOURCE>_BURST; 0 disables it),
+- a per-user share: one user holds at most ADMISSION_USER_SHARE of the slots,
+  so a heavy session always leaves room for others' quick lookups,
+- fair queueing: waiting callers are admitted round-robin across tenants, then
+  across users within a tenant, instead of first come, first served.
+A caller that is not admitted within ADMISSION_QUEUE_TIMEOUT_SECONDS gets
+`AdmissionTimeout`, which tools turn into an error response.
+
+Resources are taken with `admitted(...)`:
+- "toolbox" for every toolbox call, plus "bigquery" for BigQuery toolbox tools
+  (see `toolbox.ResilientTool`),
+- "bigquery" for jobs run from Python (extracts, batch predictions, BQML jobs),
+- "gemini" for every model request (`AdmittedGemini`),
+- "code_execution" for each data science agent run.
+
+The caller's user comes from the session and its tenant from the "tenant"
+session state key ("default" if unset). Callers without a tool context use the
+principal bound to the turn by `bind_principal`.
+
+Queue depth, in-flight counts and wait times are exported as OpenTelemetry
+metrics (`admission.queue.depth`, `admission.in_flight`, `admission.wait`,
+`admission.timeouts`), and `snapshot()` reports them for the server's /readyz.
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models import Gemini
+from google.adk.models import LlmRequest
+from google.adk.models import LlmResponse
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "120"))
+ADMISSION_USER_SHARE = float(os.getenv("ADMISSION_USER_SHARE", "0.5"))
+
+# Session state key naming the caller's tenant.
+TENANT_KEY = "tenant"
+DEFAULT_TENANT = "default"
+BACKGROUND_USER = "background"
+
+# Default concurrency limit and token bucket rate (per second, 0 = none) per resource.
+_DEFAULT_LIMITS = {
+    "toolbox": (32, 0),
+    "bigquery": (16, 0),
+    "gemini": (16, 0),
+    "code_execution": (4, 0),
+}
+
+_meter = metrics.get_meter(__name__)
+_queue_depth = _meter.create_up_down_counter(
+    "admission.queue.depth", description="Callers waiting for admission, by resource"
+)
+_in_flight = _meter.create_up_down_counter(
+    "admission.in_flight", description="Admitted callers holding a slot, by resource"
+)
+_wait_histogram = _meter.create_histogram(
+    "admission.wait", unit="s", description="Time spent waiting for admission, by resource"
+)
+_timeout_counter = _meter.create_counter(
+    "admission.timeouts", description="Callers not admitted within the queue timeout, by resource"
+)
+
+# (tenant, user) of the turn running in the current task.
+_principal: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar(
+    "admission_principal", default=(DEFAULT_TENANT, BACKGROUND_USER)
+)
+
+
+class AdmissionTimeout(Exception):
+    """The caller was not admitted to a resource within the queue timeout."""
+
+
+class ResourceLimiter:
+    """Concurrency limit, token bucket and fair queue for one resource."""
+
+    def __init__(self, name: str, capacity: int, rate: float, burst: float, user_share: float):
+        self.name = name
+        self.capacity = capacity
+        self.rate = rate
+        self.burst = burst
+        self.user_cap = max(1, math.ceil(capacity * user_share))
+        self.in_flight = 0
+        self.admitted = 0
+        self.timeouts = 0
+        self._tokens = burst
+        self._refilled_at = time.monotonic()
+        self._by_user: dict[tuple[str, str], int] = {}
+        # tenant -> user -> waiting futures; both levels rotate after each admission.
+        self._queues: "OrderedDict[str, OrderedDict[str, deque[asyncio.Future]]]" = OrderedDict()
+        self._refill_timer: asyncio.TimerHandle | None = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for users in self._queues.values() for q in users.values())
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _next_waiter(self) -> tuple[str, str] | None:
+        """The next (tenant, user) to admit, skipping users at their share."""
+        for tenant, users in list(self._queues.items()):
+            for user, queue in list(users.items()):
+                while queue and queue[0].done():
+                    queue.popleft()  # cancelled or timed out while waiting
+                if not queue:
+                    del users[user]
+                elif self._by_user.get((tenant, user), 0) < self.user_cap:
+                    return tenant, user
+            if not users:
+                del self._queues[tenant]
+        return None
+
+    def _dispatch(self) -> None:
+        self._refill_timer = None
+        while self.in_flight < self.capacity:
+            principal = self._next_waiter()
+            if principal is None:
+                return
+            if self.rate > 0:
+                self._refill()
+                if self._tokens < 1:
+                    delay = (1 - self._tokens) / self.rate
+                    self._refill_timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                    return
+                self._tokens -= 1
+            tenant, user = principal
+            users = self._queues[tenant]
+            waiter = users[user].popleft()
+            users.move_to_end(user)
+            self._queues.move_to_end(tenant)
+            self._grant(principal)
+            waiter.set_result(None)
+
+    def _grant(self, principal: tuple[str, str]) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+        self._by_user[principal] = self._by_user.get(principal, 0) + 1
+        _in_flight.add(1, {"resource": self.name})
+
+    async def acquire(self, tenant: str, user: str) -> None:
+        """Wait for a slot.
+
+        Raises:
+            AdmissionTimeout: If not admitted within ADMISSION_QUEUE_TIMEOUT_SECONDS.
+        """
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(tenant, OrderedDict()).setdefault(user, deque()).append(waiter)
+        _queue_depth.add(1, {"resource": self.name})
+        try:
+            if self._refill_timer is None:
+                self._dispatch()
+            await asyncio.wait_for(waiter, ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            _timeout_counter.add(1, {"resource": self.name})
+            raise AdmissionTimeout(
+                f"{self.name} is busy: not admitted within {ADMISSION_QUEUE_TIMEOUT_SECONDS:.0f}s, retry later."
+            )
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the caller was cancelled: give the slot back.
+                self.release(tenant, user)
+            raise
+        finally:
+            _queue_depth.add(-1, {"resource": self.name})
+            _wait_histogram.record(time.monotonic() - started, {"resource": self.name})
+
+    def release(self, tenant: str, user: str) -> None:
+        self.in_flight -= 1
+        self._by_user[(tenant, user)] -= 1
+        if not self._by_user[(tenant, user)]:
+            del self._by_user[(tenant, user)]
+        _in_flight.add(-1, {"resource": self.name})
+        if self._refill_timer is None:
+            self._dispatch()
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "rate_per_s": self.rate,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "timeouts": self.timeouts,
+        }
+
+
+def _limiter(name: str, capacity: int, rate: float) -> ResourceLimiter:
+    prefix = f"ADMISSION_{name.upper()}"
+    rate = float(os.getenv(f"{prefix}_RATE", str(rate)))
+    return ResourceLimiter(
+        name,
+        capacity=int(os.getenv(f"{prefix}_CONCURRENCY", str(capacity))),
+        rate=rate,
+        burst=float(os.getenv(f"{prefix}_BURST", str(max(1.0, rate)))),
+        user_share=ADMISSION_USER_SHARE,
+    )
+
+
+limiters = {name: _limiter(name, *limits) for name, limits in _DEFAULT_LIMITS.items()}
+
+
+def principal_for(context: ReadonlyContext | None) -> tuple[str, str]:
+    """(tenant, user) of the session behind `context`, or of the current turn."""
+    if context is None:
+        return _principal.get()
+    session = context.session
+    return context.state.get(TENANT_KEY) or DEFAULT_TENANT, session.user_id
+
+
+def bind_principal(callback_context: CallbackContext) -> None:
+    """before_agent_callback: bind the session's principal to the turn.
+
+    Model requests and background calls made while the turn runs are
+    attributed to it (context variables are inherited by tasks it starts).
+    """
+    _principal.set(principal_for(callback_context))
+    return None
+
+
+@asynccontextmanager
+async def admitted(*resources: str, context: ReadonlyContext | None = None):
+    """Hold a slot of each resource, taken in the order given.
+
+    Raises:
+        AdmissionTimeout: If a resource does not admit the caller in time.
+    """
+    if not ADMISSION_ENABLED:
+        yield
+        return
+    tenant, user = principal_for(context)
+    held = []
+    try:
+        for name in resources:
+            await limiters[name].acquire(tenant, user)
+            held.append(limiters[name])
+        yield
+    finally:
+        for limiter in reversed(held):
+            limiter.release(tenant, user)
+
+
+def snapshot() -> dict:
+    """Current admission state of every resource."""
+    return {name: limiter.to_dict() for name, limiter in limiters.items()}
+
+
+class AdmittedGemini(Gemini):
+    """Gemini model whose requests are admitted through the "gemini" limiter."""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        # The slot covers the remote request only. ADK runs tools and transferred
+        # sub-agents while this generator is suspended at `yield`, so holding it
+        # across yields would make their nested model calls wait for a second slot.
+        responses: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def request() -> None:
+            try:
+                async with admitted("gemini"):
+                    async for response in super(AdmittedGemini, self).generate_content_async(llm_request, stream):
+                        responses.put_nowait(response)
+            finally:
+                responses.put_nowait(done)
+
+        task = asyncio.ensure_future(request())
+        try:
+            while (response := await responses.get()) is not done:
+                yield response
+            await task  # re-raises AdmissionTimeout and model errors
+        finally:
+            if not task.done():
+                task.cancel()
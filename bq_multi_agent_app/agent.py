@@ -10,18 +10,42 @@ from datetime import date
 from google.adk.agents import Agent
 from google.adk.tools import load_artifacts
 
+from .admission import AdmittedGemini
+from .admission import bind_principal
+from .analysis_cache import serve_cached_analysis
+from .analysis_cache import store_analysis
+from .answer_cache import serve_cached_answer
+from .answer_cache import store_answer
+from .answer_cache import track_answer_sources
+from .budget import budget_model_call
+from .budget import budget_tool_call
+from .budget import record_model_usage
+from .budget import record_tool_latency
+from .budget import start_turn
+from .catalog_index import find_relevant_tables
+from .metadata_cache import serve_cached_metadata
+from .metadata_cache import store_metadata
+from .prefetch import finish_speculative_prefetch
+from .prefetch import remember_datasets
+from .prefetch import start_speculative_prefetch
 from .prompts import return_instructions_root
+from .result_frames import capture_result_frame
+from .result_frames import transform_result
+from .sql_templates import find_sql_templates
+from .sql_templates import inject_sql_templates
+from .sql_templates import record_sql_outcome
 from .sub_agents import bqml_agent
 from .sub_agents import pg_agent
 from .tools import call_data_science_agent
 from .tools import bq_conversational_toolset
 from .tools import bq_data_retrieval_toolset
 from .tools import bqml_analysis_toolset
+from .tools import export_bq_data
 
 date_today = date.today()
 
 root_agent = Agent(
-    model='gemini-2.5-pro',
+    model=AdmittedGemini(model='gemini-2.5-pro'),
     name="bigquery_ds_agent",
     global_instruction=(
         f"""
@@ -37,7 +61,39 @@ root_agent = Agent(
         bq_conversational_toolset,     # BigQuery conversational analytics
         bq_data_retrieval_toolset,     # BigQuery data retrieval and schema tools
         bqml_analysis_toolset,        # BigQuery ML analysis tools
+        find_relevant_tables,       # Local BM25 index over BigQuery and Postgres catalogs
+        export_bq_data,             # Storage Read API extracts of large results to Parquet
+        transform_result,           # Local filter/sort/top-n/group/pivot follow-ups on fetched results
         call_data_science_agent,    # Data science analysis with code execution
         load_artifacts,             # Load local files for analysis
     ],
+    # bind_principal attributes the turn's calls to its user for admission
+    # control; start_turn opens the per-turn token/latency budget; repeated questions
+    # are answered from the semantic answer cache; otherwise speculative schema
+    # discovery runs while the first model call is in flight, unless a validated
+    # SQL template answers the question
+    before_agent_callback=[
+        bind_principal,
+        start_turn,
+        serve_cached_answer,
+        find_sql_templates,
+        start_speculative_prefetch,
+    ],
+    after_agent_callback=[store_answer, finish_speculative_prefetch],
+    # Per-turn budget accounting and degraded modes; validated SQL templates
+    # for the question are added to the instructions
+    before_model_callback=[budget_model_call, inject_sql_templates],
+    after_model_callback=record_model_usage,
+    # Serve repeated discovery calls from the shared metadata cache and
+    # repeated forecast/contribution calls from the analysis result cache
+    before_tool_callback=[budget_tool_call, serve_cached_metadata, serve_cached_analysis],
+    after_tool_callback=[
+        record_tool_latency,
+        store_metadata,
+        remember_datasets,
+        track_answer_sources,
+        store_analysis,
+        capture_result_frame,
+        record_sql_outcome,
+    ],
 )
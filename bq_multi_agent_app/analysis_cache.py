@@ -0,0 +1,353 @@
+"""
+Result cache for the BQML analysis tools (forecast and contribution analysis).
+
+`bigquery-forecast` and `bigquery-analyze-contribution` are the slowest tools
+of the app, and users repeat them with the same table, columns, horizon and
+dimensions. Results are cached by tool name and canonicalized arguments, and
+each entry records the modification time of the source tables it was computed
+from (see `answer_cache.tables_in_call`).
+
+On a repeated call:
+- fresh entry (source tables unchanged, younger than ANALYSIS_CACHE_MAX_AGE_SECONDS)
+  is returned directly;
+- stale entry (source tables changed, or past its age) younger than
+  ANALYSIS_CACHE_STALE_SECONDS is returned marked as stale while a single
+  background refresh recomputes it (stale-while-revalidate);
+- anything older runs the tool normally.
+When the source tables cannot be determined (e.g. an unparsable query) the
+entry is only trusted for ANALYSIS_CACHE_UNVERSIONED_TTL_SECONDS.
+
+Hot series (entries hit at least ANALYSIS_HOT_MIN_HITS times, plus the calls
+listed in ANALYSIS_PRECOMPUTE_FILE) can be recomputed ahead of time with
+`run_precompute_loop`, started by the server when
+ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS is set, or with `python main.py precompute`.
+
+Entries are kept in memory and persisted to SQLite (see `local_store.py`).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+
+from .answer_cache import tables_in_call
+from .bq_storage import table_last_modified
+from .local_store import open_db
+from .metadata_cache import canonical_args
+from .metadata_cache import is_error_response
+from .toolbox import call_toolbox_tool
+from .tools import bqml_analysis_toolset
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_MAX_AGE_SECONDS = float(os.getenv("ANALYSIS_CACHE_MAX_AGE_SECONDS", "86400"))
+ANALYSIS_CACHE_STALE_SECONDS = float(os.getenv("ANALYSIS_CACHE_STALE_SECONDS", "259200"))
+ANALYSIS_CACHE_UNVERSIONED_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_UNVERSIONED_TTL_SECONDS", "3600"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "500"))
+ANALYSIS_HOT_MIN_HITS = int(os.getenv("ANALYSIS_HOT_MIN_HITS", "3"))
+ANALYSIS_PRECOMPUTE_FILE = os.getenv("ANALYSIS_PRECOMPUTE_FILE", "")
+ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS", "0"))
+ANALYSIS_PRECOMPUTE_CONCURRENCY = int(os.getenv("ANALYSIS_PRECOMPUTE_CONCURRENCY", "2"))
+
+ANALYSIS_TOOLS = {"bigquery-forecast", "bigquery-analyze-contribution"}
+
+# Arguments listing columns, where order does not change the result.
+_COLUMN_LIST_ARGS = {"id_cols", "dimension_id_cols"}
+
+
+def _normalize(args: dict[str, Any]) -> dict[str, Any]:
+    """Collapse whitespace in text arguments and sort column lists."""
+    normalized = {}
+    for key, value in args.items():
+        if isinstance(value, str):
+            value = re.sub(r"\s+", " ", value).strip()
+        elif key in _COLUMN_LIST_ARGS and isinstance(value, list):
+            value = sorted(value)
+        normalized[key] = value
+    return normalized
+
+
+def cache_key(tool_name: str, args: dict[str, Any]) -> str:
+    return f"{tool_name}:{canonical_args(_normalize(args))}"
+
+
+async def source_version(tool_name: str, args: dict[str, Any]) -> dict[str, float] | None:
+    """Modification time of each source table of the call, or None if unknown."""
+    tables = tables_in_call(tool_name, args)
+    if not tables:
+        return None
+    tables = sorted(tables)
+    try:
+        modified = await asyncio.gather(
+            *(asyncio.to_thread(table_last_modified, table) for table in tables)
+        )
+    except Exception as e:
+        logger.info("Analysis cache: cannot read modification time of %s: %s", tables, e)
+        return None
+    return dict(zip(tables, modified))
+
+
+@dataclass
+class CachedResult:
+    """One cached analysis result."""
+
+    key: str
+    tool_name: str
+    args: dict[str, Any]
+    response: Any
+    version: dict[str, float] | None
+    stored_at: float
+    hits: int = 0
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def is_fresh(self, current: dict[str, float] | None) -> bool:
+        if self.version is None or current is None:
+            return self.age < ANALYSIS_CACHE_UNVERSIONED_TTL_SECONDS
+        return self.version == current and self.age < ANALYSIS_CACHE_MAX_AGE_SECONDS
+
+
+class AnalysisCache:
+    """Analysis results keyed by canonical call, in memory and in SQLite."""
+
+    def __init__(self, db_name: str = "analysis_cache"):
+        self._db_name = db_name
+        self._db = None
+        self._entries: dict[str, CachedResult] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, tool_name TEXT, args TEXT, response TEXT,"
+                " version TEXT, stored_at REAL, hits INTEGER)"
+            )
+            cutoff = time.time() - ANALYSIS_CACHE_STALE_SECONDS
+            self._db.execute("DELETE FROM results WHERE stored_at < ?", (cutoff,))
+            for row in self._db.execute("SELECT * FROM results ORDER BY stored_at"):
+                self._entries[row["key"]] = CachedResult(
+                    key=row["key"],
+                    tool_name=row["tool_name"],
+                    args=json.loads(row["args"]),
+                    response=json.loads(row["response"]),
+                    version=json.loads(row["version"]) if row["version"] else None,
+                    stored_at=row["stored_at"],
+                    hits=row["hits"],
+                )
+        return self._db
+
+    def get(self, key: str) -> CachedResult | None:
+        self._conn()
+        return self._entries.get(key)
+
+    def entries(self) -> list[CachedResult]:
+        self._conn()
+        return list(self._entries.values())
+
+    def put(
+        self,
+        tool_name: str,
+        args: dict[str, Any],
+        response: Any,
+        version: dict[str, float] | None,
+    ) -> None:
+        conn = self._conn()
+        key = cache_key(tool_name, args)
+        previous = self._entries.pop(key, None)
+        entry = CachedResult(
+            key=key,
+            tool_name=tool_name,
+            args=dict(args),
+            response=response,
+            version=version,
+            stored_at=time.time(),
+            hits=previous.hits if previous else 0,
+        )
+        self._entries[key] = entry
+        conn.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                tool_name,
+                json.dumps(entry.args, default=str),
+                json.dumps(response, default=str),
+                json.dumps(version) if version is not None else None,
+                entry.stored_at,
+                entry.hits,
+            ),
+        )
+        while len(self._entries) > ANALYSIS_CACHE_MAX_ENTRIES:
+            # Evict the least recently stored entry; dicts preserve insertion order.
+            oldest = next(iter(self._entries))
+            del self._entries[oldest]
+            conn.execute("DELETE FROM results WHERE key = ?", (oldest,))
+
+    def record_hit(self, entry: CachedResult) -> None:
+        entry.hits += 1
+        self._conn().execute("UPDATE results SET hits = ? WHERE key = ?", (entry.hits, entry.key))
+
+    def refresh(self, tool_name: str, args: dict[str, Any]) -> asyncio.Task:
+        """Recompute a call in the background; one refresh per key at a time."""
+        key = cache_key(tool_name, args)
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._recompute(tool_name, dict(args)))
+            self._refreshing[key] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return task
+
+    def is_refreshing(self, tool_name: str, args: dict[str, Any]) -> bool:
+        return cache_key(tool_name, args) in self._refreshing
+
+    async def _recompute(self, tool_name: str, args: dict[str, Any]) -> bool:
+        # Read the version before the call, so a change during the run is not missed.
+        version = await source_version(tool_name, args)
+        try:
+            # The toolbox tools need no auth or confirmation, so no ToolContext is required.
+            response = await call_toolbox_tool(bqml_analysis_toolset, tool_name, args, None)
+        except Exception as e:
+            logger.warning("Analysis cache refresh of %s failed: %s", tool_name, e)
+            return False
+        if is_error_response(response):
+            logger.warning("Analysis cache refresh of %s failed: %s", tool_name, response)
+            return False
+        self.put(tool_name, args, response, version)
+        logger.info("Analysis cache refreshed %s", cache_key(tool_name, args))
+        return True
+
+
+analysis_cache = AnalysisCache()
+
+# Source versions read before a tool ran, by function call ID, for storing its result.
+_call_versions: dict[str, dict[str, float] | None] = {}
+
+
+def _format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "less than a minute"
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60} min"
+
+
+def _cached_response(entry: CachedResult, stale: bool) -> dict:
+    response = dict(entry.response) if isinstance(entry.response, dict) else {"result": entry.response}
+    if stale:
+        note = (
+            f"Cached result from {_format_age(entry.age)} ago; the source data may have "
+            "changed since and a refresh is running. Mention that the result may be outdated."
+        )
+    else:
+        note = f"Cached result from {_format_age(entry.age)} ago; the source data has not changed since."
+    response["cache"] = {"cached": True, "stale": stale, "note": note}
+    return response
+
+
+async def serve_cached_analysis(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> dict | None:
+    """before_tool_callback: answer forecast and contribution calls from the cache.
+
+    Returns the cached result to skip the tool, or None to let it run.
+    """
+    if not ANALYSIS_CACHE_ENABLED or tool.name not in ANALYSIS_TOOLS:
+        return None
+
+    version = await source_version(tool.name, args)
+    entry = analysis_cache.get(cache_key(tool.name, args))
+    if entry is not None:
+        if entry.is_fresh(version):
+            analysis_cache.record_hit(entry)
+            return _cached_response(entry, stale=False)
+        if entry.age < ANALYSIS_CACHE_STALE_SECONDS:
+            analysis_cache.record_hit(entry)
+            analysis_cache.refresh(tool.name, args)
+            return _cached_response(entry, stale=True)
+
+    _call_versions[tool_context.function_call_id] = version
+    return None
+
+
+def store_analysis(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> None:
+    """after_tool_callback: cache successful forecast and contribution results."""
+    if tool.name not in ANALYSIS_TOOLS:
+        return None
+    version = _call_versions.pop(tool_context.function_call_id, None)
+    if (
+        not ANALYSIS_CACHE_ENABLED
+        or is_error_response(tool_response)
+        or (isinstance(tool_response, dict) and "cache" in tool_response)
+    ):
+        return None
+    analysis_cache.put(tool.name, args, tool_response, version)
+    return None
+
+
+def _precompute_targets() -> list[tuple[str, dict[str, Any]]]:
+    """Calls to keep warm: configured hot series plus frequently hit entries."""
+    targets = {}
+    if ANALYSIS_PRECOMPUTE_FILE:
+        try:
+            with open(ANALYSIS_PRECOMPUTE_FILE) as f:
+                specs = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot read ANALYSIS_PRECOMPUTE_FILE %s: %s", ANALYSIS_PRECOMPUTE_FILE, e)
+            specs = []
+        for spec in specs:
+            if spec.get("tool") in ANALYSIS_TOOLS and isinstance(spec.get("args"), dict):
+                targets[cache_key(spec["tool"], spec["args"])] = (spec["tool"], spec["args"])
+    for entry in analysis_cache.entries():
+        if entry.hits >= ANALYSIS_HOT_MIN_HITS:
+            targets.setdefault(entry.key, (entry.tool_name, entry.args))
+    return list(targets.values())
+
+
+async def precompute_hot_series() -> dict[str, int]:
+    """Recompute every hot series whose cached result is missing or not fresh.
+
+    Returns:
+        Counts of series that were "fresh", "refreshed" and "failed".
+    """
+    counts = {"fresh": 0, "refreshed": 0, "failed": 0}
+    semaphore = asyncio.Semaphore(ANALYSIS_PRECOMPUTE_CONCURRENCY)
+
+    async def warm(tool_name: str, args: dict[str, Any]) -> None:
+        async with semaphore:
+            entry = analysis_cache.get(cache_key(tool_name, args))
+            if entry is not None and entry.is_fresh(await source_version(tool_name, args)):
+                counts["fresh"] += 1
+                return
+            ok = await analysis_cache.refresh(tool_name, args)
+            counts["refreshed" if ok else "failed"] += 1
+
+    await asyncio.gather(*(warm(tool_name, args) for tool_name, args in _precompute_targets()))
+    return counts
+
+
+async def run_precompute_loop(interval: float = ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS) -> None:
+    """Keep hot series warm, every `interval` seconds, until cancelled."""
+    while True:
+        try:
+            counts = await precompute_hot_series()
+            logger.info("Analysis precompute: %s", counts)
+        except Exception as e:
+            logger.warning("Analysis precompute failed: %s", e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,437 @@
+"""
+Semantic answer cache for repeated analytical questions.
+
+Dashboard-style traffic asks the same question in slightly different words
+("revenue by region last month", "last month's revenue per region"). Each
+answered BigQuery turn is stored with an embedding of the question and the
+set of tables its tool calls read. A new question is answered from the cache
+when:
+- it was cached for the same tenant (see `admission.py`),
+- its embedding is within ANSWER_CACHE_MIN_SIMILARITY of a cached question,
+- it names the same literals (dates, numbers, quoted or capitalized values);
+  "revenue for EMEA in 2024" and "revenue for APAC in 2023" embed closely
+  but have different answers,
+- the cached answer was produced today (questions use relative dates) and is
+  younger than ANSWER_CACHE_MAX_AGE_SECONDS, and
+- none of the tables it read has a `last_modified_time` newer than the answer.
+
+A hit skips the root agent entirely and tells the user how old the answer is.
+Only turns that used read-only BigQuery tools are stored; turns that went to
+Postgres, BQML, the DS agent or produced artifacts are not. Only the first
+question of a session is looked up and stored: a follow-up ("and for APAC?")
+depends on the conversation before it, which the question alone does not carry.
+
+Entries are kept in memory and persisted to SQLite (see `local_store.py`).
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+from google import genai
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+from google.genai import types
+
+from .admission import principal_for
+from .bq_storage import table_last_modified
+from .budget import TURN_USAGE_KEY
+from .local_store import open_db
+from .metadata_cache import is_error_response
+from .toolbox import is_read_only_call
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", "text-embedding-005")
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.93"))
+ANSWER_CACHE_MAX_AGE_SECONDS = float(os.getenv("ANSWER_CACHE_MAX_AGE_SECONDS", "86400"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+DEFAULT_BQ_PROJECT = os.getenv("BIGQUERY_PROJECT") or os.getenv("GOOGLE_CLOUD_PROJECT")
+
+# Session state key tracking the sources of the current root-agent turn.
+TURN_SOURCES_KEY = "answer_cache:turn"
+# Lookup embeddings kept for turns still running; turns that fail or are
+# cancelled never store theirs, so the oldest are dropped past this bound.
+_MAX_PENDING_EMBEDDINGS = 1024
+
+# Tools whose results an answer may be built from; any other tool call makes
+# the turn uncacheable.
+CACHEABLE_SOURCE_TOOLS = {
+    "bigquery-execute-sql",
+    "bigquery-conversational-analytics",
+    "bigquery-forecast",
+    "bigquery-analyze-contribution",
+    "bigquery-get-dataset-info",
+    "bigquery-get-table-info",
+    "bigquery-list-dataset-ids",
+    "bigquery-list-table-ids",
+    "bigquery-search-catalog",
+}
+
+DATE_LITERAL = re.compile(r"(?<![\w-])\d{4}-\d{2}-\d{2}(?![\w-])")
+NUMBER_LITERAL = re.compile(r"(?<![\w.{-])\d+(?:\.\d+)?(?![\w.}-]|\.\d)")
+_QUOTED_LITERAL = re.compile(r"'([^']+)'|\"([^\"]+)\"")
+# Words with a digit or a capital letter past the first one of a sentence:
+# names of regions, products, quarters ("EMEA", "Germany", "Q3").
+_VALUE_WORD = re.compile(r"(?<![.?!]\s)(?<!^)\b(\w*[A-Z0-9][\w&-]*)")
+
+_TABLE_IN_SQL = re.compile(
+    r"(?:\bFROM|\bJOIN)\s+`?([\w-]+\.[\w$-]+(?:\.[\w$-]+)?)`?"
+    r"|`([\w-]+\.[\w$-]+\.[\w$-]+)`",
+    re.IGNORECASE,
+)
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?.! ")
+
+
+def question_literals(question: str) -> list[str]:
+    """The values a question is about, lowercased and sorted.
+
+    Two questions with the same literals can share an answer; questions that
+    differ in one (another region, year or date) cannot, however similar.
+    """
+    shape = normalize_question(question)
+    literals = set(DATE_LITERAL.findall(shape)) | set(NUMBER_LITERAL.findall(shape))
+    literals |= {a or b for a, b in _QUOTED_LITERAL.findall(question)}
+    literals |= {word for word in _VALUE_WORD.findall(question.strip()) if len(word) > 1}
+    return sorted({literal.lower().strip() for literal in literals})
+
+
+def _qualify(table: str) -> str | None:
+    parts = table.replace(":", ".").split(".")
+    if len(parts) == 2 and DEFAULT_BQ_PROJECT:
+        parts = [DEFAULT_BQ_PROJECT, *parts]
+    if len(parts) != 3 or parts[1].upper() == "INFORMATION_SCHEMA":
+        return None
+    return ".".join(parts)
+
+
+def tables_in_sql(sql: str) -> set[str]:
+    """Fully qualified tables referenced by a query (best effort)."""
+    tables = set()
+    for match in _TABLE_IN_SQL.finditer(sql or ""):
+        table = _qualify(match.group(1) or match.group(2))
+        if table:
+            tables.add(table)
+    return tables
+
+
+def tables_in_call(tool_name: str, args: dict[str, Any]) -> set[str] | None:
+    """Tables whose data a tool call reads.
+
+    Returns:
+        The tables (possibly empty for metadata tools), or None if the call's
+        sources cannot be determined.
+    """
+    if tool_name == "bigquery-execute-sql":
+        return tables_in_sql(args.get("sql", "")) or None
+    if tool_name in ("bigquery-forecast", "bigquery-analyze-contribution"):
+        source = args.get("history_data") or args.get("input_data") or ""
+        if re.match(r"^\s*(SELECT|WITH)\b", source, re.IGNORECASE):
+            return tables_in_sql(source) or None
+        table = _qualify(source.strip("` "))
+        return {table} if table else None
+    if tool_name == "bigquery-conversational-analytics":
+        references = args.get("table_references") or "[]"
+        try:
+            references = json.loads(references) if isinstance(references, str) else references
+            tables = {
+                f"{r['projectId']}.{r['datasetId']}.{r['tableId']}" for r in references
+            }
+        except (ValueError, KeyError, TypeError):
+            return None
+        return tables or None
+    return set()
+
+
+@dataclass
+class CachedAnswer:
+    """One stored answer."""
+
+    entry_id: int
+    tenant: str
+    question: str
+    literals: list[str]
+    answer: str
+    tables: list[str]
+    created_at: float
+    embedding: np.ndarray
+
+
+class AnswerCache:
+    """Question embeddings and answers, in memory and in SQLite."""
+
+    def __init__(self, db_name: str = "answer_cache"):
+        self._db_name = db_name
+        self._db = None
+        self._entries: list[CachedAnswer] = []
+        self._matrix: np.ndarray | None = None
+        self._lock = threading.Lock()
+        self._client: genai.Client | None = None
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(answers)")}
+            if columns and "tenant" not in columns:
+                # Entries from before tenant scoping cannot be attributed; they are only a cache.
+                self._db.execute("DROP TABLE answers")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, tenant TEXT, question TEXT, literals TEXT,"
+                " answer TEXT, tables TEXT, created_at REAL, embedding BLOB)"
+            )
+            cutoff = time.time() - ANSWER_CACHE_MAX_AGE_SECONDS
+            self._db.execute("DELETE FROM answers WHERE created_at < ?", (cutoff,))
+            for row in self._db.execute("SELECT * FROM answers ORDER BY id"):
+                self._entries.append(CachedAnswer(
+                    entry_id=row["id"],
+                    tenant=row["tenant"],
+                    question=row["question"],
+                    literals=json.loads(row["literals"]),
+                    answer=row["answer"],
+                    tables=json.loads(row["tables"]),
+                    created_at=row["created_at"],
+                    embedding=np.frombuffer(row["embedding"], dtype=np.float32),
+                ))
+            self._matrix = None
+        return self._db
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Unit-normalized embedding of `text`."""
+        if self._client is None:
+            self._client = genai.Client()
+        response = await self._client.aio.models.embed_content(
+            model=ANSWER_CACHE_EMBEDDING_MODEL,
+            contents=text,
+            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY"),
+        )
+        vector = np.asarray(response.embeddings[0].values, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def candidates(
+        self, embedding: np.ndarray, tenant: str, literals: list[str]
+    ) -> list[tuple[float, CachedAnswer]]:
+        """The tenant's entries with the same literals and similar enough to `embedding`, most similar first."""
+        with self._lock:
+            self._conn()
+            if not self._entries:
+                return []
+            if self._matrix is None:
+                self._matrix = np.vstack([e.embedding for e in self._entries])
+            scores = self._matrix @ embedding
+            entries = list(self._entries)
+        order = np.argsort(-scores)
+        return [
+            (float(scores[i]), entries[i])
+            for i in order
+            if scores[i] >= ANSWER_CACHE_MIN_SIMILARITY
+            and entries[i].tenant == tenant
+            and entries[i].literals == literals
+        ]
+
+    def add(self, tenant: str, question: str, answer: str, tables: set[str], embedding: np.ndarray) -> None:
+        literals = question_literals(question)
+        with self._lock:
+            conn = self._conn()
+            created_at = time.time()
+            cursor = conn.execute(
+                "INSERT INTO answers (tenant, question, literals, answer, tables, created_at, embedding)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tenant, question, json.dumps(literals), answer, json.dumps(sorted(tables)), created_at,
+                 embedding.tobytes()),
+            )
+            self._entries.append(CachedAnswer(
+                entry_id=cursor.lastrowid,
+                tenant=tenant,
+                question=question,
+                literals=literals,
+                answer=answer,
+                tables=sorted(tables),
+                created_at=created_at,
+                embedding=embedding,
+            ))
+            if len(self._entries) > ANSWER_CACHE_MAX_ENTRIES:
+                dropped = self._entries[: len(self._entries) - ANSWER_CACHE_MAX_ENTRIES]
+                self._entries = self._entries[len(dropped):]
+                conn.executemany("DELETE FROM answers WHERE id = ?", [(e.entry_id,) for e in dropped])
+            self._matrix = None
+
+    def remove(self, entry: CachedAnswer) -> None:
+        with self._lock:
+            self._entries = [e for e in self._entries if e.entry_id != entry.entry_id]
+            self._matrix = None
+            self._conn().execute("DELETE FROM answers WHERE id = ?", (entry.entry_id,))
+
+
+answer_cache = AnswerCache()
+
+# Question embeddings computed at lookup, reused when the answer is stored.
+_pending_embeddings: "OrderedDict[str, tuple[str, np.ndarray]]" = OrderedDict()
+
+
+def _remember_embedding(invocation_id: str, question: str, embedding: np.ndarray) -> None:
+    _pending_embeddings[invocation_id] = (question, embedding)
+    while len(_pending_embeddings) > _MAX_PENDING_EMBEDDINGS:
+        _pending_embeddings.popitem(last=False)
+
+
+def turn_embedding(invocation_id: str) -> np.ndarray | None:
+    """The question embedding computed for the turn's cache lookup, if any."""
+    pending = _pending_embeddings.get(invocation_id)
+    return pending[1] if pending else None
+
+
+async def _is_fresh(entry: CachedAnswer) -> bool:
+    """True if none of the entry's tables changed after it was cached."""
+    try:
+        modified = await asyncio.gather(
+            *(asyncio.to_thread(table_last_modified, table) for table in entry.tables)
+        )
+    except Exception as e:
+        logger.info("Answer cache: cannot validate %s: %s", entry.tables, e)
+        return False
+    return all(m <= entry.created_at for m in modified)
+
+
+def _format_age(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "less than a minute"
+    if minutes < 60:
+        return f"{minutes} min"
+    return f"{minutes // 60} h {minutes % 60} min"
+
+
+def is_follow_up(context: ReadonlyContext) -> bool:
+    """True if the session had user turns before the current one."""
+    return any(
+        event.author == "user" and event.invocation_id != context.invocation_id
+        for event in context.session.events
+    )
+
+
+def _question_text(callback_context: CallbackContext) -> str:
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text).strip()
+
+
+async def serve_cached_answer(callback_context: CallbackContext) -> types.Content | None:
+    """before_agent_callback (root agent): answer from the cache when valid."""
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    question = _question_text(callback_context)
+    if not question or is_follow_up(callback_context):
+        return None
+    callback_context.state[TURN_SOURCES_KEY] = {
+        "invocation_id": callback_context.invocation_id,
+        "tables": [],
+        "cacheable": True,
+    }
+    try:
+        embedding = await answer_cache.embed(question)
+    except Exception as e:
+        logger.warning("Answer cache: embedding failed: %s", e)
+        return None
+    _remember_embedding(callback_context.invocation_id, question, embedding)
+
+    tenant, _ = principal_for(callback_context)
+    today = datetime.date.today()
+    for similarity, entry in answer_cache.candidates(embedding, tenant, question_literals(question)):
+        age = time.time() - entry.created_at
+        if age > ANSWER_CACHE_MAX_AGE_SECONDS or datetime.date.fromtimestamp(entry.created_at) != today:
+            continue
+        if not await _is_fresh(entry):
+            answer_cache.remove(entry)
+            continue
+        _pending_embeddings.pop(callback_context.invocation_id, None)
+        callback_context.state[TURN_SOURCES_KEY] = {
+            "invocation_id": callback_context.invocation_id,
+            "cache_hit": {
+                "entry_id": entry.entry_id,
+                "similarity": round(similarity, 4),
+                "age_s": round(age),
+                "tables": entry.tables,
+            },
+        }
+        note = (
+            f"_Cached answer from {_format_age(age)} ago for a similar question; "
+            "the source tables have not changed since. "
+            "Ask me to refresh it if you need a new run._"
+        )
+        return types.Content(role="model", parts=[types.Part(text=f"{entry.answer}\n\n{note}")])
+    return None
+
+
+def track_answer_sources(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> None:
+    """after_tool_callback: record which tables the turn's answer is built on."""
+    sources = tool_context.state.get(TURN_SOURCES_KEY)
+    if not sources or sources.get("invocation_id") != tool_context.invocation_id:
+        return None
+    if not sources.get("cacheable"):
+        return None
+    sources = dict(sources)
+    tables = None
+    if tool.name in CACHEABLE_SOURCE_TOOLS and is_read_only_call(tool.name, args):
+        tables = tables_in_call(tool.name, args)
+    if tables is None or is_error_response(tool_response):
+        sources["cacheable"] = False
+    else:
+        sources["tables"] = sorted(set(sources["tables"]) | tables)
+    tool_context.state[TURN_SOURCES_KEY] = sources
+    return None
+
+
+def store_answer(callback_context: CallbackContext) -> None:
+    """after_agent_callback (root agent): cache the turn's answer if eligible."""
+    pending = _pending_embeddings.pop(callback_context.invocation_id, None)
+    sources = callback_context.state.get(TURN_SOURCES_KEY) or {}
+    if (
+        pending is None
+        or sources.get("invocation_id") != callback_context.invocation_id
+        or not sources.get("cacheable")
+        or not sources.get("tables")
+        or (callback_context.state.get(TURN_USAGE_KEY) or {}).get("exhausted")
+    ):
+        return None
+
+    answer = ""
+    transferred = False
+    for event in callback_context.session.events:
+        if event.invocation_id != callback_context.invocation_id:
+            continue
+        if event.author not in ("user", callback_context.agent_name):
+            transferred = True
+        if event.actions and event.actions.artifact_delta:
+            transferred = True
+        if event.author == callback_context.agent_name and event.is_final_response() and event.content:
+            answer = "".join(part.text or "" for part in event.content.parts or [] if not part.thought)
+    if transferred or not answer:
+        return None
+
+    question, embedding = pending
+    tenant, _ = principal_for(callback_context)
+    answer_cache.add(tenant, question, answer, set(sources["tables"]), embedding)
+    return None
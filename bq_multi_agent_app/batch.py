@@ -0,0 +1,308 @@
+"""
+Batch execution of questions through the root agent.
+
+Reads a JSONL file where each line is a question, optionally tagged with a
+session and user ID, runs the questions through `root_agent` with bounded
+concurrency, and streams one result line per question to an output JSONL file
+as soon as that question finishes.
+
+Input line format:
+    {"id": "q1", "question": "...", "session_id": "s1", "user_id": "u1"}
+
+Only "question" is required. Questions that share a session are executed in
+file order within that session so follow-ups see the earlier turns; questions
+in different sessions run concurrently.
+
+A failed or timed out attempt leaves its partial turn in the session, so a
+retry runs in a fork of the session as it was before the attempt (a new
+session ID with a copy of the earlier events), and later questions of that
+session continue in the fork. Attempts that called tools with possible side
+effects (writes, job submissions) are not retried.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from google.adk.events import Event
+from google.adk.runners import Runner
+
+from .runner import build_runner
+from .runner import ensure_session
+from .runner import user_message
+from .toolbox import is_read_only_call
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_USER_ID = "batch_user"
+
+# Tool responses can be full query results; keep only a prefix in the trace.
+MAX_TRACE_RESPONSE_CHARS = 2000
+
+# Python tools without side effects outside the session; a failed attempt that
+# only called these (and read-only toolbox calls) can be retried.
+RETRY_SAFE_TOOLS = {
+    "transfer_to_agent",
+    "find_relevant_tables",
+    "export_bq_data",
+    "transform_result",
+    "call_data_science_agent",
+    "load_artifacts",
+    "check_bq_models",
+    "rag_response",
+    "check_bqml_job",
+    "list_bqml_jobs",
+    "get_column_profile",
+    "export_pg_query",
+}
+
+
+@dataclass
+class BatchItem:
+    """A single question from the input file."""
+
+    line_number: int
+    question: str
+    item_id: str
+    user_id: str
+    session_id: str
+
+
+@dataclass
+class TurnTrace:
+    """Everything observed while running one question."""
+
+    answer: str = ""
+    tool_calls: list[dict[str, Any]] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    first_event_s: float | None = None
+
+
+def load_items(input_path: str) -> list[BatchItem]:
+    """Parse the input JSONL file into batch items.
+
+    Lines without a session_id get a fresh session of their own.
+    """
+    items = []
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not record.get("question"):
+                raise ValueError(f"Line {line_number}: missing 'question'")
+            items.append(
+                BatchItem(
+                    line_number=line_number,
+                    question=record["question"],
+                    item_id=str(record.get("id", line_number)),
+                    user_id=record.get("user_id") or DEFAULT_USER_ID,
+                    session_id=record.get("session_id") or f"batch-{uuid.uuid4().hex}",
+                )
+            )
+    return items
+
+
+def _truncate(value: Any, limit: int = MAX_TRACE_RESPONSE_CHARS) -> Any:
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= limit:
+        return value
+    return text[:limit] + f"... [{len(text) - limit} chars truncated]"
+
+
+def _record_event(event: Event, trace: TurnTrace, started: float, pending: dict):
+    """Fold a runner event into the trace for the current question."""
+    now = time.monotonic() - started
+    if trace.first_event_s is None:
+        trace.first_event_s = now
+
+    for call in event.get_function_calls():
+        entry = {
+            "agent": event.author,
+            "name": call.name,
+            "args": call.args,
+            "started_s": round(now, 3),
+        }
+        trace.tool_calls.append(entry)
+        pending[call.id] = entry
+
+    for response in event.get_function_responses():
+        entry = pending.pop(response.id, None)
+        if entry is None:
+            continue
+        entry["duration_s"] = round(now - entry["started_s"], 3)
+        entry["response"] = _truncate(response.response)
+
+    if event.usage_metadata:
+        trace.prompt_tokens += event.usage_metadata.prompt_token_count or 0
+        trace.completion_tokens += event.usage_metadata.candidates_token_count or 0
+
+    if event.is_final_response() and event.content and event.content.parts:
+        text = "".join(part.text or "" for part in event.content.parts)
+        if text:
+            trace.answer = text
+
+
+async def _run_question(runner: Runner, item: BatchItem, session_id: str, trace: TurnTrace) -> TurnTrace:
+    """Run the question in `session_id`, folding events into `trace` as they arrive."""
+    pending: dict[str, dict] = {}
+    started = time.monotonic()
+    async for event in runner.run_async(
+        user_id=item.user_id,
+        session_id=session_id,
+        new_message=user_message(item.question),
+    ):
+        _record_event(event, trace, started, pending)
+    return trace
+
+
+def _side_effect_tools(trace: TurnTrace) -> list[str]:
+    """Tools called by an attempt that may have changed something outside the session."""
+    return sorted({
+        call["name"]
+        for call in trace.tool_calls
+        if call["name"] not in RETRY_SAFE_TOOLS and not is_read_only_call(call["name"], call["args"] or {})
+    })
+
+
+async def _fork_session(runner: Runner, user_id: str, events: list[Event]) -> str:
+    """Create a new session holding copies of `events`; returns its ID.
+
+    Batch sessions get all of their state from events, so replaying them
+    rebuilds the state too.
+    """
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id=user_id, session_id=f"batch-{uuid.uuid4().hex}"
+    )
+    for event in events:
+        await runner.session_service.append_event(session, event.model_copy(deep=True))
+    return session.id
+
+
+async def _run_with_retry(
+    runner: Runner,
+    item: BatchItem,
+    timeout: float,
+    retries: int,
+) -> dict[str, Any]:
+    """Run one question with a per-attempt timeout and jittered backoff.
+
+    Retries run in a fork of the session as it was before the first attempt.
+    The result's "session_id" is the session the turn ended up in.
+    """
+    started = time.monotonic()
+    error = None
+    session_id = item.session_id
+    # Events before this question, the starting point of every retry.
+    history = list((await ensure_session(runner, item.user_id, session_id)).events)
+    for attempt in range(1, retries + 2):
+        if attempt > 1:
+            session_id = await _fork_session(runner, item.user_id, history)
+        trace = TurnTrace()
+        try:
+            await asyncio.wait_for(_run_question(runner, item, session_id, trace), timeout)
+            return {
+                "id": item.item_id,
+                "question": item.question,
+                "user_id": item.user_id,
+                "session_id": session_id,
+                "status": "ok",
+                "attempts": attempt,
+                "answer": trace.answer,
+                "tool_calls": trace.tool_calls,
+                "usage": {
+                    "prompt_tokens": trace.prompt_tokens,
+                    "completion_tokens": trace.completion_tokens,
+                },
+                "timings": {
+                    "first_event_s": trace.first_event_s,
+                    "total_s": round(time.monotonic() - started, 3),
+                },
+            }
+        except asyncio.TimeoutError:
+            error = f"Timed out after {timeout}s"
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        unsafe = _side_effect_tools(trace)
+        if unsafe:
+            error += f" (not retried: the attempt called {', '.join(unsafe)})"
+            break
+        if attempt <= retries:
+            await asyncio.sleep(min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+    return {
+        "id": item.item_id,
+        "question": item.question,
+        "user_id": item.user_id,
+        "session_id": session_id,
+        "status": "error",
+        "attempts": attempt,
+        "error": error,
+        "timings": {"total_s": round(time.monotonic() - started, 3)},
+    }
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = 8,
+    timeout: float = 300.0,
+    retries: int = 1,
+) -> dict[str, int]:
+    """Run every question in `input_path` and stream results to `output_path`.
+
+    Args:
+        input_path: JSONL file of questions.
+        output_path: JSONL file to write one result per question to.
+        concurrency: Maximum number of questions in flight at once.
+        timeout: Per-attempt timeout in seconds for a single question.
+        retries: Number of retries after the first failed attempt.
+
+    Returns:
+        Counts of succeeded and failed questions.
+    """
+    items = load_items(input_path)
+    runner = build_runner()
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    counts = {"ok": 0, "error": 0}
+
+    # Questions in the same session must run in order; different sessions
+    # are independent and only share the concurrency limit.
+    sessions: dict[tuple[str, str], list[BatchItem]] = {}
+    for item in items:
+        sessions.setdefault((item.user_id, item.session_id), []).append(item)
+
+    try:
+        with open(output_path, "w", encoding="utf-8") as out:
+
+            async def run_session(session_items: list[BatchItem]):
+                session_id = session_items[0].session_id
+                for item in session_items:
+                    # After a retry the conversation continues in the forked session.
+                    item.session_id = session_id
+                    async with semaphore:
+                        result = await _run_with_retry(runner, item, timeout, retries)
+                    session_id = result["session_id"]
+                    async with write_lock:
+                        out.write(json.dumps(result, default=str) + "\n")
+                        out.flush()
+                        counts[result["status"]] += 1
+                        logger.info(
+                            "[%d/%d] %s: %s",
+                            counts["ok"] + counts["error"], len(items), item.item_id, result["status"],
+                        )
+
+            await asyncio.gather(*(run_session(s) for s in sessions.values()))
+    finally:
+        # Closes the toolbox MCP sessions even if the batch fails.
+        await runner.close()
+    return counts
@@ -0,0 +1,263 @@
+"""
+Per-turn token and latency budget accounting across agents.
+
+A turn is one user question. It starts in whichever agent receives the
+message and then spans sub-agent transfers (same invocation) and the DS agent
+run through AgentTool (a child session that inherits the parent's state,
+including the turn ID stored here). Model and tool callbacks attribute prompt
+tokens, completion tokens and latency to the agent hop that incurred them.
+
+When a turn passes its soft budget (BUDGET_DEGRADE_AT of either ceiling) the
+remaining work is degraded:
+- model calls switch to BUDGET_FALLBACK_MODEL
+- the DS agent is asked to skip visualizations
+- bulk extracts are capped at BUDGET_SAMPLE_ROWS rows
+Past the hard ceiling, model calls are answered with a budget message so the
+turn ends.
+
+Totals are written to session state under "turn_usage" and exported as
+OpenTelemetry metrics and span attributes.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest
+from google.adk.models import LlmResponse
+from google.adk.tools import BaseTool
+from google.adk.tools import ToolContext
+from google.genai import types
+from opentelemetry import metrics
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the corresponding ceiling.
+TURN_TOKEN_BUDGET = int(os.getenv("TURN_TOKEN_BUDGET", "400000"))
+TURN_LATENCY_BUDGET_SECONDS = float(os.getenv("TURN_LATENCY_BUDGET_SECONDS", "300"))
+BUDGET_DEGRADE_AT = float(os.getenv("BUDGET_DEGRADE_AT", "0.7"))
+BUDGET_FALLBACK_MODEL = os.getenv("BUDGET_FALLBACK_MODEL", "gemini-2.5-flash")
+BUDGET_SAMPLE_ROWS = int(os.getenv("BUDGET_SAMPLE_ROWS", "100000"))
+
+# Session state keys.
+TURN_ID_KEY = "budget:turn_id"
+TURN_USAGE_KEY = "turn_usage"
+
+# Tools whose row limit is capped in degraded mode, by argument name.
+_SAMPLED_TOOLS = {"export_bq_data": "max_rows", "export_pg_query": "max_rows"}
+_MAX_TRACKED_TURNS = 1000
+
+_meter = metrics.get_meter(__name__)
+_token_counter = _meter.create_counter(
+    "agent.turn.tokens", unit="{token}", description="Tokens used, by agent and kind"
+)
+_latency_histogram = _meter.create_histogram(
+    "agent.hop.duration", unit="s", description="Model and tool call latency, by agent"
+)
+_degraded_counter = _meter.create_counter(
+    "agent.turn.degraded", description="Turns that entered a degraded mode"
+)
+
+
+@dataclass
+class HopUsage:
+    """Usage attributed to one agent within a turn."""
+
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    model_calls: int = 0
+    model_seconds: float = 0.0
+    tool_calls: int = 0
+    tool_seconds: float = 0.0
+
+
+@dataclass
+class TurnBudget:
+    """Running totals and degraded state of one turn."""
+
+    turn_id: str
+    started_at: float = field(default_factory=time.monotonic)
+    hops: dict[str, HopUsage] = field(default_factory=dict)
+    degraded: bool = False
+    exhausted: bool = False
+    pending: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def tokens(self) -> int:
+        return sum(h.prompt_tokens + h.completion_tokens for h in self.hops.values())
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def hop(self, agent_name: str) -> HopUsage:
+        return self.hops.setdefault(agent_name, HopUsage())
+
+    def used_fraction(self) -> float:
+        """Largest fraction used of any configured ceiling."""
+        fractions = [0.0]
+        if TURN_TOKEN_BUDGET:
+            fractions.append(self.tokens / TURN_TOKEN_BUDGET)
+        if TURN_LATENCY_BUDGET_SECONDS:
+            fractions.append(self.elapsed / TURN_LATENCY_BUDGET_SECONDS)
+        return max(fractions)
+
+    def check(self) -> None:
+        """Update the degraded/exhausted flags from current usage."""
+        used = self.used_fraction()
+        if used >= BUDGET_DEGRADE_AT and not self.degraded:
+            self.degraded = True
+            _degraded_counter.add(1)
+            logger.info("Turn %s degraded at %.0f%% of budget", self.turn_id, used * 100)
+        if used >= 1.0:
+            self.exhausted = True
+
+    def to_dict(self) -> dict:
+        return {
+            "turn_id": self.turn_id,
+            "tokens": self.tokens,
+            "elapsed_s": round(self.elapsed, 2),
+            "degraded": self.degraded,
+            "exhausted": self.exhausted,
+            "hops": {
+                name: {
+                    "prompt_tokens": h.prompt_tokens,
+                    "completion_tokens": h.completion_tokens,
+                    "model_calls": h.model_calls,
+                    "model_s": round(h.model_seconds, 2),
+                    "tool_calls": h.tool_calls,
+                    "tool_s": round(h.tool_seconds, 2),
+                }
+                for name, h in self.hops.items()
+            },
+        }
+
+
+# Recent turns by turn ID; AgentTool child sessions find theirs via state.
+_turns: "OrderedDict[str, TurnBudget]" = OrderedDict()
+
+
+def _current_turn(context: CallbackContext) -> TurnBudget | None:
+    turn_id = context.state.get(TURN_ID_KEY)
+    return _turns.get(turn_id) if turn_id else None
+
+
+def _publish(context: CallbackContext, turn: TurnBudget) -> None:
+    summary = turn.to_dict()
+    context.state[TURN_USAGE_KEY] = summary
+    span = trace.get_current_span()
+    span.set_attribute("turn.id", turn.turn_id)
+    span.set_attribute("turn.tokens", summary["tokens"])
+    span.set_attribute("turn.elapsed_s", summary["elapsed_s"])
+    span.set_attribute("turn.degraded", turn.degraded)
+
+
+def start_turn(callback_context: CallbackContext) -> None:
+    """before_agent_callback: open a budget for a new user turn.
+
+    Registered on every agent that can receive a user message directly (the
+    root agent and its transfer targets). Transfers within a turn share the
+    invocation ID, so only the first agent of the turn opens a budget.
+    """
+    turn_id = callback_context.invocation_id
+    if callback_context.state.get(TURN_ID_KEY) == turn_id and turn_id in _turns:
+        return None
+    _turns[turn_id] = TurnBudget(turn_id=turn_id)
+    while len(_turns) > _MAX_TRACKED_TURNS:
+        _turns.popitem(last=False)
+    callback_context.state[TURN_ID_KEY] = turn_id
+    return None
+
+
+def budget_model_call(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+    """before_model_callback: enforce the ceiling and degrade the model."""
+    turn = _current_turn(callback_context)
+    if turn is None:
+        return None
+    turn.check()
+    if turn.exhausted:
+        _publish(callback_context, turn)
+        return LlmResponse(
+            content=types.Content(
+                role="model",
+                parts=[types.Part(text=(
+                    "This question reached its processing budget "
+                    f"({turn.tokens} tokens, {turn.elapsed:.0f}s), so I stopped here. "
+                    "Please narrow the question or ask for the next step separately."
+                ))],
+            )
+        )
+    if turn.degraded and BUDGET_FALLBACK_MODEL:
+        llm_request.model = BUDGET_FALLBACK_MODEL
+    turn.pending[f"model:{callback_context.agent_name}"] = time.monotonic()
+    return None
+
+
+def record_model_usage(callback_context: CallbackContext, llm_response: LlmResponse) -> None:
+    """after_model_callback: attribute tokens and latency to the agent."""
+    turn = _current_turn(callback_context)
+    if turn is None or llm_response.partial:
+        return None
+    agent = callback_context.agent_name
+    hop = turn.hop(agent)
+    started = turn.pending.pop(f"model:{agent}", None)
+    if started is not None:
+        elapsed = time.monotonic() - started
+        hop.model_seconds += elapsed
+        _latency_histogram.record(elapsed, {"agent": agent, "kind": "model"})
+    hop.model_calls += 1
+    usage = llm_response.usage_metadata
+    if usage:
+        prompt = usage.prompt_token_count or 0
+        completion = (usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0)
+        hop.prompt_tokens += prompt
+        hop.completion_tokens += completion
+        _token_counter.add(prompt, {"agent": agent, "kind": "prompt"})
+        _token_counter.add(completion, {"agent": agent, "kind": "completion"})
+    turn.check()
+    _publish(callback_context, turn)
+    return None
+
+
+def budget_tool_call(tool: BaseTool, args: dict, tool_context: ToolContext) -> None:
+    """before_tool_callback: start the tool timer and apply degraded modes."""
+    turn = _current_turn(tool_context)
+    if turn is None:
+        return None
+    turn.pending[f"tool:{tool_context.function_call_id}"] = time.monotonic()
+    turn.check()
+    if not turn.degraded:
+        return None
+    # Tool args are passed on by reference, so these edits reach the tool.
+    limit_arg = _SAMPLED_TOOLS.get(tool.name)
+    if limit_arg and BUDGET_SAMPLE_ROWS:
+        requested = args.get(limit_arg) or 0
+        args[limit_arg] = min(requested, BUDGET_SAMPLE_ROWS) if requested > 0 else BUDGET_SAMPLE_ROWS
+    if tool.name == "call_data_science_agent" and "question" in args:
+        args["question"] = (
+            f"{args['question']}\n\n(Budget limit nearly reached: skip visualizations "
+            "and keep the analysis brief.)"
+        )
+    return None
+
+
+def record_tool_latency(tool: BaseTool, args: dict, tool_context: ToolContext, tool_response) -> None:
+    """after_tool_callback: attribute tool latency to the calling agent."""
+    turn = _current_turn(tool_context)
+    if turn is None:
+        return None
+    started = turn.pending.pop(f"tool:{tool_context.function_call_id}", None)
+    hop = turn.hop(tool_context.agent_name)
+    hop.tool_calls += 1
+    if started is not None:
+        elapsed = time.monotonic() - started
+        hop.tool_seconds += elapsed
+        _latency_histogram.record(elapsed, {"agent": tool_context.agent_name, "kind": "tool", "tool": tool.name})
+    turn.check()
+    _publish(tool_context, turn)
+    return None
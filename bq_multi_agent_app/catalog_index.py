@@ -0,0 +1,625 @@
+"""
+Local full-text index over the BigQuery and Postgres catalogs.
+
+Finding the tables behind a user's concept ("churn", "order revenue") would
+otherwise take several remote calls per question (`bigquery-search-catalog`,
+then list tables and table info per dataset). `find_relevant_tables` answers
+it in-process from an inverted index with BM25 ranking over every table's
+name, description and column names and descriptions (names weigh more than
+descriptions). With CATALOG_HYBRID set, tables are also ranked by embedding
+similarity and both rankings are merged with reciprocal rank fusion.
+
+The index is built from a metadata crawl:
+- BigQuery: for each dataset of CATALOG_BQ_PROJECTS, one `__TABLES__` query
+  lists the tables and their modification times; only new or modified tables
+  are re-read from INFORMATION_SCHEMA (table options and column field paths).
+- Postgres: one catalog query (`postgres-get-catalog`) returns every table,
+  view and column with its comment; only tables whose definition changed are
+  re-indexed (and re-embedded).
+The server re-crawls every CATALOG_CRAWL_INTERVAL_SECONDS (0 crawls only an
+empty index); a search on an index older than that starts a background crawl.
+`python main.py catalog` crawls on demand.
+
+Entries are kept in memory and persisted to SQLite (see `local_store.py`), so
+a restarted worker can search before its first crawl.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+from dataclasses import dataclass
+from dataclasses import field
+
+import numpy as np
+from google import genai
+from google.adk.tools import ToolContext
+from google.cloud import bigquery
+from google.genai import types
+
+from .admission import admitted
+from .bq_storage import BIGQUERY_PROJECT
+from .bq_storage import BQ_QUERY_TIMEOUT_SECONDS
+from .bq_storage import get_clients
+from .local_store import open_db
+from .metadata_cache import is_error_response
+from .sub_agents.pg_agents.tools import pg_stats_toolset
+from .tool_output import shape_output
+from .toolbox import call_toolbox_tool
+from .toolbox import response_rows
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_ENABLED = os.getenv("CATALOG_INDEX_ENABLED", "true").lower() == "true"
+CATALOG_CRAWL_INTERVAL_SECONDS = float(os.getenv("CATALOG_CRAWL_INTERVAL_SECONDS", "900"))
+CATALOG_BQ_PROJECTS = [
+    p.strip() for p in os.getenv("CATALOG_BQ_PROJECTS", BIGQUERY_PROJECT or "").split(",") if p.strip()
+]
+# Datasets to index (dataset IDs); all datasets of the projects if empty.
+CATALOG_BQ_DATASETS = {d.strip() for d in os.getenv("CATALOG_BQ_DATASETS", "").split(",") if d.strip()}
+CATALOG_PG_ENABLED = os.getenv("CATALOG_PG_ENABLED", "true").lower() == "true"
+CATALOG_MAX_COLUMNS = int(os.getenv("CATALOG_MAX_COLUMNS", "500"))
+CATALOG_TOP_K = int(os.getenv("CATALOG_TOP_K", "10"))
+CATALOG_MATCHED_COLUMNS = int(os.getenv("CATALOG_MATCHED_COLUMNS", "5"))
+CATALOG_HYBRID = os.getenv("CATALOG_HYBRID", "false").lower() == "true"
+CATALOG_EMBEDDING_MODEL = os.getenv("CATALOG_EMBEDDING_MODEL", "text-embedding-005")
+CATALOG_EMBEDDING_BATCH = int(os.getenv("CATALOG_EMBEDDING_BATCH", "50"))
+
+CATALOG_TOOL = "postgres-get-catalog"
+BIGQUERY = "bigquery"
+POSTGRES = "postgres"
+
+# BM25 parameters and per-field term weights.
+_K1 = 1.2
+_B = 0.75
+_NAME_WEIGHT = 3.0
+_COLUMN_NAME_WEIGHT = 2.0
+_CONTAINER_WEIGHT = 1.0
+_DESCRIPTION_WEIGHT = 1.0
+# Reciprocal rank fusion constant for hybrid search.
+_RRF_K = 60
+
+_TOKEN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "by", "for", "from", "in", "is", "it", "me",
+    "of", "on", "or", "show", "the", "to", "what", "which", "with",
+}
+
+
+def _stem(word: str) -> str:
+    """Light plural stemming, so "orders" matches "order"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased, stemmed terms of `text`; splits snake_case and camelCase."""
+    terms = []
+    for word in _TOKEN.findall(text or ""):
+        word = word.lower()
+        if word not in _STOPWORDS:
+            terms.append(_stem(word))
+    return terms
+
+
+@dataclass
+class CatalogTable:
+    """One indexed table or view and its columns."""
+
+    source: str
+    table_id: str
+    table_type: str
+    description: str
+    columns: list[dict] = field(default_factory=list)
+    # Modification time (BigQuery) or definition hash (Postgres) it was read at.
+    version: str = ""
+    embedding: np.ndarray | None = None
+
+    @property
+    def key(self) -> str:
+        return f"{self.source}:{self.table_id}"
+
+    def definition_hash(self) -> str:
+        payload = json.dumps([self.table_type, self.description, self.columns], sort_keys=True)
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def terms(self) -> Counter:
+        """Weighted term frequencies of the table's fields."""
+        container, _, name = self.table_id.rpartition(".")
+        terms: Counter = Counter()
+        for weight, text in (
+            (_NAME_WEIGHT, name),
+            (_CONTAINER_WEIGHT, container.rpartition(".")[2]),
+            (_DESCRIPTION_WEIGHT, self.description),
+        ):
+            for term in tokenize(text):
+                terms[term] += weight
+        for column in self.columns:
+            for term in tokenize(column["name"]):
+                terms[term] += _COLUMN_NAME_WEIGHT
+            for term in tokenize(column.get("description") or ""):
+                terms[term] += _DESCRIPTION_WEIGHT
+        return terms
+
+    def document(self) -> str:
+        """Plain-text rendering of the table, for embeddings."""
+        columns = ", ".join(
+            f"{c['name']} ({c['description']})" if c.get("description") else c["name"]
+            for c in self.columns
+        )
+        return f"{self.table_id} {self.table_type.lower()}: {self.description}\nColumns: {columns}"[:4000]
+
+    def matched_columns(self, query_terms: set[str]) -> list[dict]:
+        scored = []
+        for column in self.columns:
+            name_terms = set(tokenize(column["name"]))
+            description_terms = set(tokenize(column.get("description") or ""))
+            score = 2 * len(name_terms & query_terms) + len(description_terms & query_terms)
+            if score:
+                scored.append((score, column))
+        scored.sort(key=lambda item: -item[0])
+        return [column for _, column in scored[:CATALOG_MATCHED_COLUMNS]]
+
+
+class Bm25Index:
+    """Inverted index with BM25 scoring and incremental updates."""
+
+    def __init__(self):
+        self._postings: dict[str, dict[str, float]] = defaultdict(dict)
+        self._terms: dict[str, Counter] = {}
+        self._lengths: dict[str, float] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def remove(self, key: str) -> None:
+        terms = self._terms.pop(key, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(key)
+
+    def add(self, key: str, terms: Counter) -> None:
+        self.remove(key)
+        self._terms[key] = terms
+        for term, frequency in terms.items():
+            self._postings[term][key] = frequency
+        self._lengths[key] = sum(terms.values())
+        self._total_length += self._lengths[key]
+
+    def search(self, terms: list[str], accept=None) -> list[tuple[str, float]]:
+        """Keys matching any of `terms` with their BM25 scores, best first."""
+        if not self._terms:
+            return []
+        count = len(self._terms)
+        average_length = self._total_length / count or 1.0
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                norm = _K1 * (1 - _B + _B * self._lengths[key] / average_length)
+                scores[key] += idf * frequency * (_K1 + 1) / (frequency + norm)
+        ranked = [(key, score) for key, score in scores.items() if accept is None or accept(key)]
+        ranked.sort(key=lambda item: -item[1])
+        return ranked
+
+
+def _sql_string(value: str | None) -> str:
+    """Decode a GoogleSQL string literal as stored in TABLE_OPTIONS.option_value."""
+    if not value:
+        return ""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        value = value[1:-1]
+    return re.sub(r"\\(.)", r"\1", value)
+
+
+def _read_bigquery_tables(
+    client: bigquery.Client, dataset: str, names: list[str], versions: dict[str, str]
+) -> list[CatalogTable]:
+    sql = f"""
+        SELECT t.table_name, t.table_type, o.option_value AS table_description,
+               c.field_path AS column_name, c.data_type, c.description AS column_description
+        FROM `{dataset}`.INFORMATION_SCHEMA.TABLES t
+        LEFT JOIN `{dataset}`.INFORMATION_SCHEMA.TABLE_OPTIONS o
+          ON o.table_name = t.table_name AND o.option_name = 'description'
+        LEFT JOIN `{dataset}`.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS c
+          ON c.table_name = t.table_name
+        WHERE t.table_name IN UNNEST(@tables)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[bigquery.ArrayQueryParameter("tables", "STRING", names)],
+        labels={"source": "catalog_index"},
+    )
+    tables: dict[str, CatalogTable] = {}
+    for row in client.query(sql, job_config=job_config).result(timeout=BQ_QUERY_TIMEOUT_SECONDS):
+        table_id = f"{dataset}.{row['table_name']}"
+        table = tables.setdefault(table_id, CatalogTable(
+            source=BIGQUERY,
+            table_id=table_id,
+            table_type=row["table_type"] or "TABLE",
+            description=_sql_string(row["table_description"]),
+            version=versions[table_id],
+        ))
+        if row["column_name"] and len(table.columns) < CATALOG_MAX_COLUMNS:
+            table.columns.append({
+                "name": row["column_name"],
+                "type": row["data_type"],
+                "description": row["column_description"] or "",
+            })
+    return list(tables.values())
+
+
+def _crawl_bigquery(known: dict[str, str]) -> tuple[list[CatalogTable], set[str]]:
+    """Read new and modified BigQuery tables.
+
+    Blocking; run it in a worker thread from async code.
+
+    Args:
+        known: Version of every indexed BigQuery table, by table ID.
+
+    Returns:
+        The tables to (re)index, and the IDs of all tables that still exist.
+    """
+    client, _ = get_clients()
+    updated, present = [], set()
+    for project in CATALOG_BQ_PROJECTS:
+        for item in client.list_datasets(project):
+            if CATALOG_BQ_DATASETS and item.dataset_id not in CATALOG_BQ_DATASETS:
+                continue
+            dataset = f"{project}.{item.dataset_id}"
+            try:
+                rows = client.query(
+                    f"SELECT table_id, last_modified_time FROM `{dataset}.__TABLES__`"
+                ).result(timeout=BQ_QUERY_TIMEOUT_SECONDS)
+                versions = {f"{dataset}.{row['table_id']}": str(row["last_modified_time"]) for row in rows}
+                changed = [table_id for table_id, version in versions.items() if known.get(table_id) != version]
+                if changed:
+                    updated += _read_bigquery_tables(
+                        client, dataset, [t.rpartition(".")[2] for t in changed], versions
+                    )
+                present |= versions.keys()
+            except Exception as e:
+                # Keep what is indexed for the dataset until it can be read again.
+                logger.warning("Catalog crawl of dataset %s failed: %s", dataset, e)
+                present |= {table_id for table_id in known if table_id.startswith(f"{dataset}.")}
+    return updated, present
+
+
+def _postgres_tables(rows: list[dict]) -> list[CatalogTable]:
+    tables: dict[str, CatalogTable] = {}
+    for row in rows:
+        table_id = f"{row['schema_name']}.{row['table_name']}"
+        table = tables.setdefault(table_id, CatalogTable(
+            source=POSTGRES,
+            table_id=table_id,
+            table_type=row.get("table_type") or "TABLE",
+            description=row.get("table_description") or "",
+        ))
+        if row.get("column_name") and len(table.columns) < CATALOG_MAX_COLUMNS:
+            table.columns.append({
+                "name": row["column_name"],
+                "type": row.get("data_type"),
+                "description": row.get("column_description") or "",
+            })
+    for table in tables.values():
+        table.version = table.definition_hash()
+    return list(tables.values())
+
+
+class CatalogIndex:
+    """Catalog entries with a BM25 index, in memory and in SQLite."""
+
+    def __init__(self, db_name: str = "catalog_index"):
+        self._db_name = db_name
+        self._db = None
+        self._tables: dict[str, CatalogTable] = {}
+        self._bm25 = Bm25Index()
+        self._matrix: tuple[list[str], np.ndarray] | None = None
+        self._lock = threading.Lock()
+        self._client: genai.Client | None = None
+        self._crawl: asyncio.Task | None = None
+        self.crawled_at = 0.0
+        self.last_crawl: dict = {}
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tables ("
+                " key TEXT PRIMARY KEY, entry TEXT, embedding BLOB)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS crawls (crawled_at REAL)")
+            for row in self._db.execute("SELECT * FROM tables"):
+                table = CatalogTable(**json.loads(row["entry"]))
+                if row["embedding"] is not None:
+                    table.embedding = np.frombuffer(row["embedding"], dtype=np.float32)
+                self._tables[table.key] = table
+                self._bm25.add(table.key, table.terms())
+            row = self._db.execute("SELECT MAX(crawled_at) AS crawled_at FROM crawls").fetchone()
+            self.crawled_at = row["crawled_at"] or 0.0
+        return self._db
+
+    def load(self) -> int:
+        """Load the persisted index; returns the number of tables."""
+        with self._lock:
+            self._conn()
+            return len(self._tables)
+
+    def _apply(self, source: str, updated: list[CatalogTable], present: set[str]) -> dict[str, int]:
+        """Replace changed entries of `source` and drop tables that no longer exist."""
+        with self._lock:
+            conn = self._conn()
+            removed = [
+                key for key, table in self._tables.items()
+                if table.source == source and table.table_id not in present
+            ]
+            conn.execute("BEGIN")
+            for key in removed:
+                del self._tables[key]
+                self._bm25.remove(key)
+            conn.executemany("DELETE FROM tables WHERE key = ?", [(key,) for key in removed])
+            for table in updated:
+                previous = self._tables.get(table.key)
+                if previous is not None and previous.definition_hash() == table.definition_hash():
+                    table.embedding = previous.embedding
+                self._tables[table.key] = table
+                self._bm25.add(table.key, table.terms())
+            self._save(conn, updated)
+            conn.execute("COMMIT")
+            self._matrix = None
+        return {"updated": len(updated), "removed": len(removed)}
+
+    @staticmethod
+    def _save(conn, tables: list[CatalogTable]) -> None:
+        conn.executemany(
+            "INSERT OR REPLACE INTO tables VALUES (?, ?, ?)",
+            [
+                (
+                    table.key,
+                    json.dumps({
+                        "source": table.source,
+                        "table_id": table.table_id,
+                        "table_type": table.table_type,
+                        "description": table.description,
+                        "columns": table.columns,
+                        "version": table.version,
+                    }),
+                    table.embedding.tobytes() if table.embedding is not None else None,
+                )
+                for table in tables
+            ],
+        )
+
+    def _known(self, source: str) -> dict[str, str]:
+        with self._lock:
+            self._conn()
+            return {t.table_id: t.version for t in self._tables.values() if t.source == source}
+
+    async def _embed(self, texts: list[str], task_type: str) -> list[np.ndarray]:
+        """Unit-normalized embeddings of `texts`."""
+        if self._client is None:
+            self._client = genai.Client()
+        vectors = []
+        for start in range(0, len(texts), CATALOG_EMBEDDING_BATCH):
+            response = await self._client.aio.models.embed_content(
+                model=CATALOG_EMBEDDING_MODEL,
+                contents=texts[start:start + CATALOG_EMBEDDING_BATCH],
+                config=types.EmbedContentConfig(task_type=task_type),
+            )
+            for embedding in response.embeddings:
+                vector = np.asarray(embedding.values, dtype=np.float32)
+                vectors.append(vector / (np.linalg.norm(vector) or 1.0))
+        return vectors
+
+    async def _embed_missing(self) -> int:
+        with self._lock:
+            missing = [t for t in self._tables.values() if t.embedding is None]
+        if not missing:
+            return 0
+        vectors = await self._embed([t.document() for t in missing], "RETRIEVAL_DOCUMENT")
+        with self._lock:
+            for table, vector in zip(missing, vectors):
+                table.embedding = vector
+            conn = self._conn()
+            conn.execute("BEGIN")
+            self._save(conn, [t for t in missing if self._tables.get(t.key) is t])
+            conn.execute("COMMIT")
+            self._matrix = None
+        return len(missing)
+
+    async def _crawl_postgres(self) -> tuple[list[CatalogTable], set[str]]:
+        # The toolbox tools need no auth or confirmation, so no ToolContext is required.
+        response = await call_toolbox_tool(pg_stats_toolset, CATALOG_TOOL, {"schema_name": ""}, None)
+        if is_error_response(response):
+            raise RuntimeError(f"{CATALOG_TOOL} failed: {response}")
+        tables = _postgres_tables(response_rows(response))
+        known = self._known(POSTGRES)
+        return [t for t in tables if known.get(t.table_id) != t.version], {t.table_id for t in tables}
+
+    async def crawl(self) -> dict:
+        """Re-read the catalogs and update the index with what changed.
+
+        A source that cannot be read keeps its current entries.
+
+        Returns:
+            Per source, the number of updated and removed tables (or the error).
+        """
+        started = time.monotonic()
+        results = {}
+        if CATALOG_BQ_PROJECTS:
+            try:
+                async with admitted("bigquery"):
+                    updated, present = await asyncio.to_thread(_crawl_bigquery, self._known(BIGQUERY))
+                results[BIGQUERY] = self._apply(BIGQUERY, updated, present)
+            except Exception as e:
+                logger.warning("Catalog crawl of BigQuery failed: %s", e)
+                results[BIGQUERY] = {"error": str(e)}
+        if CATALOG_PG_ENABLED:
+            try:
+                updated, present = await self._crawl_postgres()
+                results[POSTGRES] = self._apply(POSTGRES, updated, present)
+            except Exception as e:
+                logger.warning("Catalog crawl of Postgres failed: %s", e)
+                results[POSTGRES] = {"error": str(e)}
+        if CATALOG_HYBRID:
+            try:
+                results["embedded"] = await self._embed_missing()
+            except Exception as e:
+                logger.warning("Catalog embeddings failed: %s", e)
+        self.crawled_at = time.time()
+        with self._lock:
+            self._conn().execute("INSERT INTO crawls VALUES (?)", (self.crawled_at,))
+        self.last_crawl = {**results, "duration_s": round(time.monotonic() - started, 2)}
+        logger.info("Catalog crawl: %s", self.last_crawl)
+        return self.last_crawl
+
+    def ensure_fresh(self) -> asyncio.Task | None:
+        """Start a background crawl if the index is older than the crawl interval."""
+        if self._crawl is not None and not self._crawl.done():
+            return self._crawl
+        if self.crawled_at and (
+            CATALOG_CRAWL_INTERVAL_SECONDS <= 0 or time.time() - self.crawled_at < CATALOG_CRAWL_INTERVAL_SECONDS
+        ):
+            return None
+        self._crawl = asyncio.create_task(self.crawl())
+        return self._crawl
+
+    def _semantic_ranking(self, query_vector: np.ndarray, accept) -> list[str]:
+        with self._lock:
+            if self._matrix is None:
+                embedded = [t for t in self._tables.values() if t.embedding is not None]
+                if not embedded:
+                    return []
+                self._matrix = ([t.key for t in embedded], np.vstack([t.embedding for t in embedded]))
+            keys, matrix = self._matrix
+        scores = matrix @ query_vector
+        return [keys[i] for i in np.argsort(-scores) if accept(keys[i])]
+
+    async def search(self, query: str, source: str = "", limit: int = CATALOG_TOP_K) -> list[dict]:
+        """Tables most relevant to `query`, best first."""
+        query_terms = tokenize(query)
+
+        def accept(key: str) -> bool:
+            return not source or key.startswith(f"{source}:")
+
+        with self._lock:
+            self._conn()
+            ranked = self._bm25.search(query_terms, accept)
+        if CATALOG_HYBRID:
+            try:
+                query_vector = (await self._embed([query], "RETRIEVAL_QUERY"))[0]
+                semantic = self._semantic_ranking(query_vector, accept)
+            except Exception as e:
+                logger.warning("Catalog query embedding failed, using keywords only: %s", e)
+                semantic = []
+            if semantic:
+                fused: dict[str, float] = defaultdict(float)
+                for rank, (key, _) in enumerate(ranked):
+                    fused[key] += 1 / (_RRF_K + rank + 1)
+                for rank, key in enumerate(semantic):
+                    fused[key] += 1 / (_RRF_K + rank + 1)
+                ranked = sorted(fused.items(), key=lambda item: -item[1])
+
+        results = []
+        query_set = set(query_terms)
+        for key, score in ranked[:limit]:
+            table = self._tables.get(key)
+            if table is None:
+                continue
+            results.append({
+                "table": table.table_id,
+                "source": table.source,
+                "type": table.table_type,
+                "score": round(score, 4),
+                "description": table.description[:300],
+                "columns": len(table.columns),
+                "matched_columns": table.matched_columns(query_set),
+            })
+        return results
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            counts = Counter(t.source for t in self._tables.values())
+        return {
+            "tables": dict(counts),
+            "crawled_at": self.crawled_at or None,
+            "last_crawl": self.last_crawl,
+        }
+
+
+catalog_index = CatalogIndex()
+
+
+async def run_crawl_loop(interval: float = CATALOG_CRAWL_INTERVAL_SECONDS) -> None:
+    """Keep the catalog index up to date, every `interval` seconds, until cancelled."""
+    while True:
+        try:
+            await catalog_index.crawl()
+        except Exception as e:
+            logger.warning("Catalog crawl failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def find_relevant_tables(
+    query: str,
+    tool_context: ToolContext,
+    source: str = "",
+    max_results: int = 0,
+) -> dict:
+    """
+    Find the BigQuery and Postgres tables most relevant to a concept, from a local catalog index.
+
+    Searches the names and descriptions of every indexed table and its columns
+    in milliseconds. Use it before the list/get-info discovery tools to find
+    candidate tables, then inspect only the top matches.
+
+    Args:
+        query: The concept or question to find tables for, e.g. "customer churn" or "order revenue by region".
+        tool_context: Context of the calling agent.
+        source: "bigquery" or "postgres" to search one system only; both if empty.
+        max_results: Maximum number of tables; 0 uses the configured default.
+
+    Returns:
+        The best matching tables (fully qualified IDs, source, type, description
+        and the columns that matched the query), best first.
+    """
+    if not CATALOG_INDEX_ENABLED:
+        return {"status": "error", "error": "The catalog index is disabled; use the discovery tools."}
+    if source and source not in (BIGQUERY, POSTGRES):
+        return {"status": "error", "error": 'source must be "bigquery", "postgres" or empty.'}
+    indexed = await asyncio.to_thread(catalog_index.load)
+    crawl = catalog_index.ensure_fresh()
+    if not indexed:
+        if crawl is not None:
+            # First use of an empty index: wait briefly for the initial crawl.
+            await asyncio.wait({crawl}, timeout=30)
+        if not catalog_index.load():
+            return {
+                "status": "error",
+                "error": "The catalog index is still being built; use the discovery tools for now.",
+            }
+    tables = await catalog_index.search(query, source, max_results if max_results > 0 else CATALOG_TOP_K)
+    result = {"status": "success", "tables": tables}
+    if not tables:
+        result["note"] = "No indexed table matches; use the discovery tools or rephrase the concept."
+    if catalog_index.crawled_at:
+        result["index_age_s"] = round(time.time() - catalog_index.crawled_at)
+    return shape_output("find_relevant_tables", result)
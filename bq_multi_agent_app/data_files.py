@@ -0,0 +1,294 @@
+"""
+Data file staging for the DS agent's code executor.
+
+Instead of pasting query results into the DS agent request (and from there
+into generated code as Python literals), tabular data is converted to a
+compressed, typed Arrow file (Parquet or Feather) and registered as an input
+file of the code executor. Generated code then loads it by file name.
+
+The file bytes are kept in worker memory, not in the session state: the state
+only records the name of the current file (which includes its content hash),
+and `attach_staged_file` hands the bytes to the DS agent's executor for the
+duration of its run. Large payloads thus never reach the session database,
+and only the current request's file is sent on each code execution. Passing
+the same data again reuses that file.
+"""
+
+import base64
+import csv
+import dataclasses
+import hashlib
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.code_executors.code_execution_utils import File
+from google.adk.tools import ToolContext
+from google.genai import types
+
+# "parquet", "feather" or "inline" (disable staging and embed data in the request)
+DS_DATA_STAGING_FORMAT = os.getenv("DS_DATA_STAGING_FORMAT", "parquet").lower()
+# Below this size the data is cheaper to inline than to stage.
+DS_DATA_STAGING_MIN_BYTES = int(os.getenv("DS_DATA_STAGING_MIN_BYTES", "2048"))
+# Memory held by staged files across sessions; the oldest are dropped first.
+DS_STAGED_FILES_MAX_BYTES = int(os.getenv("DS_STAGED_FILES_MAX_BYTES", str(256 << 20)))
+
+# Session state key read by ADK's CodeExecutorContext for executor input files.
+CODE_EXECUTOR_INPUT_FILES_KEY = "_code_executor_input_files"
+# Session state key holding the name of the currently staged file.
+STAGED_FILE_KEY = "ds_staged_file"
+
+logger = logging.getLogger(__name__)
+
+_MIME_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "feather": "application/vnd.apache.arrow.file",
+}
+
+
+@dataclass
+class StagedFile:
+    """A dataset registered as a code executor input file."""
+
+    name: str
+    format: str
+    num_rows: int
+    schema: str
+    size_bytes: int
+    reused: bool = False
+
+    def load_snippet(self) -> str:
+        reader = "read_parquet" if self.format == "parquet" else "read_feather"
+        return f"df = pd.{reader}('{self.name}')"
+
+
+class StagedFileStore:
+    """Encoded executor input files by name, bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._files: "OrderedDict[str, File]" = OrderedDict()
+        self._size = 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._files
+
+    def add(self, file: File) -> None:
+        if file.name in self._files:
+            self._files.move_to_end(file.name)
+            return
+        self._files[file.name] = file
+        self._size += len(file.content)
+        # Keep at least the newest file, even if it alone exceeds the limit.
+        while self._size > self.max_bytes and len(self._files) > 1:
+            _, dropped = self._files.popitem(last=False)
+            self._size -= len(dropped.content)
+
+    def get(self, name: str) -> File | None:
+        file = self._files.get(name)
+        if file is not None:
+            self._files.move_to_end(name)
+        return file
+
+
+staged_files = StagedFileStore(DS_STAGED_FILES_MAX_BYTES)
+
+
+def rows_from_json(value: Any) -> list[dict] | None:
+    """Find a list of row objects in a decoded JSON payload."""
+    if isinstance(value, list) and value and all(isinstance(r, dict) for r in value):
+        return value
+    if isinstance(value, dict):
+        for key in ("rows", "data", "result", "results"):
+            rows = rows_from_json(value.get(key))
+            if rows:
+                return rows
+        # MCP tool results wrap the payload as text content.
+        for item in value.get("content") or []:
+            if isinstance(item, dict) and item.get("type") == "text":
+                try:
+                    rows = rows_from_json(json.loads(item["text"]))
+                except ValueError:
+                    continue
+                if rows:
+                    return rows
+    return None
+
+
+def parse_table(data: str) -> pa.Table | None:
+    """Parse query results given as JSON rows or CSV into an Arrow table.
+
+    Returns:
+        The table, or None if `data` is not recognizably tabular.
+    """
+    text = data.strip()
+    if not text:
+        return None
+
+    if text[0] in "[{":
+        try:
+            rows = rows_from_json(json.loads(text))
+        except ValueError:
+            rows = None
+        if rows:
+            try:
+                return pa.Table.from_pylist(rows)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # Mixed types within a column: fall back to strings.
+                return pa.Table.from_pylist(
+                    [{k: None if v is None else str(v) for k, v in r.items()} for r in rows]
+                )
+        return None
+
+    lines = text.splitlines()
+    if len(lines) < 2:
+        return None
+    try:
+        dialect = csv.Sniffer().sniff(lines[0] + "\n" + lines[1], delimiters=",;\t|")
+    except csv.Error:
+        return None
+    try:
+        table = pa_csv.read_csv(
+            io.BytesIO(text.encode()),
+            parse_options=pa_csv.ParseOptions(delimiter=dialect.delimiter),
+        )
+    except pa.ArrowInvalid:
+        return None
+    return table if table.num_columns > 1 else None
+
+
+def encode_table(table: pa.Table, fmt: str) -> bytes:
+    """Serialize a table as zstd-compressed Parquet or Feather bytes."""
+    sink = pa.BufferOutputStream()
+    if fmt == "feather":
+        feather.write_feather(table, sink, compression="zstd")
+    else:
+        pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue().to_pybytes()
+
+
+def content_hash(payload: bytes) -> str:
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+def stage_table(
+    table: pa.Table,
+    tool_context: ToolContext,
+    name_prefix: str = "data",
+    fmt: str | None = None,
+) -> StagedFile:
+    """Register `table` as the code executor input file for this request.
+
+    Args:
+        table: The data to stage.
+        tool_context: Context of the calling tool; the file replaces any
+            previously staged file of its session, so the DS agent's
+            executor receives only this one.
+        name_prefix: Prefix for the generated file name.
+        fmt: "parquet" or "feather"; defaults to DS_DATA_STAGING_FORMAT.
+
+    Returns:
+        The staged file description.
+    """
+    fmt = fmt or (DS_DATA_STAGING_FORMAT if DS_DATA_STAGING_FORMAT in _MIME_TYPES else "parquet")
+    return stage_file(encode_table(table, fmt), fmt, tool_context, name_prefix)
+
+
+def stage_file(
+    payload: bytes,
+    fmt: str,
+    tool_context: ToolContext,
+    name_prefix: str = "data",
+) -> StagedFile:
+    """Register already encoded Parquet or Feather bytes as an input file.
+
+    Used for data that arrives as a file, e.g. a bulk export artifact, so it
+    is staged without being decoded and re-encoded.
+    """
+    if fmt == "feather":
+        table = feather.read_table(pa.BufferReader(payload))
+        table_schema, num_rows = table.schema, table.num_rows
+    else:
+        metadata = pq.read_metadata(pa.BufferReader(payload))
+        table_schema = metadata.schema.to_arrow_schema()
+        num_rows = metadata.num_rows
+    digest = content_hash(payload)
+    staged = StagedFile(
+        name=f"{name_prefix}_{digest}.{fmt}",
+        format=fmt,
+        num_rows=num_rows,
+        schema=", ".join(f"{f.name}: {f.type}" for f in table_schema),
+        size_bytes=len(payload),
+    )
+
+    # Sessions staged before files moved out of the state still carry the payload.
+    if tool_context.state.get(CODE_EXECUTOR_INPUT_FILES_KEY):
+        tool_context.state[CODE_EXECUTOR_INPUT_FILES_KEY] = []
+
+    if tool_context.state.get(STAGED_FILE_KEY) == staged.name and staged_files.get(staged.name):
+        staged.reused = True
+        return staged
+
+    staged_files.add(
+        File(name=staged.name, content=base64.b64encode(payload).decode(), mime_type=_MIME_TYPES[fmt])
+    )
+    tool_context.state[STAGED_FILE_KEY] = staged.name
+    return staged
+
+
+def attach_staged_file(callback_context: CallbackContext) -> None:
+    """before_agent_callback: give the executor the session's staged file.
+
+    The file is written to the in-memory session of the DS agent's run only,
+    outside any state delta, so it is not persisted and is gone afterwards.
+    """
+    name = callback_context.state.get(STAGED_FILE_KEY)
+    staged = staged_files.get(name) if name else None
+    if name and staged is None:
+        logger.warning("Staged file %s is no longer in memory", name)
+    session_state = callback_context._invocation_context.session.state
+    session_state[CODE_EXECUTOR_INPUT_FILES_KEY] = [dataclasses.asdict(staged)] if staged else []
+    return None
+
+
+def stage_data(data: str, tool_context: ToolContext) -> StagedFile | None:
+    """Stage `data` for the DS agent if staging is enabled and it is tabular.
+
+    Returns:
+        The staged file, or None if the data should be passed inline.
+    """
+    table = None
+    if DS_DATA_STAGING_FORMAT != "inline" and len(data) >= DS_DATA_STAGING_MIN_BYTES:
+        table = parse_table(data)
+    if table is None or table.num_rows == 0:
+        # Inline data: the previous request's file is not attached again.
+        if tool_context.state.get(STAGED_FILE_KEY):
+            tool_context.state[STAGED_FILE_KEY] = None
+        return None
+    return stage_table(table, tool_context)
+
+
+async def save_file_artifact(path: str, artifact_name: str, tool_context: ToolContext) -> dict:
+    """Save a local Parquet file as a session artifact and delete the file.
+
+    Returns:
+        The artifact name, version and size in bytes.
+    """
+    try:
+        with open(path, "rb") as f:
+            payload = f.read()
+    finally:
+        os.remove(path)
+    version = await tool_context.save_artifact(
+        artifact_name, types.Part.from_bytes(data=payload, mime_type=_MIME_TYPES["parquet"])
+    )
+    return {"artifact_name": artifact_name, "artifact_version": version, "size_bytes": len(payload)}
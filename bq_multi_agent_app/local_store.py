@@ -0,0 +1,27 @@
+"""
+Local persistent storage for caches that should survive restarts.
+
+Caches that are expensive to rebuild (column profiles, answer and result
+caches, catalog indexes) keep a SQLite database under APP_DATA_DIR. Each
+worker process opens its own connection; SQLite's WAL mode lets several
+workers on one host share a file.
+"""
+
+import os
+import sqlite3
+
+APP_DATA_DIR = os.getenv("APP_DATA_DIR", os.path.join(os.getcwd(), ".app_data"))
+
+
+def open_db(name: str) -> sqlite3.Connection:
+    """Open (creating if needed) the SQLite database `name` in APP_DATA_DIR."""
+    os.makedirs(APP_DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(
+        os.path.join(APP_DATA_DIR, f"{name}.sqlite"),
+        check_same_thread=False,
+        isolation_level=None,  # autocommit; writers use explicit transactions
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.row_factory = sqlite3.Row
+    return conn
@@ -0,0 +1,187 @@
+"""
+In-process cache for schema discovery tool results.
+
+Every execution path starts with the same discovery calls (list datasets,
+dataset info, list tables, table info and their Postgres equivalents). Their
+results change rarely, so they are cached per worker process and shared across
+sessions. Entries can also be filled ahead of time by the speculative prefetch
+in `prefetch.py`; a tool call that arrives while such a prefetch is still in
+flight awaits it instead of issuing a second request.
+
+The cache is wired in through `before_tool_callback` / `after_tool_callback`.
+"""
+
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+
+METADATA_CACHE_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_SECONDS", "600"))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "2000"))
+
+# Project passed explicitly by the model is equivalent to the toolbox default.
+DEFAULT_PROJECTS = {
+    p for p in (os.getenv("BIGQUERY_PROJECT"), os.getenv("PG_PROJECT")) if p
+}
+
+# Read-only discovery tools whose results are safe to share across sessions.
+CACHEABLE_TOOLS = {
+    "bigquery-list-dataset-ids",
+    "bigquery-get-dataset-info",
+    "bigquery-list-table-ids",
+    "bigquery-get-table-info",
+    "postgres-list-schemas",
+    "postgres-list-tables",
+    "postgres-list-views",
+}
+
+
+def canonical_args(args: dict[str, Any]) -> str:
+    """Serialize tool arguments so equivalent calls map to the same key.
+
+    Drops empty values and a `project` equal to the configured default, and
+    sorts keys, so `{"dataset": "x"}` and `{"project": <default>, "dataset": "x"}`
+    share an entry.
+    """
+    normalized = {}
+    for key, value in args.items():
+        if value in (None, "", [], {}):
+            continue
+        if key == "project" and value in DEFAULT_PROJECTS:
+            continue
+        normalized[key] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+def result_text(tool_response: Any) -> str:
+    """Extract the text payload from an MCP tool response."""
+    if isinstance(tool_response, dict):
+        content = tool_response.get("content") or []
+        return "".join(
+            item.get("text", "") for item in content if isinstance(item, dict)
+        )
+    return str(tool_response)
+
+
+def is_error_response(tool_response: Any) -> bool:
+    """Return True if an MCP tool response reports a failed call."""
+    return isinstance(tool_response, dict) and bool(tool_response.get("isError"))
+
+
+@dataclass
+class CacheEntry:
+    """A cached tool result and where it came from."""
+
+    value: Any
+    stored_at: float
+    speculative: bool = False
+    invocation_id: str | None = None
+    hits: int = 0
+
+
+class MetadataCache:
+    """TTL cache of discovery tool results keyed by tool name and arguments."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[tuple[str, str], CacheEntry] = {}
+        self._pending: dict[tuple[str, str], asyncio.Future] = {}
+
+    @staticmethod
+    def key(tool_name: str, args: dict[str, Any]) -> tuple[str, str]:
+        return tool_name, canonical_args(args)
+
+    def get(self, key: tuple[str, str]) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        return entry
+
+    def put(
+        self,
+        key: tuple[str, str],
+        value: Any,
+        speculative: bool = False,
+        invocation_id: str | None = None,
+    ) -> None:
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            # Evict the oldest entry; dicts preserve insertion order.
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = CacheEntry(
+            value=value,
+            stored_at=time.monotonic(),
+            speculative=speculative,
+            invocation_id=invocation_id,
+        )
+
+    def pending(self, key: tuple[str, str]) -> asyncio.Future | None:
+        return self._pending.get(key)
+
+    def set_pending(self, key: tuple[str, str], future: asyncio.Future) -> None:
+        self._pending[key] = future
+        future.add_done_callback(lambda _: self._pending.pop(key, None))
+
+    def speculative_entries(self, invocation_id: str) -> list[CacheEntry]:
+        return [
+            e for e in self._entries.values()
+            if e.speculative and e.invocation_id == invocation_id
+        ]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+metadata_cache = MetadataCache(METADATA_CACHE_TTL_SECONDS, METADATA_CACHE_MAX_ENTRIES)
+
+
+async def serve_cached_metadata(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> dict | None:
+    """before_tool_callback: answer discovery calls from the cache.
+
+    Returns the cached result to skip the remote call, or None to let the tool
+    run normally.
+    """
+    if tool.name not in CACHEABLE_TOOLS:
+        return None
+
+    key = metadata_cache.key(tool.name, args)
+    entry = metadata_cache.get(key)
+    if entry is None:
+        pending = metadata_cache.pending(key)
+        if pending is None:
+            return None
+        # A speculative prefetch for this call is already in flight.
+        try:
+            await asyncio.shield(pending)
+        except Exception:
+            return None
+        entry = metadata_cache.get(key)
+        if entry is None:
+            return None
+
+    entry.hits += 1
+    return entry.value
+
+
+def store_metadata(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> dict | None:
+    """after_tool_callback: remember successful discovery results."""
+    if tool.name in CACHEABLE_TOOLS and not is_error_response(tool_response):
+        key = metadata_cache.key(tool.name, args)
+        if metadata_cache.get(key) is None:
+            metadata_cache.put(key, tool_response)
+    return None
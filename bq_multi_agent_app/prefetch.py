@@ -0,0 +1,232 @@
+"""
+Speculative schema prefetch for the root agent.
+
+Every execution path starts with the same discovery calls, but those calls only
+start after the first model response asks for them. When a turn starts, this
+module predicts the discovery calls the agent is likely to make from the user
+text and the datasets used earlier in the session, and issues them in the
+background while the first LLM call is in progress. Results land in the
+metadata cache, so the agent's own calls are answered from memory (or await
+the in-flight prefetch).
+
+Speculative results that are never used during the turn are counted as wasted
+in `prefetch_stats` (per worker) and in the session state.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+
+from .metadata_cache import is_error_response
+from .metadata_cache import metadata_cache
+from .metadata_cache import result_text
+from .sql_templates import has_direct_template
+from .sub_agents.pg_agents.tools import pg_data_retrieval_toolset
+from .toolbox import call_toolbox_tool
+from .tools import bq_data_retrieval_toolset
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("SPECULATIVE_PREFETCH", "true").lower() == "true"
+# Upper bound on datasets/tables prefetched per turn, to cap wasted calls.
+PREFETCH_MAX_OBJECTS = int(os.getenv("SPECULATIVE_PREFETCH_MAX_OBJECTS", "3"))
+
+RECENT_DATASETS_KEY = "prefetch:recent_datasets"
+STATS_KEY = "prefetch_stats"
+
+# Same hints the root prompt uses to route to Cloud SQL.
+OPERATIONAL_HINTS = {"id", "status", "latest", "current", "real-time", "realtime", "lookup"}
+
+# Generic name parts that say nothing about what a table contains.
+_IGNORED_NAME_PARTS = {"fact", "dim", "tbl", "table", "data", "raw", "stg", "view"}
+
+# Worker-wide counters of speculative calls.
+prefetch_stats = {"issued": 0, "used": 0, "wasted": 0, "failed": 0}
+
+# Keep references to background tasks so they are not garbage collected.
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _words(text: str) -> set[str]:
+    words = set(re.findall(r"[a-z0-9][a-z0-9_\-]*", text.lower()))
+    # Crude singularization so "orders" matches an "order" table and vice versa.
+    return words | {w[:-1] for w in words if w.endswith("s") and len(w) > 3}
+
+
+def _mentioned(names: list[str], words: set[str], text: str) -> list[str]:
+    """Return names that the user text refers to, best matches first."""
+    exact, partial = [], []
+    lowered = text.lower()
+    for name in names:
+        plain = name.lower()
+        if plain in words or plain.replace("_", " ") in lowered:
+            exact.append(name)
+            continue
+        parts = [
+            p for p in re.split(r"[_\-]", plain)
+            if len(p) >= 4 and p not in _IGNORED_NAME_PARTS
+        ]
+        if parts and any(p in words for p in parts):
+            partial.append(name)
+    return exact + partial
+
+
+def _json_list(tool_response: Any) -> list[str]:
+    """Parse a toolbox response whose text is a JSON list of names."""
+    text = result_text(tool_response).strip()
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return []
+    if not isinstance(value, list):
+        return []
+    return [v for v in value if isinstance(v, str)]
+
+
+def _user_text(callback_context: CallbackContext) -> str:
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text or "" for part in content.parts)
+
+
+async def _prefetch(
+    toolset: BaseToolset,
+    tool_name: str,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+) -> Any:
+    """Issue one speculative call unless it is already cached or in flight."""
+    key = metadata_cache.key(tool_name, args)
+    entry = metadata_cache.get(key)
+    if entry is not None:
+        return entry.value
+    pending = metadata_cache.pending(key)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except Exception:
+            return None
+
+    async def run():
+        result = await call_toolbox_tool(toolset, tool_name, args, tool_context)
+        if not is_error_response(result):
+            metadata_cache.put(
+                key, result, speculative=True,
+                invocation_id=tool_context.invocation_id,
+            )
+        return result
+
+    task = asyncio.ensure_future(run())
+    metadata_cache.set_pending(key, task)
+    prefetch_stats["issued"] += 1
+    try:
+        return await task
+    except Exception as e:
+        prefetch_stats["failed"] += 1
+        logger.debug("Speculative %s%s failed: %s", tool_name, args, e)
+        return None
+
+
+async def _prefetch_bigquery(text: str, recent: list[str], tool_context: ToolContext):
+    words = _words(text)
+    datasets_response = await _prefetch(
+        bq_data_retrieval_toolset, "bigquery-list-dataset-ids", {}, tool_context
+    )
+    known_datasets = _json_list(datasets_response)
+
+    candidates = _mentioned(known_datasets, words, text) if known_datasets else []
+    for dataset in recent:
+        if dataset not in candidates:
+            candidates.append(dataset)
+    candidates = candidates[:PREFETCH_MAX_OBJECTS]
+    if not candidates:
+        return
+
+    async def prefetch_dataset(dataset: str):
+        _, tables_response = await asyncio.gather(
+            _prefetch(bq_data_retrieval_toolset, "bigquery-get-dataset-info",
+                      {"dataset": dataset}, tool_context),
+            _prefetch(bq_data_retrieval_toolset, "bigquery-list-table-ids",
+                      {"dataset": dataset}, tool_context),
+        )
+        tables = _mentioned(_json_list(tables_response), words, text)
+        await asyncio.gather(*(
+            _prefetch(bq_data_retrieval_toolset, "bigquery-get-table-info",
+                      {"dataset": dataset, "table": table}, tool_context)
+            for table in tables[:PREFETCH_MAX_OBJECTS]
+        ))
+
+    await asyncio.gather(*(prefetch_dataset(d) for d in candidates))
+
+
+async def _prefetch_postgres(tool_context: ToolContext):
+    await _prefetch(pg_data_retrieval_toolset, "postgres-list-schemas", {}, tool_context)
+
+
+def start_speculative_prefetch(callback_context: CallbackContext) -> None:
+    """before_agent_callback: kick off discovery calls for the new turn.
+
+    Runs the prefetch in the background and returns immediately, so the first
+    model call proceeds concurrently.
+    """
+    if not PREFETCH_ENABLED or has_direct_template(callback_context):
+        return None
+    text = _user_text(callback_context)
+    if not text:
+        return None
+
+    tool_context = ToolContext(callback_context._invocation_context)
+    recent = list(callback_context.state.get(RECENT_DATASETS_KEY, []))
+    jobs = [_prefetch_bigquery(text, recent, tool_context)]
+    if _words(text) & OPERATIONAL_HINTS:
+        jobs.append(_prefetch_postgres(tool_context))
+
+    for job in jobs:
+        task = asyncio.create_task(job)
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return None
+
+
+def finish_speculative_prefetch(callback_context: CallbackContext) -> None:
+    """after_agent_callback: count speculative results the turn never used."""
+    entries = metadata_cache.speculative_entries(callback_context.invocation_id)
+    if not entries:
+        return None
+    used = sum(1 for e in entries if e.hits)
+    wasted = len(entries) - used
+    prefetch_stats["used"] += used
+    prefetch_stats["wasted"] += wasted
+    for entry in entries:
+        # Later turns may still hit the entry, but it no longer counts as speculative.
+        entry.speculative = False
+
+    stats = dict(callback_context.state.get(STATS_KEY) or {"issued": 0, "used": 0, "wasted": 0})
+    stats["issued"] += len(entries)
+    stats["used"] += used
+    stats["wasted"] += wasted
+    callback_context.state[STATS_KEY] = stats
+    return None
+
+
+def remember_datasets(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> dict | None:
+    """after_tool_callback: remember datasets used in the session for later turns."""
+    dataset = args.get("dataset")
+    if tool.name.startswith("bigquery-") and dataset:
+        recent = [d for d in tool_context.state.get(RECENT_DATASETS_KEY, []) if d != dataset]
+        tool_context.state[RECENT_DATASETS_KEY] = [dataset] + recent[:PREFETCH_MAX_OBJECTS - 1]
+    return None
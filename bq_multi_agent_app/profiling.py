@@ -0,0 +1,333 @@
+"""
+Opt-in profiling of single agent turns.
+
+A profiled turn is sampled by a statistical profiler: a background thread
+reads the Python stack of every thread (`sys._current_frames`) every
+PROFILE_INTERVAL_SECONDS, without instrumenting any code. At the same time a
+heartbeat task on the event loop ticks every PROFILE_LOOP_TICK_SECONDS; while
+the heartbeat is late by more than PROFILE_BLOCK_THRESHOLD_SECONDS the loop
+is blocked (e.g. by a synchronous client call such as `rag.retrieval_query`
+or `bigquery.Client()`), and the event loop thread's stacks are recorded
+against that blocking interval.
+
+A turn is profiled when any of these is set:
+- PROFILE_SAMPLE_RATE: fraction of all streamed turns (1 profiles every turn),
+- the `X-Profile: 1` header on a server request (if PROFILE_ALLOW_REQUESTS),
+- the "profile" session state key (if PROFILE_ALLOW_REQUESTS).
+Only one turn per worker is profiled at a time. Samples cover the whole
+process, so other turns running concurrently in the worker show up too.
+
+Results are saved as session artifacts named after the turn's trace ID:
+    profile-<trace_id>.svg           flamegraph of all samples, by thread
+    profile-<trace_id>-blocked.svg   flamegraph of the event loop while blocked
+    profile-<trace_id>.folded        folded stacks (flamegraph.pl, speedscope)
+    profile-<trace_id>.json          summary and blocking intervals
+and also written to PROFILE_OUTPUT_DIR when set.
+"""
+
+import asyncio
+import html
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from google.adk.runners import Runner
+from google.genai import types
+from opentelemetry import trace
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ALLOW_REQUESTS = os.getenv("PROFILE_ALLOW_REQUESTS", "false").lower() == "true"
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.01"))
+PROFILE_LOOP_TICK_SECONDS = float(os.getenv("PROFILE_LOOP_TICK_SECONDS", "0.005"))
+PROFILE_BLOCK_THRESHOLD_SECONDS = float(os.getenv("PROFILE_BLOCK_THRESHOLD_SECONDS", "0.05"))
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "")
+
+# Session state key that requests profiling of the session's turns.
+PROFILE_STATE_KEY = "profile"
+PROFILE_HEADER = "x-profile"
+
+MAX_STACK_DEPTH = 128
+MAX_BLOCKING_INTERVALS = 100
+# Leaf frames of threads that are waiting for work rather than running.
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_tracer = trace.get_tracer(__name__)
+_active = threading.Lock()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame) -> tuple[list[str], bool]:
+    """Root-to-leaf frame labels of a stack, and whether the leaf is idle."""
+    code = frame.f_code
+    idle = (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels, idle
+
+
+@dataclass
+class BlockingInterval:
+    """A period in which the event loop did not run its heartbeat."""
+
+    start_s: float
+    duration_s: float = 0.0
+    stacks: Counter = field(default_factory=Counter)
+
+    def to_dict(self) -> dict:
+        top = self.stacks.most_common(1)
+        return {
+            "start_s": round(self.start_s, 3),
+            "duration_s": round(self.duration_s, 3),
+            # Innermost frames are the most telling; keep the stack readable.
+            "stack": top[0][0].split(";")[-12:] if top else [],
+        }
+
+
+class TurnProfiler:
+    """Samples all threads and detects event loop blocking during one turn."""
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex
+        self.samples: Counter = Counter()
+        self.blocked_samples: Counter = Counter()
+        self.blocking: list[BlockingInterval] = []
+        self.sample_count = 0
+        self._started = 0.0
+        self._finished = 0.0
+        self._beat = 0.0
+        self._loop_thread = 0
+        self._current_block: BlockingInterval | None = None
+        self._stop = threading.Event()
+        self._sampler: threading.Thread | None = None
+        self._heartbeat: asyncio.Task | None = None
+
+    async def _run_heartbeat(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(PROFILE_LOOP_TICK_SECONDS)
+
+    def _sample_once(self) -> None:
+        now = time.monotonic()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        blocked = now - self._beat > PROFILE_BLOCK_THRESHOLD_SECONDS + PROFILE_LOOP_TICK_SECONDS
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            labels, idle = _fold(frame)
+            if thread_id == self._loop_thread:
+                stack = ";".join(["event-loop", *labels])
+                if blocked:
+                    self.blocked_samples[stack] += 1
+                    if self._current_block is None:
+                        self._current_block = BlockingInterval(start_s=self._beat - self._started)
+                    self._current_block.stacks[stack] += 1
+            elif idle:
+                continue
+            else:
+                stack = ";".join([names.get(thread_id, f"thread-{thread_id}"), *labels])
+            self.samples[stack] += 1
+        if not blocked and self._current_block is not None:
+            block = self._current_block
+            block.duration_s = self._beat - self._started - block.start_s - PROFILE_LOOP_TICK_SECONDS
+            if len(self.blocking) < MAX_BLOCKING_INTERVALS:
+                self.blocking.append(block)
+            self._current_block = None
+        self.sample_count += 1
+
+    def _run_sampler(self) -> None:
+        while not self._stop.wait(PROFILE_INTERVAL_SECONDS):
+            try:
+                self._sample_once()
+            except Exception:
+                logger.exception("Profiler sample failed")
+
+    def start(self) -> None:
+        """Start sampling; must be called from the event loop thread."""
+        self._started = self._beat = time.monotonic()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._run_heartbeat())
+        self._sampler = threading.Thread(target=self._run_sampler, name="turn-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1)
+        self._finished = time.monotonic()
+
+    @contextmanager
+    def traced(self):
+        """Profile the enclosed block inside a span whose trace ID tags the results."""
+        with _tracer.start_as_current_span("profiled_turn") as span:
+            context = span.get_span_context()
+            if context.is_valid:
+                self.trace_id = format(context.trace_id, "032x")
+            self.start()
+            try:
+                yield self
+            finally:
+                self.stop()
+                span.set_attribute("profile.samples", self.sample_count)
+                span.set_attribute("profile.event_loop_blocked_s", self.blocked_seconds())
+
+    def blocked_seconds(self) -> float:
+        return round(sum(b.duration_s for b in self.blocking), 3)
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "duration_s": round(self._finished - self._started, 3),
+            "interval_s": PROFILE_INTERVAL_SECONDS,
+            "samples": self.sample_count,
+            "event_loop_blocked_s": self.blocked_seconds(),
+            "blocking": [
+                b.to_dict()
+                for b in sorted(self.blocking, key=lambda b: b.duration_s, reverse=True)
+            ],
+        }
+
+
+def folded(samples: Counter) -> str:
+    """Samples in folded-stack format: `frame;frame;frame count` per line."""
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def flamegraph_svg(samples: Counter, title: str, width: int = 1200, row_height: int = 16) -> str:
+    """Render folded samples as a static SVG flamegraph (root at the bottom)."""
+    root: dict = {"count": 0, "children": {}}
+    for stack, count in samples.items():
+        node = root
+        node["count"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "children": {}})
+            node["count"] += count
+
+    def depth(node) -> int:
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    rows = depth(root) - 1
+    height = (rows + 2) * row_height
+    total = max(root["count"], 1)
+    scale = width / total
+    rects = []
+
+    def draw(node, label: str, x: float, level: int) -> None:
+        w = node["count"] * scale
+        if w < 0.5:
+            return
+        y = height - (level + 1) * row_height
+        hue = sum(map(ord, label.split(" ")[0])) % 60
+        text = html.escape(label)
+        share = 100 * node["count"] / total
+        chars = int(w / 7)
+        shown = text if len(label) <= chars else html.escape(label[: max(chars - 2, 0)]) + ".." if chars > 3 else ""
+        rects.append(
+            f'<g><title>{text} ({node["count"]} samples, {share:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{shown}</text></g>'
+        )
+        child_x = x
+        for child_label, child in sorted(node["children"].items()):
+            draw(child, child_label, child_x, level + 1)
+            child_x += child["count"] * scale
+
+    child_x = 0.0
+    for label, child in sorted(root["children"].items()):
+        draw(child, label, child_x, 0)
+        child_x += child["count"] * scale
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">'
+        f'<text x="4" y="{row_height - 4}" font-size="13">{html.escape(title)} '
+        f'({root["count"]} samples)</text>{"".join(rects)}</svg>'
+    )
+
+
+def should_profile(requested: bool, session_state: dict | None) -> bool:
+    """Whether to profile a turn, given the request flag and the session state."""
+    if PROFILE_ALLOW_REQUESTS and (requested or (session_state or {}).get(PROFILE_STATE_KEY)):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def claim_profiler() -> TurnProfiler | None:
+    """A profiler for the caller's turn, or None if another turn is being profiled.
+
+    The caller must call `release_profiler` once the turn is over.
+    """
+    if not _active.acquire(blocking=False):
+        logger.info("Profiling skipped: another turn is being profiled")
+        return None
+    return TurnProfiler()
+
+
+def release_profiler() -> None:
+    _active.release()
+
+
+async def save_profile(runner: Runner, user_id: str, session_id: str, profiler: TurnProfiler) -> dict:
+    """Save the profile as session artifacts (and to PROFILE_OUTPUT_DIR).
+
+    Returns:
+        The summary of the profile and the artifact names.
+    """
+    summary = profiler.summary()
+    prefix = f"profile-{profiler.trace_id}"
+    files = {
+        f"{prefix}.svg": (flamegraph_svg(profiler.samples, f"Turn {profiler.trace_id}"), "image/svg+xml"),
+        f"{prefix}-blocked.svg": (
+            flamegraph_svg(profiler.blocked_samples, f"Event loop blocked, turn {profiler.trace_id}"),
+            "image/svg+xml",
+        ),
+        f"{prefix}.folded": (folded(profiler.samples), "text/plain"),
+        f"{prefix}.json": (json.dumps(summary, indent=2), "application/json"),
+    }
+    if PROFILE_OUTPUT_DIR:
+        os.makedirs(PROFILE_OUTPUT_DIR, exist_ok=True)
+        for name, (content, _) in files.items():
+            with open(os.path.join(PROFILE_OUTPUT_DIR, name), "w") as f:
+                f.write(content)
+    artifacts = []
+    if runner.artifact_service is not None:
+        for name, (content, mime_type) in files.items():
+            await runner.artifact_service.save_artifact(
+                app_name=runner.app_name,
+                user_id=user_id,
+                session_id=session_id,
+                filename=name,
+                artifact=types.Part.from_bytes(data=content.encode(), mime_type=mime_type),
+            )
+            artifacts.append(name)
+    logger.info(
+        "Profiled turn %s: %d samples, event loop blocked %.2fs",
+        profiler.trace_id, summary["samples"], summary["event_loop_blocked_s"],
+    )
+    return {**summary, "artifacts": artifacts}
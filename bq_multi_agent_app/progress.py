@@ -0,0 +1,41 @@
+"""
+Progress channels for streamed turns.
+
+A streamed turn opens a channel and stores its ID in session state; tools and
+callbacks publish progress events to it with `emit_progress`. AgentTool copies
+the parent's state into the DS agent's child session, so nested agents reach
+the same channel. Kept free of agent imports so any tool module can use it.
+"""
+
+import asyncio
+import uuid
+from typing import Any
+
+from google.adk.agents.readonly_context import ReadonlyContext
+
+# Session state key holding the ID of the stream the current turn reports to.
+STREAM_CHANNEL_KEY = "stream:channel"
+
+_channels: dict[str, asyncio.Queue] = {}
+
+
+def open_channel() -> tuple[str, asyncio.Queue]:
+    """Register a new channel and return its ID and event queue."""
+    channel_id = uuid.uuid4().hex
+    _channels[channel_id] = asyncio.Queue()
+    return channel_id, _channels[channel_id]
+
+
+def close_channel(channel_id: str) -> None:
+    _channels.pop(channel_id, None)
+
+
+def emit_progress(context: ReadonlyContext, kind: str = "tool_progress", **fields: Any) -> None:
+    """Publish an event to the stream of the current turn, if it is streamed.
+
+    Must be called from the event loop thread. A no-op for turns that are not
+    streamed (e.g. `adk web` or batch mode).
+    """
+    channel = _channels.get(context.state.get(STREAM_CHANNEL_KEY) or "")
+    if channel is not None:
+        channel.put_nowait({"type": kind, "agent": context.agent_name, **fields})
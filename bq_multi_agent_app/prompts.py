@@ -9,6 +9,8 @@ def return_instructions_root() -> str:
 
         You DO NOT have pre-loaded database schema. Before ANY operation, follow this universal discovery process based on the target system:
 
+        **0. FIND CANDIDATE TABLES FIRST:** Call `find_relevant_tables` with the user's concept (e.g. "customer churn", "order revenue by region"). It searches a local index of every BigQuery and Postgres table and column name and description in milliseconds and returns fully qualified table IDs with the columns that matched. When it returns convincing matches, skip the list steps below and go straight to the schema step ('bigquery-get-table-info' or 'postgres-get-table-info') for the top tables. Fall back to the full discovery steps when nothing relevant is found, the index is not available, or the user asks for fresh discovery.
+
         **A. FOR BIGQUERY (Analytics & History):**
         1. **Discover Data Landscape**: Use 'bigquery-list-dataset-ids'
         2. **Understand Context**: Use 'bigquery-get-dataset-info'
@@ -52,6 +54,7 @@ def return_instructions_root() -> str:
         **PATH 2: Deep Analysis (BigQuery)** → Use 'bigquery-execute-sql' + 'call_data_science_agent'
         - **When**: Complex analysis, visualizations, custom data science work
         - **Process**: Complete discovery → craft optimized SQL → pass to data science agent
+        - **Large results**: When the analysis needs many rows (thousands or more), run the SQL with `export_bq_data` instead of 'bigquery-execute-sql'; pass only the needed `columns` and a `row_filter` when reading a table directly, then call `call_data_science_agent` with the returned `artifact_name`
 
         **PATH 3: ML Analysis (BigQuery)** → Use 'bigquery-forecast' or 'bigquery-analyze-contribution'
         - **When**: Forecasting or understanding drivers of change
@@ -60,14 +63,20 @@ def return_instructions_root() -> str:
         **PATH 4: BigQuery ML (BQML) Operations** → Delegate to BQML sub-agent
         - **When**: Machine learning models, training, predictions, model inspection
         - **Triggers**: "train model", "create model", "bqml", "predict"
+        - **Predictions**: The BQML agent writes predictions to a table and reports its `destination_table`; for deeper analysis of all predictions, read it with `export_bq_data(table_id=...)` and pass the artifact to `call_data_science_agent`
 
         **PATH 5: Operational Data (Cloud SQL)** → Delegate to Cloud SQL sub-agent
         - **When**: Real-time lookups, searching for specific records, checking current state
         - **Process**: Identify if user needs specific rows → Delegate to Cloud SQL Agent
         - **Best for**: `SELECT * FROM users WHERE id = ...`, joining live transactional tables
         - **Tool**: `call_cloudsql_agent` (or `postgres_toolset` if directly available)
+        - **Large extracts**: The Cloud SQL agent exports big result sets to a Parquet artifact (`export_pg_query`); pass its artifact name to `call_data_science_agent` as `artifact_name` instead of pasting rows into `data`
+
+        **FOLLOW-UPS ON A PREVIOUS RESULT** → Use `transform_result`
+        - **When**: The user refines a result already shown in this conversation: "sort by revenue", "top 5 only", "filter to EMEA", "group by region", "pivot by month"
+        - **Process**: Call `transform_result` (no discovery needed); it answers in milliseconds from the stored rows. Only re-query (with the previous SQL adjusted) if it returns `needs_requery`
 
-        **All paths start with the discovery process above.**
+        **All paths except follow-ups start with the discovery process above.**
     </EXECUTION_PATHS>
 
     <DISCOVERY_AND_EXECUTION_GUIDELINES>
@@ -99,7 +108,7 @@ def return_instructions_root() -> str:
         **Example Workflow 1 - Standard Analytics (BigQuery):**
         User: "Show me last month's sales by region"
         1. Router identifies "Analytics" intent → BigQuery path.
-        2. bigquery-list-dataset-ids → ... → bigquery-get-table-info.
+        2. find_relevant_tables("sales by region") → bigquery-get-table-info on the top match.
         3. Execute optimized SQL.
 
         **Example Workflow 2 - Operational Lookup (Cloud SQL):**
@@ -0,0 +1,523 @@
+"""
+Local follow-up engine over query results already fetched in a session.
+
+Follow-ups such as "sort by revenue", "top 5 only" or "filter to EMEA" do not
+need another warehouse query or a data science agent run when the rows are
+already in the session. The last RESULT_FRAMES_PER_SESSION results of
+`bigquery-execute-sql` and `postgres-execute-sql` are kept per session as
+Arrow tables, and `transform_result` filters, groups, pivots, sorts and
+truncates them with vectorized `pyarrow.compute` operations.
+
+Each transformation is stored as a new result, so follow-ups chain. When the
+needed columns were never fetched, or the stored result is itself truncated
+(its query had a LIMIT) and the operation needs the full data, the tool
+answers "needs_requery" instead of a wrong answer.
+
+Results live in worker memory only; they are not part of the session state.
+"""
+
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+
+from .data_files import rows_from_json
+from .metadata_cache import is_error_response
+from .tool_output import shaped_tool
+
+RESULT_FRAMES_PER_SESSION = int(os.getenv("RESULT_FRAMES_PER_SESSION", "8"))
+RESULT_FRAMES_MAX_SESSIONS = int(os.getenv("RESULT_FRAMES_MAX_SESSIONS", "500"))
+RESULT_FRAMES_MAX_BYTES = int(os.getenv("RESULT_FRAMES_MAX_BYTES", str(64 << 20)))
+RESULT_FRAMES_OUTPUT_ROWS = int(os.getenv("RESULT_FRAMES_OUTPUT_ROWS", "50"))
+
+# Tools whose row results are captured, with the argument holding their query.
+CAPTURED_TOOLS = {"bigquery-execute-sql": "sql", "postgres-execute-sql": "sql"}
+
+MAX_PIVOT_VALUES = 50
+
+# Aggregate names accepted in `aggregations`, mapped to pyarrow hash aggregates.
+_AGGREGATES = {
+    "sum": "sum",
+    "avg": "mean",
+    "mean": "mean",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+    "count_distinct": "count_distinct",
+    "stddev": "stddev",
+    "median": "approximate_median",
+}
+
+_OUTER_LIMIT = re.compile(r"\bLIMIT\s+\d+(\s+OFFSET\s+\d+)?\s*;?\s*$", re.IGNORECASE)
+
+
+@dataclass
+class ResultFrame:
+    """One result set held for follow-ups."""
+
+    result_id: str
+    table: pa.Table
+    source: str
+    query: str = ""
+    complete: bool = True
+    created_at: float = field(default_factory=time.time)
+
+    def describe(self) -> dict:
+        return {
+            "result_id": self.result_id,
+            "source": self.source,
+            "rows": self.table.num_rows,
+            "columns": self.table.column_names,
+            "complete": self.complete,
+        }
+
+
+class ResultFrameStore:
+    """Recent result sets per session, most recent last."""
+
+    def __init__(self, per_session: int, max_sessions: int):
+        self.per_session = per_session
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, OrderedDict[str, ResultFrame]]" = OrderedDict()
+        self._counter = 0
+
+    def add(self, session_id: str, table: pa.Table, source: str, query: str = "", complete: bool = True) -> ResultFrame:
+        frames = self._sessions.pop(session_id, None) or OrderedDict()
+        self._sessions[session_id] = frames
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        self._counter += 1
+        frame = ResultFrame(f"r{self._counter}", table, source, query, complete)
+        frames[frame.result_id] = frame
+        while len(frames) > self.per_session:
+            frames.popitem(last=False)
+        return frame
+
+    def get(self, session_id: str, result_id: str = "") -> ResultFrame | None:
+        frames = self._sessions.get(session_id)
+        if not frames:
+            return None
+        if not result_id:
+            return next(reversed(frames.values()))
+        return frames.get(result_id)
+
+    def list(self, session_id: str) -> list[ResultFrame]:
+        return list((self._sessions.get(session_id) or {}).values())
+
+
+result_frames = ResultFrameStore(RESULT_FRAMES_PER_SESSION, RESULT_FRAMES_MAX_SESSIONS)
+
+
+def _to_table(rows: list[dict]) -> pa.Table:
+    try:
+        return pa.Table.from_pylist(rows)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types within a column: fall back to strings.
+        return pa.Table.from_pylist(
+            [{k: None if v is None else str(v) for k, v in r.items()} for r in rows]
+        )
+
+
+def capture_result_frame(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> None:
+    """after_tool_callback: keep row results of SQL tools for local follow-ups."""
+    query_arg = CAPTURED_TOOLS.get(tool.name)
+    if query_arg is None or is_error_response(tool_response):
+        return None
+    rows = rows_from_json(tool_response)
+    if not rows:
+        return None
+    table = _to_table(rows)
+    if table.nbytes > RESULT_FRAMES_MAX_BYTES:
+        return None
+    query = args.get(query_arg) or ""
+    result_frames.add(
+        tool_context.session.id,
+        table,
+        source=tool.name,
+        query=query,
+        complete=not _OUTER_LIMIT.search(query.strip()),
+    )
+    return None
+
+
+# --- filter expressions -------------------------------------------------------
+
+_TOKEN = re.compile(
+    r"\s*(?:"
+    r"(?P<str>'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")"
+    r"|(?P<num>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)"
+    r"|(?P<op><>|!=|>=|<=|=|<|>|\(|\)|,)"
+    r"|(?P<word>`[^`]+`|[A-Za-z_][\w.]*)"
+    r")"
+)
+_COMPARISONS = {"=": "equal", "!=": "not_equal", "<>": "not_equal", ">": "greater",
+                ">=": "greater_equal", "<": "less", "<=": "less_equal"}
+
+
+class FilterError(ValueError):
+    """The filter expression could not be parsed or applied."""
+
+
+def _tokenize(text: str) -> list[tuple[str, Any]]:
+    tokens, pos = [], 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise FilterError(f"Cannot parse filter near: {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "str":
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == "num":
+            value = float(value) if any(c in value for c in ".eE") else int(value)
+        elif kind == "word" and value.startswith("`"):
+            kind, value = "name", value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+
+class _FilterParser:
+    """Recursive descent parser for SQL-like WHERE conditions."""
+
+    def __init__(self, text: str, schema: pa.Schema):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.schema = schema
+
+    def parse(self) -> pc.Expression:
+        expr = self._or()
+        if self.pos != len(self.tokens):
+            raise FilterError(f"Unexpected {self.tokens[self.pos][1]!r} in filter")
+        return expr
+
+    def _peek_word(self, *words: str) -> bool:
+        if self.pos >= len(self.tokens):
+            return False
+        kind, value = self.tokens[self.pos]
+        return kind == "word" and value.upper() in words
+
+    def _peek_op(self, op: str) -> bool:
+        return self.pos < len(self.tokens) and self.tokens[self.pos] == ("op", op)
+
+    def _next(self) -> tuple[str, Any]:
+        if self.pos >= len(self.tokens):
+            raise FilterError("Filter ends unexpectedly")
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str) -> None:
+        kind, got = self._next()
+        if str(got).upper() != value:
+            raise FilterError(f"Expected {value!r} in filter, got {got!r}")
+
+    def _or(self) -> pc.Expression:
+        expr = self._and()
+        while self._peek_word("OR"):
+            self.pos += 1
+            expr = expr | self._and()
+        return expr
+
+    def _and(self) -> pc.Expression:
+        expr = self._not()
+        while self._peek_word("AND"):
+            self.pos += 1
+            expr = expr & self._not()
+        return expr
+
+    def _not(self) -> pc.Expression:
+        if self._peek_word("NOT"):
+            self.pos += 1
+            return ~self._not()
+        if self._peek_op("("):
+            self.pos += 1
+            expr = self._or()
+            self._expect(")")
+            return expr
+        return self._comparison()
+
+    def _column(self) -> tuple[pc.Expression, pa.DataType]:
+        kind, name = self._next()
+        if kind not in ("word", "name"):
+            raise FilterError(f"Expected a column name in filter, got {name!r}")
+        if name not in self.schema.names:
+            matches = [n for n in self.schema.names if n.lower() == name.lower()]
+            if not matches:
+                raise KeyError(name)
+            name = matches[0]
+        return pc.field(name), self.schema.field(name).type
+
+    def _literal(self, column_type: pa.DataType) -> Any:
+        kind, value = self._next()
+        if kind == "word":
+            upper = value.upper()
+            if upper in ("TRUE", "FALSE"):
+                value = upper == "TRUE"
+            elif upper == "NULL":
+                return None
+            else:
+                raise FilterError(f"Unexpected {value!r} in filter; quote text values")
+        elif kind not in ("str", "num"):
+            raise FilterError(f"Expected a value in filter, got {value!r}")
+        if pa.types.is_string(column_type) or pa.types.is_large_string(column_type):
+            return pa.scalar(str(value))
+        try:
+            return pa.scalar(value).cast(column_type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            raise FilterError(f"Value {value!r} does not match column type {column_type}")
+
+    def _value(self, column_type: pa.DataType) -> pa.Scalar:
+        """A literal that must not be NULL (comparisons with NULL never match)."""
+        value = self._literal(column_type)
+        if value is None:
+            raise FilterError("Use IS NULL / IS NOT NULL to compare with NULL")
+        return value
+
+    def _comparison(self) -> pc.Expression:
+        column, column_type = self._column()
+        negate = False
+        if self._peek_word("IS"):
+            self.pos += 1
+            if self._peek_word("NOT"):
+                self.pos += 1
+                negate = True
+            self._expect("NULL")
+            expr = column.is_null()
+            return ~expr if negate else expr
+        if self._peek_word("NOT"):
+            self.pos += 1
+            negate = True
+        if self._peek_word("IN"):
+            self.pos += 1
+            self._expect("(")
+            values = [self._value(column_type)]
+            while self._peek_op(","):
+                self.pos += 1
+                values.append(self._value(column_type))
+            self._expect(")")
+            expr = column.isin(pa.array([v.as_py() for v in values], type=column_type))
+        elif self._peek_word("LIKE", "ILIKE"):
+            ignore_case = self._next()[1].upper() == "ILIKE"
+            pattern = self._value(pa.string()).as_py()
+            expr = pc.match_like(column, pattern, ignore_case=ignore_case)
+        elif self._peek_word("BETWEEN"):
+            self.pos += 1
+            low = self._value(column_type)
+            self._expect("AND")
+            high = self._value(column_type)
+            expr = (column >= low) & (column <= high)
+        else:
+            kind, op = self._next()
+            if op not in _COMPARISONS:
+                raise FilterError(f"Unsupported operator {op!r} in filter")
+            value = self._value(column_type)
+            expr = getattr(pc, _COMPARISONS[op])(column, value)
+        return ~expr if negate else expr
+
+
+# --- transformations ----------------------------------------------------------
+
+def _names(text: str) -> list[str]:
+    return [name.strip().strip("`") for name in text.split(",") if name.strip()]
+
+
+def _resolve(table: pa.Table, names: list[str]) -> list[str]:
+    """Map names case-insensitively onto the table's columns.
+
+    Raises:
+        KeyError: With the first name that is not a column.
+    """
+    lookup = {name.lower(): name for name in table.column_names}
+    resolved = []
+    for name in names:
+        if name not in table.column_names and name.lower() not in lookup:
+            raise KeyError(name)
+        resolved.append(name if name in table.column_names else lookup[name.lower()])
+    return resolved
+
+
+def _parse_aggregations(table: pa.Table, text: str) -> list[tuple[str, str, str]]:
+    """Parse "sum(revenue) as total, count(*)" into (column, aggregate, output name)."""
+    specs = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        match = re.fullmatch(r"(\w+)\s*\(\s*(\*|`[^`]+`|[\w.]+)\s*\)(?:\s+as\s+(\w+))?", part, re.IGNORECASE)
+        if not match or match.group(1).lower() not in _AGGREGATES:
+            raise FilterError(
+                f"Cannot parse aggregation {part!r}; use e.g. sum(col), avg(col), count(*), "
+                f"with one of {', '.join(_AGGREGATES)}"
+            )
+        func, column, alias = match.group(1).lower(), match.group(2).strip("`"), match.group(3)
+        if column == "*":
+            if func != "count":
+                raise FilterError(f"{func}(*) is not supported; name a column")
+            specs.append(("*", "count_all", alias or "count"))
+            continue
+        column = _resolve(table, [column])[0]
+        specs.append((column, _AGGREGATES[func], alias or f"{func}_{column}"))
+    return specs
+
+
+def _aggregate(table: pa.Table, keys: list[str], specs: list[tuple[str, str, str]]) -> pa.Table:
+    aggregations = []
+    for column, func, _ in specs:
+        if func == "count_all":
+            aggregations.append(([], "count_all"))
+        else:
+            aggregations.append((column, func))
+    result = table.group_by(keys, use_threads=False).aggregate(aggregations)
+    # pyarrow names outputs "<column>_<func>" (or "count_all"); keys keep their names.
+    names = {
+        ("count_all" if func == "count_all" else f"{column}_{func}"): name
+        for column, func, name in specs
+    }
+    result = result.rename_columns([names.get(n, n) for n in result.column_names])
+    return result.select(keys + [name for _, _, name in specs])
+
+
+def _pivot(table: pa.Table, keys: list[str], pivot_column: str, spec: tuple[str, str, str]) -> pa.Table:
+    grouped = _aggregate(table, keys + [pivot_column], [spec])
+    pivot_values = pc.unique(grouped[pivot_column]).to_pylist()
+    if len(pivot_values) > MAX_PIVOT_VALUES:
+        raise FilterError(f"{pivot_column} has {len(pivot_values)} values; pivots are limited to {MAX_PIVOT_VALUES}")
+    value_name = spec[2]
+    rows: "OrderedDict[tuple, dict]" = OrderedDict()
+    for row in grouped.to_pylist():
+        key = tuple(row[k] for k in keys)
+        out = rows.setdefault(key, {k: row[k] for k in keys})
+        out[str(row[pivot_column])] = row[value_name]
+    columns = keys + [str(v) for v in pivot_values]
+    return pa.Table.from_pylist([{c: r.get(c) for c in columns} for r in rows.values()])
+
+
+def _sort_keys(table: pa.Table, text: str, descending: bool) -> list[tuple[str, str]]:
+    keys = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        words = part.split()
+        order = "descending" if descending else "ascending"
+        if len(words) > 1 and words[-1].lower() in ("asc", "desc"):
+            order = "descending" if words[-1].lower() == "desc" else "ascending"
+            words = words[:-1]
+        keys.append((_resolve(table, [" ".join(words).strip("`")])[0], order))
+    return keys
+
+
+@shaped_tool
+def transform_result(
+    tool_context: ToolContext,
+    result_id: str = "",
+    filter: str = "",
+    group_by: str = "",
+    aggregations: str = "",
+    pivot_column: str = "",
+    sort_by: str = "",
+    descending: bool = False,
+    columns: str = "",
+    limit: int = 0,
+) -> dict:
+    """
+    Answer a follow-up on a query result already fetched in this session, without re-querying.
+
+    Use for "sort by ...", "top 5", "only EMEA", "group by ...", "pivot by ..."
+    on the previous result. Steps run in this order: filter, group/pivot, sort,
+    columns, limit. Re-query only if this returns status "needs_requery".
+
+    Args:
+        tool_context: Context identifying the session.
+        result_id: Result to work on (from a previous call's `result_id`); empty for the latest.
+        filter: SQL-like condition, e.g. "region = 'EMEA' AND revenue > 1000"; supports
+            = != < <= > >=, IN (...), LIKE, BETWEEN, IS [NOT] NULL, AND, OR, NOT.
+        group_by: Comma-separated columns to group by.
+        aggregations: With group_by or pivot_column, e.g. "sum(revenue) as revenue, count(*)".
+            Functions: sum, avg, min, max, count, count_distinct, stddev, median.
+        pivot_column: Column whose values become columns (uses the first aggregation).
+        sort_by: Comma-separated columns, each optionally followed by asc/desc.
+        descending: Default order for sort_by columns without asc/desc.
+        columns: Comma-separated columns to keep.
+        limit: Maximum rows to return (e.g. 5 for "top 5"); 0 for all.
+
+    Returns:
+        The transformed rows (up to 50 shown), the total row count and a new
+        result_id for chaining; or "needs_requery" with the reason.
+    """
+    session_id = tool_context.session.id
+    frame = result_frames.get(session_id, result_id)
+    if frame is None:
+        return {
+            "status": "needs_requery",
+            "reason": f"No stored result {result_id!r} in this session." if result_id
+            else "No query result is stored in this session yet.",
+            "available_results": [f.describe() for f in result_frames.list(session_id)],
+        }
+    if not frame.complete and (filter or group_by or pivot_column or sort_by):
+        return {
+            "status": "needs_requery",
+            "reason": (
+                f"Result {frame.result_id} holds only the first {frame.table.num_rows} rows "
+                "(its query or transform had a LIMIT), so filtering, grouping or sorting it would be "
+                "incomplete. Re-run the query with the new condition instead."
+            ),
+            "query": frame.query,
+        }
+
+    started = time.perf_counter()
+    table = frame.table
+    try:
+        if filter:
+            table = table.filter(_FilterParser(filter, table.schema).parse())
+        if pivot_column:
+            specs = _parse_aggregations(table, aggregations or "count(*)")
+            table = _pivot(table, _resolve(table, _names(group_by)), _resolve(table, [pivot_column])[0], specs[0])
+        elif group_by or aggregations:
+            specs = _parse_aggregations(table, aggregations or "count(*)")
+            table = _aggregate(table, _resolve(table, _names(group_by)), specs)
+        if sort_by:
+            table = table.sort_by(_sort_keys(table, sort_by, descending))
+        if columns:
+            table = table.select(_resolve(table, _names(columns)))
+        truncated = 0 < limit < table.num_rows
+        if limit > 0:
+            table = table.slice(0, limit)
+    except KeyError as e:
+        return {
+            "status": "needs_requery",
+            "reason": f"Column {e.args[0]!r} was not fetched in result {frame.result_id}.",
+            "available_columns": frame.table.column_names,
+            "query": frame.query,
+        }
+    except (FilterError, pa.ArrowException) as e:
+        return {"status": "error", "error": str(e), "available_columns": table.column_names}
+
+    # Rows dropped by `limit` would be missing from any later filter or aggregate.
+    derived = result_frames.add(
+        session_id,
+        table,
+        source=f"transform of {frame.result_id}",
+        query=frame.query,
+        complete=frame.complete and not truncated,
+    )
+    return {
+        "status": "success",
+        "result_id": derived.result_id,
+        "source_result_id": frame.result_id,
+        "row_count": table.num_rows,
+        "columns": table.column_names,
+        "rows": json.loads(json.dumps(table.slice(0, RESULT_FRAMES_OUTPUT_ROWS).to_pylist(), default=str)),
+        "truncated": table.num_rows > RESULT_FRAMES_OUTPUT_ROWS,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,79 @@
+"""
+Runner construction for the non-interactive entry points.
+
+`adk web` and `adk run` build their own runner around `root_agent`. The batch
+mode, the server and any other programmatic entry point use `build_runner` so
+that every caller gets the same app name and session/artifact services.
+
+Sessions and artifacts are in-process by default. Set SESSION_DB_URL (e.g.
+"sqlite+aiosqlite:///sessions.db" or a Postgres URL) and ARTIFACT_BUCKET to
+share them between server worker processes.
+"""
+
+import os
+
+from google.adk.artifacts import BaseArtifactService
+from google.adk.artifacts import GcsArtifactService
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from .agent import root_agent
+
+APP_NAME = os.getenv("APP_NAME", "bq_multi_agent_app")
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "")
+ARTIFACT_BUCKET = os.getenv("ARTIFACT_BUCKET", "")
+
+
+def default_session_service() -> BaseSessionService:
+    """Database-backed sessions if SESSION_DB_URL is set, else in-memory."""
+    if SESSION_DB_URL:
+        # Imported lazily: needs SQLAlchemy and the URL's async driver.
+        from google.adk.sessions import DatabaseSessionService
+
+        return DatabaseSessionService(db_url=SESSION_DB_URL)
+    return InMemorySessionService()
+
+
+def default_artifact_service() -> BaseArtifactService:
+    """GCS-backed artifacts if ARTIFACT_BUCKET is set, else in-memory."""
+    if ARTIFACT_BUCKET:
+        return GcsArtifactService(bucket_name=ARTIFACT_BUCKET)
+    return InMemoryArtifactService()
+
+
+def build_runner(session_service: BaseSessionService | None = None) -> Runner:
+    """Create a Runner for the root agent.
+
+    Args:
+        session_service: Session service to use. Defaults to
+            `default_session_service()`.
+
+    Returns:
+        A Runner wired to `root_agent`.
+    """
+    return Runner(
+        agent=root_agent,
+        app_name=APP_NAME,
+        session_service=session_service or default_session_service(),
+        artifact_service=default_artifact_service(),
+    )
+
+
+async def ensure_session(runner: Runner, user_id: str, session_id: str):
+    """Return the session with the given ID, creating it if it does not exist."""
+    session = await runner.session_service.get_session(
+        app_name=runner.app_name, user_id=user_id, session_id=session_id
+    )
+    if session is None:
+        session = await runner.session_service.create_session(
+            app_name=runner.app_name, user_id=user_id, session_id=session_id
+        )
+    return session
+
+
+def user_message(text: str) -> types.Content:
+    """Wrap plain text as a user message for `Runner.run_async`."""
+    return types.Content(role="user", parts=[types.Part(text=text)])
@@ -0,0 +1,312 @@
+"""
+HTTP serving entry point for the root agent.
+
+Endpoints:
+
+    POST /run      body {"question": ..., "session_id": ..., "user_id": ...}
+                   response: JSON with the answer, session ID and turn usage
+    POST /stream   same body; response: text/event-stream, one `event: <type>`
+                   per progress event of `streaming.stream_turn`
+    WS   /ws       send the same JSON per question; receive one JSON message
+                   per event, ending with a "turn_end" (or "error") message
+    GET  /healthz  liveness: the process is up
+    GET  /readyz   readiness: warmup finished and the worker is not draining
+
+Send `X-Profile: 1` on /run, /stream or the /ws handshake to profile the
+turn(s); see `profiling` for where the flamegraphs are saved.
+
+Each worker preloads the agents at import and runs `warmup.warm_up` (MCP
+sessions, tool manifests, clients, local stores) before reporting ready. If a
+toolbox toolset cannot be reached, warmup is retried every
+SERVER_WARMUP_RETRY_SECONDS and the worker stays unready while
+SERVER_REQUIRE_TOOLBOX is set.
+
+At most SERVER_MAX_CONCURRENT_TURNS turns run per worker; further requests
+wait up to SERVER_QUEUE_TIMEOUT_SECONDS and are then rejected with 503. On
+shutdown the worker reports unready, waits up to SERVER_DRAIN_SECONDS for
+running turns and closes the runner and its MCP sessions.
+
+Run with `python main.py serve --workers 4`, or for development:
+
+    uvicorn bq_multi_agent_app.server:app --port 8080
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi import Header
+from fastapi import HTTPException
+from fastapi import WebSocket
+from fastapi import WebSocketDisconnect
+from fastapi.responses import JSONResponse
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from pydantic import ValidationError
+
+from .admission import snapshot as admission_snapshot
+from .analysis_cache import ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS
+from .analysis_cache import run_precompute_loop
+from .catalog_index import CATALOG_CRAWL_INTERVAL_SECONDS
+from .catalog_index import CATALOG_INDEX_ENABLED
+from .catalog_index import catalog_index
+from .catalog_index import run_crawl_loop
+from .profiling import PROFILE_HEADER
+from .runner import build_runner
+from .streaming import stream_turn
+from .warmup import warm_up
+
+logger = logging.getLogger(__name__)
+
+SERVER_MAX_CONCURRENT_TURNS = int(os.getenv("SERVER_MAX_CONCURRENT_TURNS", "16"))
+SERVER_QUEUE_TIMEOUT_SECONDS = float(os.getenv("SERVER_QUEUE_TIMEOUT_SECONDS", "10"))
+SERVER_REQUIRE_TOOLBOX = os.getenv("SERVER_REQUIRE_TOOLBOX", "true").lower() == "true"
+SERVER_WARMUP_RETRY_SECONDS = float(os.getenv("SERVER_WARMUP_RETRY_SECONDS", "10"))
+SERVER_DRAIN_SECONDS = float(os.getenv("SERVER_DRAIN_SECONDS", "30"))
+
+DEFAULT_USER_ID = "stream_user"
+
+
+class TurnRequest(BaseModel):
+    """One question to run."""
+
+    question: str
+    session_id: str | None = None
+    user_id: str = DEFAULT_USER_ID
+
+
+class Overloaded(Exception):
+    """No turn slot became free within the queue timeout."""
+
+
+class TurnLimiter:
+    """Bounds the turns running in this worker and tracks queueing."""
+
+    def __init__(self, max_concurrent: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.completed = 0
+
+    async def acquire(self) -> None:
+        """Take a turn slot.
+
+        Raises:
+            Overloaded: If no slot is free within the queue timeout.
+        """
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self) -> None:
+        self.running -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    async def drain(self, timeout: float) -> None:
+        """Wait until no turn is running, or `timeout` passes."""
+        deadline = time.monotonic() + timeout
+        while self.running and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if self.running:
+            logger.warning("Shutting down with %d turns still running", self.running)
+
+    def to_dict(self) -> dict:
+        return {
+            "max_concurrent_turns": self.max_concurrent,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+
+async def _warm_until_ready(app: FastAPI) -> None:
+    include_local_stores = True
+    while True:
+        app.state.warmup = await warm_up(include_local_stores)
+        include_local_stores = False
+        failed = [
+            step["name"] for step in app.state.warmup
+            if step["status"] != "ok" and step["name"].startswith("toolset:")
+        ]
+        if not failed or not SERVER_REQUIRE_TOOLBOX:
+            app.state.ready = True
+            logger.info("Worker %d ready", os.getpid())
+            return
+        logger.warning("Toolsets not reachable (%s); retrying warmup", ", ".join(failed))
+        await asyncio.sleep(SERVER_WARMUP_RETRY_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.draining = False
+    app.state.warmup = []
+    app.state.started_at = time.time()
+    app.state.limiter = TurnLimiter(SERVER_MAX_CONCURRENT_TURNS, SERVER_QUEUE_TIMEOUT_SECONDS)
+    app.state.runner = build_runner()
+    background = [asyncio.create_task(_warm_until_ready(app))]
+    if ANALYSIS_PRECOMPUTE_INTERVAL_SECONDS > 0:
+        background.append(asyncio.create_task(run_precompute_loop()))
+    if CATALOG_INDEX_ENABLED and CATALOG_CRAWL_INTERVAL_SECONDS > 0:
+        background.append(asyncio.create_task(run_crawl_loop()))
+    yield
+    app.state.ready = False
+    app.state.draining = True
+    await app.state.limiter.drain(SERVER_DRAIN_SECONDS)
+    for task in background:
+        task.cancel()
+    await app.state.runner.close()
+
+
+app = FastAPI(title="BigQuery and CloudSQL multi-agent app", lifespan=lifespan)
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def _overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many turns in progress, retry later.",
+        headers={"Retry-After": str(max(1, int(SERVER_QUEUE_TIMEOUT_SECONDS)))},
+    )
+
+
+@app.get("/healthz")
+async def healthz() -> dict:
+    """Liveness probe."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    """Readiness probe: 200 once warmed up, 503 while warming up or draining."""
+    ready = app.state.ready and not app.state.draining
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else ("draining" if app.state.draining else "warming_up"),
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - app.state.started_at, 1),
+            "turns": app.state.limiter.to_dict(),
+            "admission": admission_snapshot(),
+            "catalog_index": catalog_index.to_dict(),
+            "warmup": app.state.warmup,
+        },
+    )
+
+
+def _wants_profile(value: str | None) -> bool:
+    return (value or "").lower() in ("1", "true", "yes")
+
+
+@app.post("/run")
+async def run(request: TurnRequest, x_profile: str | None = Header(default=None)) -> dict:
+    """Run a question and return the final answer."""
+    session_id = request.session_id or f"run-{uuid.uuid4().hex}"
+    try:
+        await app.state.limiter.acquire()
+    except Overloaded:
+        raise _overloaded()
+    answer, turn_end, profile, error = "", {}, None, None
+    try:
+        async for event in stream_turn(
+            app.state.runner, request.user_id, session_id, request.question, profile=_wants_profile(x_profile)
+        ):
+            if event["type"] == "answer":
+                answer = event["text"]
+            elif event["type"] == "profile":
+                profile = event
+            elif event["type"] == "turn_end":
+                turn_end = event
+            elif event["type"] == "error":
+                error = event["error"]
+    finally:
+        app.state.limiter.release()
+    if error:
+        raise HTTPException(status_code=500, detail=error)
+    response = {
+        "session_id": session_id,
+        "answer": answer,
+        "duration_s": turn_end.get("t"),
+        "usage": turn_end.get("usage"),
+    }
+    if profile:
+        response["profile"] = {k: v for k, v in profile.items() if k not in ("type", "t")}
+    return response
+
+
+@app.post("/stream")
+async def stream(request: TurnRequest, x_profile: str | None = Header(default=None)) -> StreamingResponse:
+    """Run a question and stream its progress events as Server-Sent Events."""
+    session_id = request.session_id or f"stream-{uuid.uuid4().hex}"
+    try:
+        await app.state.limiter.acquire()
+    except Overloaded:
+        raise _overloaded()
+
+    async def events():
+        try:
+            async for event in stream_turn(
+                app.state.runner, request.user_id, session_id, request.question, profile=_wants_profile(x_profile)
+            ):
+                yield _sse(event)
+        finally:
+            app.state.limiter.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so each event reaches the client immediately.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws")
+async def websocket_stream(websocket: WebSocket):
+    """Run questions sent over the socket, streaming each turn's events back."""
+    await websocket.accept()
+    default_session = f"stream-{uuid.uuid4().hex}"
+    profile = _wants_profile(websocket.headers.get(PROFILE_HEADER))
+    try:
+        while True:
+            try:
+                request = TurnRequest.model_validate(await websocket.receive_json())
+            except (ValidationError, ValueError) as e:
+                await websocket.send_text(json.dumps({"type": "error", "error": str(e)}))
+                continue
+            try:
+                await app.state.limiter.acquire()
+            except Overloaded:
+                await websocket.send_text(json.dumps({"type": "error", "error": "Too many turns in progress, retry later."}))
+                continue
+            try:
+                async for event in stream_turn(
+                    app.state.runner,
+                    request.user_id,
+                    request.session_id or default_session,
+                    request.question,
+                    profile=profile,
+                ):
+                    await websocket.send_text(json.dumps(event, default=str))
+            finally:
+                app.state.limiter.release()
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,87 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When many sessions ask the same thing at once (dashboards refreshing, the
+start of business hours), identical read-only calls would otherwise all run.
+`SingleFlight.do` runs the first call for a key and lets concurrent callers
+with the same key await its result instead of starting their own. Once the
+call finishes, the next call with that key runs again: this shares work
+between callers in flight, it is not a cache.
+
+Used for read-only toolbox calls (see `toolbox.ResilientTool`, keyed by tool
+name and canonicalized arguments) and for `rag_response`. Calls with side
+effects must never go through it. Set SINGLEFLIGHT_ENABLED=false to disable.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+from opentelemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+_meter = metrics.get_meter(__name__)
+_coalesced_counter = _meter.create_counter(
+    "tool.singleflight.coalesced", description="Calls served by an identical call in flight, by tool"
+)
+
+
+class _Flight:
+    """A running call and the number of callers awaiting it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key within one worker."""
+
+    def __init__(self):
+        self._flights: dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def _finish(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]], label: str = "") -> Any:
+        """Run `call`, or await the identical call already running under `key`.
+
+        Callers that joined a running call get a deep copy of its result, so
+        later callbacks cannot mutate each other's responses.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return await call()
+        flight = self._flights.get(key)
+        leader = flight is None or flight.task.cancelled()
+        if leader:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, flight=flight: self._finish(key, flight))
+        else:
+            self.coalesced += 1
+            _coalesced_counter.add(1, {"tool": label or key.split(":", 1)[0]})
+            logger.debug("Coalesced call %s", key)
+        flight.waiters += 1
+        try:
+            # Shielded: one caller being cancelled must not cancel the call for the others.
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+        return result if leader else copy.deepcopy(result)
+
+
+single_flight = SingleFlight()
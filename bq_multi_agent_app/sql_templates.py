@@ -0,0 +1,557 @@
+"""
+Validated NL-to-SQL templates for repeated question shapes.
+
+Without templates every question regenerates its SQL from scratch, including
+schema discovery, even for question shapes answered correctly many times.
+Each read-only `bigquery-execute-sql` or `postgres-execute-sql` call that
+succeeds with rows is stored as a template of the user's question and the
+query (the last successful query of a turn wins). Literals of the question
+that also appear in the SQL become parameters:
+- ISO dates ("2024-03-31"),
+- years and other numbers (IDs, "top 10" -> LIMIT 10),
+- SQL string literals named in the question ("EMEA", "north america"),
+so "revenue for EMEA in 2024" and "revenue for APAC in 2023" share one
+template. Each template counts its successful and failed executions.
+
+At the start of a turn:
+- if the question matches a template's shape exactly, the template has
+  succeeded at least SQL_TEMPLATES_DIRECT_MIN_SUCCESSES times and failed less
+  often than it succeeded, and the catalog index (see `catalog_index.py`) ranks
+  one of its tables among those relevant to the question, its SQL is
+  instantiated with the question's values and the agent is told to run it
+  directly, skipping discovery (speculative prefetch is skipped too);
+- otherwise up to SQL_TEMPLATES_EXAMPLES templates whose question embedding is
+  within SQL_TEMPLATES_MIN_SIMILARITY are added to the model request as
+  few-shot examples, along with the tables they used.
+Queries with dates or years the question did not mention were built from
+relative dates ("last month"); such templates are only instantiated on the
+day they were validated, and otherwise serve as examples.
+
+Follow-up questions ("and for APAC?") depend on the conversation before them,
+so they are never stored and only get examples. Templates are scoped to the
+tenant (the "tenant" session state key, see `admission.py`) whose users asked
+them, since their questions are shown to the model.
+
+Question embeddings are shared with the answer cache (same model, and the
+turn's embedding is reused when the answer cache already computed it).
+Entries are kept in memory and persisted to SQLite (see `local_store.py`).
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+import numpy as np
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.models import LlmRequest
+from google.adk.models import LlmResponse
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+from opentelemetry import metrics
+
+from .admission import DEFAULT_TENANT
+from .admission import principal_for
+from .answer_cache import DATE_LITERAL
+from .answer_cache import NUMBER_LITERAL
+from .answer_cache import answer_cache
+from .answer_cache import is_follow_up
+from .answer_cache import normalize_question
+from .answer_cache import tables_in_sql
+from .answer_cache import turn_embedding
+from .catalog_index import BIGQUERY
+from .catalog_index import POSTGRES
+from .catalog_index import catalog_index
+from .local_store import open_db
+from .metadata_cache import is_error_response
+from .toolbox import is_read_only_sql
+from .toolbox import response_rows
+
+logger = logging.getLogger(__name__)
+
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES_ENABLED", "true").lower() == "true"
+SQL_TEMPLATES_MIN_SIMILARITY = float(os.getenv("SQL_TEMPLATES_MIN_SIMILARITY", "0.8"))
+SQL_TEMPLATES_EXAMPLES = int(os.getenv("SQL_TEMPLATES_EXAMPLES", "3"))
+SQL_TEMPLATES_DIRECT_MIN_SUCCESSES = int(os.getenv("SQL_TEMPLATES_DIRECT_MIN_SUCCESSES", "2"))
+SQL_TEMPLATES_MAX_ENTRIES = int(os.getenv("SQL_TEMPLATES_MAX_ENTRIES", "2000"))
+
+# Session state key holding the templates found for the current turn.
+SQL_TEMPLATES_KEY = "sql_templates:turn"
+
+SQL_TEMPLATE_TOOLS = {"bigquery-execute-sql", "postgres-execute-sql"}
+# Catalog index source of each tool's tables.
+_CATALOG_SOURCES = {"bigquery-execute-sql": BIGQUERY, "postgres-execute-sql": POSTGRES}
+# Queries over system catalogs are discovery, not answers.
+_SYSTEM_SCHEMAS = re.compile(r"\b(INFORMATION_SCHEMA|pg_catalog|pg_stat\w*|__TABLES__)\b", re.IGNORECASE)
+_PG_TABLE_IN_SQL = re.compile(r'(?:\bFROM|\bJOIN)\s+((?:"?\w+"?\.)?"?\w+"?)', re.IGNORECASE)
+
+_YEAR = re.compile(r"^(19|20)\d{2}$")
+_SQL_STRING = re.compile(r"'((?:[^'\\]|\\.)*)'")
+_SQL_QUOTED = re.compile(r"'(?:[^'\\]|\\.)*'|`[^`]*`|\"[^\"]*\"")
+_SQL_YEAR = re.compile(r"(?<![\w.])(19|20)\d{2}(?![\w.])")
+_SLOT_PATTERNS = {
+    "date": r"\d{4}-\d{2}-\d{2}",
+    "year": r"(?:19|20)\d{2}",
+    "number": r"\d+(?:\.\d+)?",
+    # No quotes or backslashes, so values cannot break out of SQL literals.
+    "string": r"\w[\w .&/-]*?",
+}
+_CASES = {"upper": str.upper, "lower": str.lower, "title": str.title}
+
+_meter = metrics.get_meter(__name__)
+_match_counter = _meter.create_counter(
+    "sql_templates.matches", description="Turns with SQL template matches, by kind (direct, examples, none)"
+)
+
+
+def _mask_quoted(sql: str) -> str:
+    """`sql` with string literals and quoted identifiers blanked out."""
+    return _SQL_QUOTED.sub(lambda m: " " * len(m.group(0)), sql)
+
+
+def parameterize(question: str, sql: str) -> tuple[str, str, list[dict], bool]:
+    """Turn a question and its SQL into a question shape and an SQL template.
+
+    Returns:
+        The question shape and SQL with `{pN}` placeholders, the slots
+        (name, kind, case) and whether the SQL still has date or year
+        literals the question did not mention.
+    """
+    shape = normalize_question(question)
+    sql = sql.strip().rstrip(";")
+    slots = []
+
+    def add_slot(kind: str, case: str = "") -> str:
+        name = f"p{len(slots) + 1}"
+        slots.append({"name": name, "kind": kind, "case": case})
+        return "{" + name + "}"
+
+    for value in dict.fromkeys(DATE_LITERAL.findall(shape)):
+        if value in sql:
+            placeholder = add_slot("date")
+            shape = shape.replace(value, placeholder)
+            sql = sql.replace(value, placeholder)
+
+    for literal in dict.fromkeys(_SQL_STRING.findall(sql)):
+        if len(literal) < 2 or literal.isdigit() or "{" in literal:
+            continue
+        case = next((c for c, convert in _CASES.items() if convert(literal.lower()) == literal), None)
+        pattern = re.compile(rf"(?<!\w){re.escape(literal.lower())}(?!\w)")
+        if case is None or not re.fullmatch(_SLOT_PATTERNS["string"], literal) or not pattern.search(shape):
+            continue
+        placeholder = add_slot("string", case)
+        shape = pattern.sub(placeholder, shape)
+        sql = sql.replace(f"'{literal}'", f"'{placeholder}'")
+
+    for value in dict.fromkeys(NUMBER_LITERAL.findall(shape)):
+        occurrences = [m.start() for m in NUMBER_LITERAL.finditer(_mask_quoted(sql)) if m.group(0) == value]
+        # A one-digit number also appears in unrelated places (COUNT(1), ORDER BY 2).
+        if not occurrences or (len(value) < 2 and len(occurrences) > 1):
+            continue
+        placeholder = add_slot("year" if _YEAR.match(value) else "number")
+        shape = re.sub(rf"(?<![\w.{{-]){re.escape(value)}(?![\w.}}-])", placeholder, shape)
+        for start in reversed(occurrences):
+            sql = sql[:start] + placeholder + sql[start + len(value):]
+
+    relative = bool(DATE_LITERAL.search(sql) or _SQL_YEAR.search(_mask_quoted(sql)))
+    return shape, sql, slots, relative
+
+
+def tables_in_query(tool_name: str, sql: str) -> list[str]:
+    """Tables read by a query (best effort)."""
+    if tool_name == "bigquery-execute-sql":
+        return sorted(tables_in_sql(sql))
+    return sorted({match.replace('"', "") for match in _PG_TABLE_IN_SQL.findall(sql or "")})
+
+
+@dataclass
+class SqlTemplate:
+    """A validated question shape and the SQL that answered it."""
+
+    template_id: str
+    tool: str
+    question: str
+    shape: str
+    sql: str
+    slots: list[dict]
+    tables: list[str]
+    relative: bool
+    validated_on: str
+    successes: int = 1
+    failures: int = 0
+    updated_at: float = field(default_factory=time.time)
+    tenant: str = DEFAULT_TENANT
+    embedding: np.ndarray | None = None
+
+    def shape_regex(self) -> re.Pattern:
+        pattern = re.escape(self.shape)
+        for slot in self.slots:
+            placeholder = re.escape("{" + slot["name"] + "}")
+            group = f"(?P<{slot['name']}>{_SLOT_PATTERNS[slot['kind']]})"
+            # Repeated slots must repeat the same value.
+            pattern = pattern.replace(placeholder, group, 1).replace(placeholder, f"(?P={slot['name']})")
+        return re.compile(pattern)
+
+    def instantiate(self, question: str) -> str | None:
+        """The template's SQL for `question`, or None if the shape does not match."""
+        match = self.shape_regex().fullmatch(normalize_question(question))
+        if match is None:
+            return None
+        sql = self.sql
+        for slot in self.slots:
+            value = match.group(slot["name"])
+            if slot["kind"] == "string":
+                value = _CASES[slot["case"]](value)
+            sql = sql.replace("{" + slot["name"] + "}", value)
+        return sql
+
+    def trusted(self) -> bool:
+        """Validated often enough to be run without the model writing SQL."""
+        return (
+            self.successes >= SQL_TEMPLATES_DIRECT_MIN_SUCCESSES
+            and self.failures < self.successes
+            and (not self.relative or self.validated_on == datetime.date.today().isoformat())
+        )
+
+    def example(self) -> dict:
+        return {
+            "template_id": self.template_id,
+            "tool": self.tool,
+            "question": self.question,
+            "sql": self.sql if not self.slots else _example_sql(self),
+            "tables": self.tables,
+            "successes": self.successes,
+            "validated_on": self.validated_on,
+        }
+
+
+def _example_sql(template: SqlTemplate) -> str:
+    """The SQL of the last question the template answered (examples show real SQL)."""
+    return template.instantiate(template.question) or template.sql
+
+
+class SqlTemplateStore:
+    """Validated templates and their question embeddings, in memory and in SQLite."""
+
+    def __init__(self, db_name: str = "sql_templates"):
+        self._db_name = db_name
+        self._db = None
+        self._templates: dict[str, SqlTemplate] = {}
+        self._matrix: tuple[list[str], np.ndarray] | None = None
+        self._lock = threading.Lock()
+        self._record_lock = asyncio.Lock()
+        # (invocation ID, tool) -> template created by that turn, replaced by its later queries.
+        self._created: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS templates ("
+                " id TEXT PRIMARY KEY, template TEXT, embedding BLOB)"
+            )
+            for row in self._db.execute("SELECT * FROM templates ORDER BY rowid"):
+                template = SqlTemplate(**json.loads(row["template"]))
+                template.embedding = np.frombuffer(row["embedding"], dtype=np.float32)
+                self._templates[template.template_id] = template
+        return self._db
+
+    def load(self) -> int:
+        with self._lock:
+            self._conn()
+            return len(self._templates)
+
+    def get(self, template_id: str) -> SqlTemplate | None:
+        with self._lock:
+            self._conn()
+            return self._templates.get(template_id)
+
+    def _save(self, template: SqlTemplate) -> None:
+        data = asdict(template)
+        data.pop("embedding")
+        self._conn().execute(
+            "INSERT OR REPLACE INTO templates VALUES (?, ?, ?)",
+            (template.template_id, json.dumps(data), template.embedding.tobytes()),
+        )
+
+    def _remove(self, template_id: str) -> None:
+        self._templates.pop(template_id, None)
+        self._conn().execute("DELETE FROM templates WHERE id = ?", (template_id,))
+        self._matrix = None
+
+    def direct_match(self, question: str, tools: set[str], tenant: str) -> tuple[SqlTemplate, str] | None:
+        """The most validated trusted template whose shape matches `question`, and its SQL."""
+        with self._lock:
+            self._conn()
+            templates = [
+                t for t in self._templates.values() if t.tool in tools and t.tenant == tenant and t.trusted()
+            ]
+        best = None
+        for template in templates:
+            sql = template.instantiate(question)
+            if sql is not None and (best is None or template.successes > best[0].successes):
+                best = (template, sql)
+        return best
+
+    def similar(
+        self, embedding: np.ndarray, tools: set[str], limit: int, tenant: str
+    ) -> list[tuple[float, SqlTemplate]]:
+        """Templates whose question is within SQL_TEMPLATES_MIN_SIMILARITY, most similar first."""
+        with self._lock:
+            self._conn()
+            if self._matrix is None:
+                if not self._templates:
+                    return []
+                ids = list(self._templates)
+                self._matrix = (ids, np.vstack([self._templates[i].embedding for i in ids]))
+            ids, matrix = self._matrix
+            scores = matrix @ embedding
+            ranked = []
+            for i in np.argsort(-scores):
+                template = self._templates.get(ids[i])
+                if scores[i] < SQL_TEMPLATES_MIN_SIMILARITY or len(ranked) >= limit:
+                    break
+                if template is not None and template.tool in tools and template.tenant == tenant:
+                    ranked.append((float(scores[i]), template))
+        return ranked
+
+    async def record_success(
+        self, tool_name: str, question: str, sql: str, invocation_id: str, tenant: str
+    ) -> None:
+        """Store (or re-validate) the template of a successful query."""
+        shape, sql_template, slots, relative = parameterize(question, sql)
+        template_id = hashlib.sha1(f"{tenant}\n{tool_name}\n{shape}\n{sql_template}".encode()).hexdigest()[:16]
+        async with self._record_lock:
+            existing = self.get(template_id)
+            embedding = existing.embedding if existing is not None else await answer_cache.embed(question)
+            with self._lock:
+                turn = (invocation_id, tool_name)
+                previous = self._created.get(turn)
+                if previous is not None and previous != template_id:
+                    # A later query of the same turn answers the question better.
+                    self._remove(previous)
+                    del self._created[turn]
+                template = self._templates.get(template_id)
+                if template is None:
+                    template = SqlTemplate(
+                        template_id=template_id,
+                        tool=tool_name,
+                        question=question,
+                        shape=shape,
+                        sql=sql_template,
+                        slots=slots,
+                        tables=tables_in_query(tool_name, sql),
+                        relative=relative,
+                        validated_on=datetime.date.today().isoformat(),
+                        tenant=tenant,
+                        embedding=embedding,
+                    )
+                    self._templates[template_id] = template
+                    self._created[turn] = template_id
+                    while len(self._created) > 1000:
+                        self._created.popitem(last=False)
+                    self._matrix = None
+                elif self._created.get(turn) != template_id:
+                    template.successes += 1
+                    template.question = question
+                    template.validated_on = datetime.date.today().isoformat()
+                    template.updated_at = time.time()
+                self._save(template)
+                if len(self._templates) > SQL_TEMPLATES_MAX_ENTRIES:
+                    stalest = min(self._templates.values(), key=lambda t: t.updated_at)
+                    self._remove(stalest.template_id)
+
+    def record_failure(self, template_id: str) -> None:
+        """Count a failed run of a template's SQL; drop templates that fail more than they succeed."""
+        with self._lock:
+            template = self._templates.get(template_id)
+            if template is None:
+                return
+            template.failures += 1
+            if template.failures >= 2 and template.failures > template.successes:
+                logger.info("Dropping SQL template %s after %d failures", template_id, template.failures)
+                self._remove(template_id)
+            else:
+                self._save(template)
+
+
+sql_templates = SqlTemplateStore()
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _question_text(context: ReadonlyContext) -> str:
+    content = context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text).strip()
+
+
+def _normalize_sql(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql or "").strip().rstrip(";").strip()
+
+
+def _same_table(a: str, b: str) -> bool:
+    """True if two table references name the same table ("public.orders" / "orders")."""
+    a, b = a.lower(), b.lower()
+    return a == b or a.endswith(f".{b}") or b.endswith(f".{a}")
+
+
+async def _question_uses_tables(question: str, template: SqlTemplate) -> bool:
+    """True if the catalog index ranks one of the template's tables as relevant to `question`.
+
+    The question shape alone says nothing about the data it is about, so a
+    template is only run directly when the question points at its tables.
+    """
+    try:
+        relevant = await catalog_index.search(question, _CATALOG_SOURCES[template.tool])
+    except Exception as e:
+        logger.info("SQL templates: catalog search failed: %s", e)
+        return False
+    return any(_same_table(r["table"], table) for r in relevant for table in template.tables)
+
+
+async def find_sql_templates(callback_context: CallbackContext) -> None:
+    """before_agent_callback: look up templates for the turn's question.
+
+    Also called lazily from `inject_sql_templates`, for turns that start in a
+    sub-agent. Stores the result in the session state under SQL_TEMPLATES_KEY.
+    """
+    if not SQL_TEMPLATES_ENABLED:
+        return None
+    current = callback_context.state.get(SQL_TEMPLATES_KEY) or {}
+    if current.get("invocation_id") == callback_context.invocation_id:
+        return None
+    question = _question_text(callback_context)
+    tenant, _ = principal_for(callback_context)
+    found = {"invocation_id": callback_context.invocation_id, "direct": None, "examples": []}
+    if question:
+        match = None
+        if not is_follow_up(callback_context):
+            match = await asyncio.to_thread(sql_templates.direct_match, question, SQL_TEMPLATE_TOOLS, tenant)
+        if match is not None and await _question_uses_tables(question, match[0]):
+            template, sql = match
+            found["direct"] = {**template.example(), "sql": sql}
+        else:
+            embedding = turn_embedding(callback_context.invocation_id)
+            try:
+                if embedding is None:
+                    embedding = await answer_cache.embed(question)
+                similar = sql_templates.similar(embedding, SQL_TEMPLATE_TOOLS, SQL_TEMPLATES_EXAMPLES, tenant)
+            except Exception as e:
+                logger.warning("SQL templates: embedding failed: %s", e)
+                similar = []
+            found["examples"] = [
+                {**template.example(), "similarity": round(score, 3)} for score, template in similar
+            ]
+    kind = "direct" if found["direct"] else ("examples" if found["examples"] else "none")
+    _match_counter.add(1, {"kind": kind})
+    callback_context.state[SQL_TEMPLATES_KEY] = found
+    return None
+
+
+def has_direct_template(callback_context: CallbackContext) -> bool:
+    """True if the turn's question will be answered from a trusted template."""
+    found = callback_context.state.get(SQL_TEMPLATES_KEY) or {}
+    return found.get("invocation_id") == callback_context.invocation_id and bool(found.get("direct"))
+
+
+def _format_examples(found: dict, tools: set[str]) -> str:
+    direct = found.get("direct")
+    if direct and direct["tool"] in tools:
+        return f"""
+<VALIDATED_SQL_TEMPLATE>
+The user's question matches a validated question template (last used for "{direct['question']}", successful {direct['successes']} times).
+Run this SQL with `{direct['tool']}` directly, without schema discovery and without rewriting it:
+```sql
+{direct['sql']}
+```
+Tables: {', '.join(direct['tables'])}
+If it fails or its result does not answer the question, fall back to the normal discovery process.
+</VALIDATED_SQL_TEMPLATE>"""
+    examples = [e for e in found.get("examples", []) if e["tool"] in tools]
+    if not examples:
+        return ""
+    lines = [
+        "",
+        "<VALIDATED_SQL_EXAMPLES>",
+        "Similar questions were answered before with these queries, which ran successfully.",
+        "Reuse their tables, joins and filters and adapt the literals to the current question.",
+        "Their tables and columns are known to exist, so skip discovery for them unless the query fails.",
+        "Dates in examples were computed on the day they were validated.",
+    ]
+    for example in examples:
+        lines += [
+            f"- Question: \"{example['question']}\" (validated {example['validated_on']}, "
+            f"successful {example['successes']} times)",
+            f"  Tool: {example['tool']}; tables: {', '.join(example['tables'])}",
+            f"  SQL: {_normalize_sql(example['sql'])}",
+        ]
+    lines.append("</VALIDATED_SQL_EXAMPLES>")
+    return "\n".join(lines)
+
+
+async def inject_sql_templates(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+    """before_model_callback: add the turn's template or examples to the instructions."""
+    if not SQL_TEMPLATES_ENABLED:
+        return None
+    tools = SQL_TEMPLATE_TOOLS & set(llm_request.tools_dict)
+    if not tools:
+        return None
+    await find_sql_templates(callback_context)
+    text = _format_examples(callback_context.state.get(SQL_TEMPLATES_KEY) or {}, tools)
+    if text:
+        llm_request.append_instructions([text])
+    return None
+
+
+def record_sql_outcome(
+    tool: BaseTool,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+    tool_response: Any,
+) -> None:
+    """after_tool_callback: validate templates with the outcome of executed queries."""
+    if not SQL_TEMPLATES_ENABLED or tool.name not in SQL_TEMPLATE_TOOLS:
+        return None
+    sql = str(args.get("sql", ""))
+    if not is_read_only_sql(sql) or _SYSTEM_SCHEMAS.search(sql):
+        return None
+    if is_error_response(tool_response):
+        found = tool_context.state.get(SQL_TEMPLATES_KEY) or {}
+        direct = found.get("direct")
+        if (
+            found.get("invocation_id") == tool_context.invocation_id
+            and direct
+            and _normalize_sql(direct["sql"]) == _normalize_sql(sql)
+        ):
+            sql_templates.record_failure(direct["template_id"])
+        return None
+    question = _question_text(tool_context)
+    if not question or not response_rows(tool_response) or is_follow_up(tool_context):
+        return None
+    tenant, _ = principal_for(tool_context)
+    # Embedding the question is a remote call; keep it off the tool's path.
+    task = asyncio.create_task(
+        sql_templates.record_success(tool.name, question, sql, tool_context.invocation_id, tenant)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_log_record_failure)
+    return None
+
+
+def _log_record_failure(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("SQL templates: cannot store template: %s", task.exception())
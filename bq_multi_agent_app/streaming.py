@@ -0,0 +1,220 @@
+"""
+Streaming of structured progress events for one user turn.
+
+`stream_turn` runs a question through the root agent and yields events as
+they happen instead of only the final answer:
+
+    turn_start     the turn was accepted
+    tool_start     an agent called a tool (name, agent, args)
+    tool_progress  a running tool reported progress (e.g. rows exported)
+    heartbeat      nothing happened for a while; lists the tools still running
+    tool_end       a tool returned (duration, status, row count)
+    table          a tool returned tabular data (columns, row count, first rows)
+    transfer       control moved to another agent
+    token          a chunk of model text, as soon as the model produces it
+    answer         the final answer text of the turn
+    profile        the turn was profiled (trace ID, summary, artifact names)
+    turn_end       the turn finished (duration, time to first token, usage)
+    error          the turn failed
+
+Tools and callbacks publish their own progress with `progress.emit_progress`.
+"""
+
+import asyncio
+import json
+import os
+import time
+from contextlib import nullcontext
+from typing import Any
+from typing import AsyncIterator
+
+from google.adk.agents import RunConfig
+from google.adk.agents.run_config import StreamingMode
+from google.adk.events import Event
+from google.adk.runners import Runner
+
+from .budget import TURN_USAGE_KEY
+from .data_files import rows_from_json
+from .metadata_cache import is_error_response
+from .profiling import claim_profiler
+from .profiling import release_profiler
+from .profiling import save_profile
+from .profiling import should_profile
+from .progress import STREAM_CHANNEL_KEY
+from .progress import close_channel
+from .progress import open_channel
+from .runner import ensure_session
+from .runner import user_message
+
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "5"))
+STREAM_TABLE_PREVIEW_ROWS = int(os.getenv("STREAM_TABLE_PREVIEW_ROWS", "5"))
+
+MAX_EVENT_ARG_CHARS = 500
+_END = object()
+
+
+def _short(value: Any) -> Any:
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    if len(text) <= MAX_EVENT_ARG_CHARS:
+        return value
+    return text[:MAX_EVENT_ARG_CHARS] + "..."
+
+
+def _table_event(tool_name: str, response: Any) -> dict | None:
+    rows = rows_from_json(response)
+    if not rows:
+        return None
+    return {
+        "type": "table",
+        "tool": tool_name,
+        "columns": list(rows[0].keys()),
+        "row_count": len(rows),
+        "rows": json.loads(json.dumps(rows[:STREAM_TABLE_PREVIEW_ROWS], default=str)),
+    }
+
+
+class _TurnState:
+    """Bookkeeping needed to turn runner events into stream events."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_s: float | None = None
+        self.running: dict[str, dict] = {}
+        self.agent: str | None = None
+        self.answer = ""
+
+    def elapsed(self) -> float:
+        return round(time.monotonic() - self.started, 3)
+
+    def events_for(self, event: Event) -> list[dict]:
+        out = []
+        if event.author and event.author != "user" and event.author != self.agent:
+            if self.agent is not None:
+                out.append({"type": "transfer", "agent": event.author})
+            self.agent = event.author
+
+        if event.partial:
+            parts = event.content.parts if event.content and event.content.parts else []
+            text = "".join(part.text or "" for part in parts if not part.thought)
+            if text:
+                if self.first_token_s is None:
+                    self.first_token_s = self.elapsed()
+                out.append({"type": "token", "agent": event.author, "text": text})
+            return out
+
+        for call in event.get_function_calls():
+            self.running[call.id] = {"tool": call.name, "started": time.monotonic()}
+            out.append({
+                "type": "tool_start",
+                "agent": event.author,
+                "tool": call.name,
+                "call_id": call.id,
+                "args": {k: _short(v) for k, v in (call.args or {}).items()},
+            })
+
+        for response in event.get_function_responses():
+            call = self.running.pop(response.id, None)
+            tool = call["tool"] if call else response.name
+            payload = response.response
+            rows = rows_from_json(payload)
+            failed = is_error_response(payload) or (
+                isinstance(payload, dict) and payload.get("status") in ("error", "cancelled")
+            )
+            tool_end = {
+                "type": "tool_end",
+                "agent": event.author,
+                "tool": tool,
+                "call_id": response.id,
+                "status": "error" if failed else "ok",
+                "duration_s": round(time.monotonic() - call["started"], 3) if call else None,
+            }
+            if rows is not None:
+                tool_end["row_count"] = len(rows)
+            elif isinstance(payload, dict) and isinstance(payload.get("rows"), int):
+                tool_end["row_count"] = payload["rows"]
+            out.append(tool_end)
+            table = _table_event(tool, payload) if not failed else None
+            if table:
+                out.append(table)
+
+        if event.is_final_response() and event.content and event.content.parts:
+            text = "".join(part.text or "" for part in event.content.parts if not part.thought)
+            if text:
+                if self.first_token_s is None:
+                    self.first_token_s = self.elapsed()
+                self.answer = text
+                out.append({"type": "answer", "agent": event.author, "text": text})
+        return out
+
+
+async def stream_turn(
+    runner: Runner,
+    user_id: str,
+    session_id: str,
+    question: str,
+    profile: bool = False,
+) -> AsyncIterator[dict]:
+    """Run one question and yield structured progress events as they occur.
+
+    Every event carries `t`, the seconds since the turn started. Cancelling
+    the iteration (e.g. on client disconnect) cancels the turn. With
+    `profile` (or when `profiling.should_profile` selects the turn), the turn
+    is profiled and a "profile" event precedes "turn_end".
+    """
+    session = await ensure_session(runner, user_id, session_id)
+    profiler = claim_profiler() if should_profile(profile, session.state) else None
+    channel_id, queue = open_channel()
+    turn = _TurnState()
+
+    async def produce():
+        try:
+            with profiler.traced() if profiler else nullcontext():
+                async for event in runner.run_async(
+                    user_id=user_id,
+                    session_id=session_id,
+                    new_message=user_message(question),
+                    state_delta={STREAM_CHANNEL_KEY: channel_id},
+                    run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+                ):
+                    for item in turn.events_for(event):
+                        queue.put_nowait(item)
+        except Exception as e:
+            queue.put_nowait({"type": "error", "error": f"{type(e).__name__}: {e}"})
+        finally:
+            queue.put_nowait(_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        yield {"type": "turn_start", "t": 0.0, "session_id": session_id}
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                now = time.monotonic()
+                item = {
+                    "type": "heartbeat",
+                    "running": [
+                        {"tool": c["tool"], "elapsed_s": round(now - c["started"], 1)}
+                        for c in turn.running.values()
+                    ],
+                }
+            if item is _END:
+                break
+            yield {**item, "t": turn.elapsed()}
+
+        if profiler is not None:
+            yield {"type": "profile", "t": turn.elapsed(), **await save_profile(runner, user_id, session_id, profiler)}
+        session = await runner.session_service.get_session(
+            app_name=runner.app_name, user_id=user_id, session_id=session_id
+        )
+        yield {
+            "type": "turn_end",
+            "t": turn.elapsed(),
+            "first_token_s": turn.first_token_s,
+            "usage": session.state.get(TURN_USAGE_KEY) if session else None,
+        }
+    finally:
+        producer.cancel()
+        close_channel(channel_id)
+        if profiler is not None:
+            release_profiler()
@@ -9,18 +9,44 @@ import os
 
 from google.adk.agents import Agent
 
+from ...admission import AdmittedGemini
+from ...admission import bind_principal
+from ...budget import budget_model_call
+from ...budget import budget_tool_call
+from ...budget import record_model_usage
+from ...budget import record_tool_latency
+from ...budget import start_turn
+from ...transfer_brief import build_transfer_brief
 from .prompts import return_instructions_bqml
+from .tools import batch_predict
 from .tools import bqml_toolset
+from .tools import cancel_bqml_job
 from .tools import check_bq_models
+from .tools import check_bqml_job
+from .tools import list_bqml_jobs
 from .tools import rag_response
+from .tools import submit_bqml_job
 
 root_agent = Agent(
-    model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro"),
+    model=AdmittedGemini(model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro")),
     name="bqml_agent",
     instruction=return_instructions_bqml(),
     tools=[
         bqml_toolset,      # MCP toolset for BigQuery SQL/BQML execution
         check_bq_models,   # List existing BQML models
         rag_response,      # Query BQML documentation
+        submit_bqml_job,   # Training/evaluation as background jobs
+        check_bqml_job,
+        list_bqml_jobs,
+        cancel_bqml_job,
+        batch_predict,     # ML.PREDICT into a table, summary only
     ],
+    # Later turns start here directly, so the principal is bound here too for
+    # admission control; per-turn budget accounting and degraded modes; inherited
+    # history is condensed into a brief before each model call
+    before_agent_callback=[bind_principal, start_turn],
+    before_model_callback=[budget_model_call, build_transfer_brief],
+    after_model_callback=record_model_usage,
+    before_tool_callback=budget_tool_call,
+    after_tool_callback=record_tool_latency,
 )
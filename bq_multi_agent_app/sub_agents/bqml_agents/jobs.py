@@ -0,0 +1,384 @@
+"""
+Background BigQuery jobs for BQML training and evaluation.
+
+`CREATE MODEL` can run for minutes or hours. Run through `bigquery-execute-sql`
+it holds the agent turn (and a server worker slot) until training finishes.
+Instead, `submit` starts the statement as a BigQuery job and returns its
+handle immediately, and a poller task in this process tracks every running
+job with exponential backoff (BQML_JOB_POLL_INITIAL_SECONDS, growing by
+BQML_JOB_POLL_BACKOFF up to BQML_JOB_POLL_MAX_SECONDS).
+
+When a job finishes, a completion event (with the job summary in the
+`bqml_jobs` session state) is appended to the session that
+submitted it, so the next turn and any client listing the session see the
+outcome. The event is held back while a turn is still running in that
+session, unless the session has been quiet for BQML_JOB_NOTIFY_IDLE_SECONDS.
+
+Jobs are persisted to SQLite (see `local_store.py`): after a restart, and on
+other server workers sharing the file, jobs are read from there and can be
+checked, listed and cancelled, but their completion events can only be
+delivered by the process that submitted them.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from google.adk.events import Event
+from google.adk.events import EventActions
+from google.adk.sessions import BaseSessionService
+from google.cloud import bigquery
+from google.genai import types
+
+from ...bq_storage import get_clients
+from ...local_store import open_db
+from ...toolbox import is_read_only_sql
+
+logger = logging.getLogger(__name__)
+
+BQML_JOB_POLL_INITIAL_SECONDS = float(os.getenv("BQML_JOB_POLL_INITIAL_SECONDS", "5"))
+BQML_JOB_POLL_MAX_SECONDS = float(os.getenv("BQML_JOB_POLL_MAX_SECONDS", "60"))
+BQML_JOB_POLL_BACKOFF = float(os.getenv("BQML_JOB_POLL_BACKOFF", "1.5"))
+BQML_JOB_NOTIFY_IDLE_SECONDS = float(os.getenv("BQML_JOB_NOTIFY_IDLE_SECONDS", "120"))
+BQML_JOB_RESULT_ROWS = int(os.getenv("BQML_JOB_RESULT_ROWS", "20"))
+BQML_JOB_RETENTION_SECONDS = float(os.getenv("BQML_JOB_RETENTION_SECONDS", "604800"))
+
+# Session state key with a summary of the session's jobs, by job ID.
+JOBS_STATE_KEY = "bqml_jobs"
+
+# Delayed completion notifications; referenced until they finish.
+_background_tasks: set[asyncio.Task] = set()
+
+_CREATE_MODEL = re.compile(
+    r"^\s*CREATE\s+(?:OR\s+REPLACE\s+)?MODEL\s+(?:IF\s+NOT\s+EXISTS\s+)?`?([\w.\-]+)`?",
+    re.IGNORECASE,
+)
+_EVALUATION_FUNCTIONS = re.compile(
+    r"\bML\.(EVALUATE|ARIMA_EVALUATE|CONFUSION_MATRIX|ROC_CURVE|TRAINING_INFO"
+    r"|FEATURE_IMPORTANCE|GLOBAL_EXPLAIN|ARIMA_COEFFICIENTS)\s*\(\s*MODEL\s+`?([\w.\-]+)`?",
+    re.IGNORECASE,
+)
+
+
+class JobRejected(Exception):
+    """The statement cannot run as a background BQML job."""
+
+
+def classify_statement(sql: str) -> tuple[str, str]:
+    """Return the job kind ("training" or "evaluation") and model of `sql`.
+
+    Raises:
+        JobRejected: For statements that are neither CREATE MODEL nor a
+            read-only query over an ML evaluation function.
+    """
+    match = _CREATE_MODEL.match(sql)
+    if match:
+        return "training", match.group(1)
+    match = _EVALUATION_FUNCTIONS.search(sql)
+    if match and is_read_only_sql(sql):
+        return "evaluation", match.group(2)
+    raise JobRejected(
+        "Only CREATE MODEL statements and queries over ML.EVALUATE (or another ML "
+        "evaluation function) run as background jobs; use bigquery-execute-sql for other SQL."
+    )
+
+
+@dataclass
+class BqmlJob:
+    """A submitted BQML job and the session that owns it."""
+
+    job_id: str
+    location: str
+    kind: str
+    model: str
+    sql: str
+    app_name: str
+    user_id: str
+    session_id: str
+    state: str = "PENDING"
+    error: str | None = None
+    submitted_at: float = field(default_factory=time.time)
+    finished_at: float | None = None
+    bytes_processed: int | None = None
+    slot_ms: int | None = None
+    iterations: int | None = None
+    result: list[dict] | None = None
+    notified: bool = False
+    # Polling state, not persisted.
+    poll_interval: float = BQML_JOB_POLL_INITIAL_SECONDS
+    next_poll_at: float = 0.0
+
+    @property
+    def finished(self) -> bool:
+        return self.state == "DONE"
+
+    @property
+    def outcome(self) -> str:
+        if not self.finished:
+            return self.state.lower()
+        return "failed" if self.error else "succeeded"
+
+    def to_dict(self) -> dict[str, Any]:
+        end = self.finished_at or time.time()
+        summary = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "model": self.model,
+            "status": self.outcome,
+            "elapsed_s": round(end - self.submitted_at, 1),
+        }
+        for key in ("error", "bytes_processed", "slot_ms", "iterations", "result"):
+            value = getattr(self, key)
+            if value is not None:
+                summary[key] = value
+        return summary
+
+
+_PERSISTED_FIELDS = [
+    "job_id", "location", "kind", "model", "sql", "app_name", "user_id", "session_id",
+    "state", "error", "submitted_at", "finished_at", "bytes_processed", "slot_ms",
+    "iterations", "result", "notified",
+]
+
+
+def _job_from_row(row) -> BqmlJob:
+    values = dict(row)
+    values["result"] = json.loads(values["result"]) if values["result"] else None
+    values["notified"] = bool(values["notified"])
+    return BqmlJob(**values)
+
+
+def _is_turn_running(session) -> bool:
+    """Whether a turn still appears to be running in `session`."""
+    if not session.events:
+        return False
+    last = session.events[-1]
+    if time.time() - last.timestamp > BQML_JOB_NOTIFY_IDLE_SECONDS:
+        return False
+    return not last.is_final_response() or last.author == "user"
+
+
+def _completion_text(job: BqmlJob) -> str:
+    action = "Training of model" if job.kind == "training" else "Evaluation of model"
+    minutes = round(((job.finished_at or time.time()) - job.submitted_at) / 60, 1)
+    if job.error:
+        return f"Background job {job.job_id}: {action} `{job.model}` failed after {minutes} min: {job.error}"
+    text = f"Background job {job.job_id}: {action} `{job.model}` completed in {minutes} min."
+    if job.result:
+        text += " Results: " + json.dumps(job.result[:BQML_JOB_RESULT_ROWS], default=str)
+    return text
+
+
+class BqmlJobTracker:
+    """Submits BQML jobs, polls them in the background and reports completion."""
+
+    def __init__(self, db_name: str = "bqml_jobs"):
+        self._db_name = db_name
+        self._db = None
+        self._jobs: dict[str, BqmlJob] = {}
+        # Session services of the sessions that submitted jobs in this process.
+        self._session_services: dict[str, BaseSessionService] = {}
+        self._poller: asyncio.Task | None = None
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, location TEXT, kind TEXT, model TEXT, sql TEXT,"
+                " app_name TEXT, user_id TEXT, session_id TEXT, state TEXT, error TEXT,"
+                " submitted_at REAL, finished_at REAL, bytes_processed INTEGER, slot_ms INTEGER,"
+                " iterations INTEGER, result TEXT, notified INTEGER)"
+            )
+            cutoff = time.time() - BQML_JOB_RETENTION_SECONDS
+            self._db.execute("DELETE FROM jobs WHERE submitted_at < ?", (cutoff,))
+            for row in self._db.execute("SELECT * FROM jobs ORDER BY submitted_at"):
+                self._jobs[row["job_id"]] = _job_from_row(row)
+        return self._db
+
+    def _load(self, where: str, params: tuple) -> None:
+        """Pick up jobs submitted or finished by other workers since the first read."""
+        for row in self._conn().execute(f"SELECT * FROM jobs WHERE {where} ORDER BY submitted_at", params):
+            known = self._jobs.get(row["job_id"])
+            if known is None or (not known.finished and row["state"] == "DONE"):
+                self._jobs[row["job_id"]] = _job_from_row(row)
+
+    def _save(self, job: BqmlJob) -> None:
+        values = asdict(job)
+        values["result"] = json.dumps(job.result, default=str) if job.result is not None else None
+        values["notified"] = int(job.notified)
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(_PERSISTED_FIELDS))})",
+            [values[name] for name in _PERSISTED_FIELDS],
+        )
+
+    def get(self, job_id: str) -> BqmlJob | None:
+        self._conn()
+        if job_id not in self._jobs:
+            self._load("job_id = ?", (job_id,))
+        return self._jobs.get(job_id)
+
+    def session_job(self, job_id: str, app_name: str, user_id: str, session_id: str) -> BqmlJob | None:
+        """The job `job_id` if it was submitted from the given session, else None."""
+        job = self.get(job_id)
+        if job is None or (job.app_name, job.user_id, job.session_id) != (app_name, user_id, session_id):
+            return None
+        return job
+
+    def session_jobs(self, app_name: str, user_id: str, session_id: str) -> list[BqmlJob]:
+        self._load("app_name = ? AND user_id = ? AND session_id = ?", (app_name, user_id, session_id))
+        jobs = [
+            job for job in self._jobs.values()
+            if (job.app_name, job.user_id, job.session_id) == (app_name, user_id, session_id)
+        ]
+        return sorted(jobs, key=lambda job: job.submitted_at)
+
+    async def submit(
+        self,
+        sql: str,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        session_service: BaseSessionService | None = None,
+    ) -> BqmlJob:
+        """Start `sql` as a BigQuery job and begin tracking it.
+
+        Raises:
+            JobRejected: If `sql` is not a training or evaluation statement.
+        """
+        kind, model = classify_statement(sql)
+        client, _ = get_clients()
+        job_config = bigquery.QueryJobConfig(labels={"source": "bqml_agent", "kind": kind})
+        # client.query returns once the job is created; it does not wait for it.
+        bq_job = await asyncio.to_thread(client.query, sql, job_config=job_config, job_id_prefix="bqml_")
+        job = BqmlJob(
+            job_id=bq_job.job_id,
+            location=bq_job.location,
+            kind=kind,
+            model=model,
+            sql=sql,
+            app_name=app_name,
+            user_id=user_id,
+            session_id=session_id,
+            state=bq_job.state or "PENDING",
+        )
+        job.next_poll_at = time.time() + job.poll_interval
+        self._conn()
+        self._jobs[job.job_id] = job
+        self._save(job)
+        if session_service is not None:
+            self._session_services[job.job_id] = session_service
+        self.ensure_polling()
+        logger.info("Submitted BQML %s job %s for %s", kind, job.job_id, model)
+        return job
+
+    async def cancel(self, job: BqmlJob) -> None:
+        client, _ = get_clients()
+        await asyncio.to_thread(client.cancel_job, job.job_id, location=job.location)
+        # Pick up the cancellation on the next poll.
+        job.poll_interval = BQML_JOB_POLL_INITIAL_SECONDS
+        job.next_poll_at = time.time()
+
+    def ensure_polling(self) -> None:
+        """Start the poller task if any job is still running."""
+        self._conn()
+        if self._poller is None and any(not job.finished for job in self._jobs.values()):
+            self._poller = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self) -> None:
+        try:
+            while True:
+                running = [job for job in self._jobs.values() if not job.finished]
+                if not running:
+                    return
+                for job in running:
+                    if job.next_poll_at <= time.time():
+                        await self.refresh(job)
+                waiting = [job.next_poll_at for job in self._jobs.values() if not job.finished]
+                if waiting:
+                    await asyncio.sleep(max(0.5, min(waiting) - time.time()))
+        finally:
+            self._poller = None
+
+    async def refresh(self, job: BqmlJob) -> None:
+        """Fetch the job's status from BigQuery, recording and reporting completion."""
+        job.next_poll_at = time.time() + job.poll_interval
+        job.poll_interval = min(job.poll_interval * BQML_JOB_POLL_BACKOFF, BQML_JOB_POLL_MAX_SECONDS)
+        if job.finished:
+            return
+        client, _ = get_clients()
+        try:
+            bq_job = await asyncio.to_thread(client.get_job, job.job_id, location=job.location)
+        except Exception as e:
+            logger.warning("Could not poll BQML job %s: %s", job.job_id, e)
+            return
+        job.state = bq_job.state
+        job.bytes_processed = bq_job.total_bytes_processed
+        job.slot_ms = bq_job.slot_millis
+        ml_statistics = bq_job._properties.get("statistics", {}).get("query", {}).get("mlStatistics", {})
+        if ml_statistics.get("iterationResults"):
+            job.iterations = len(ml_statistics["iterationResults"])
+        if not job.finished:
+            return
+        job.finished_at = time.time()
+        if bq_job.error_result:
+            job.error = bq_job.error_result.get("message") or str(bq_job.error_result)
+        elif job.kind == "evaluation":
+            try:
+                rows = await asyncio.to_thread(bq_job.result, max_results=BQML_JOB_RESULT_ROWS)
+                job.result = json.loads(json.dumps([dict(row) for row in rows], default=str))
+            except Exception as e:
+                job.error = f"Job finished but its results could not be read: {e}"
+        self._save(job)
+        logger.info("BQML job %s %s", job.job_id, job.outcome)
+        await self.notify(job)
+
+    async def notify(self, job: BqmlJob) -> None:
+        """Append the completion event to the submitting session, once it is idle."""
+        service = self._session_services.get(job.job_id)
+        if job.notified or service is None:
+            return
+        try:
+            session = await service.get_session(
+                app_name=job.app_name, user_id=job.user_id, session_id=job.session_id
+            )
+            if session is not None and _is_turn_running(session):
+                # Try again shortly; the turn's own events must not race with ours.
+                asyncio.get_running_loop().call_later(BQML_JOB_POLL_INITIAL_SECONDS, self._notify_later, job)
+                return
+            if session is not None:
+                jobs_state = dict(session.state.get(JOBS_STATE_KEY) or {})
+                jobs_state[job.job_id] = job.to_dict()
+                # The runner routes the next question to the author of the last
+                # agent event, so keep whichever agent the user was talking to.
+                authors = [e.author for e in session.events if e.author != "user"]
+                await service.append_event(
+                    session,
+                    Event(
+                        invocation_id=f"bqml-job-{job.job_id}",
+                        author=authors[-1] if authors else "bqml_agent",
+                        content=types.Content(role="model", parts=[types.Part(text=_completion_text(job))]),
+                        actions=EventActions(state_delta={JOBS_STATE_KEY: jobs_state}),
+                    ),
+                )
+        except Exception as e:
+            logger.warning("Could not report completion of BQML job %s: %s", job.job_id, e)
+            return
+        job.notified = True
+        self._session_services.pop(job.job_id, None)
+        self._save(job)
+
+    def _notify_later(self, job: BqmlJob) -> None:
+        task = asyncio.ensure_future(self.notify(job))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+bqml_jobs = BqmlJobTracker()
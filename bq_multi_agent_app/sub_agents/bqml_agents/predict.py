@@ -0,0 +1,228 @@
+"""
+Batch ML.PREDICT into a destination table.
+
+Scoring through `bigquery-execute-sql` returns every prediction row inline
+through the toolbox and into the agent context. `run_batch_prediction` instead
+writes the ML.PREDICT output to a table and returns only:
+- the row count and prediction columns,
+- per prediction column summary statistics, computed in BigQuery in one scan
+  (min/max/mean/stddev/quartiles for numeric columns, top values with counts
+  for labels and cluster IDs),
+- a small sample of rows.
+
+The destination table is either given by the caller (which must not exist
+unless `overwrite` is set), created in
+BQML_PREDICTION_DATASET (expiring after BQML_PREDICTION_EXPIRATION_HOURS), or,
+when no dataset is configured, the job's anonymous result table (kept 24
+hours). Either way the full output can be read through the Storage Read API
+(`export_bq_data(table_id=...)`) for downstream analysis.
+"""
+
+import datetime
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from ...bq_storage import BQ_QUERY_TIMEOUT_SECONDS
+from ...bq_storage import get_clients
+from ...toolbox import is_read_only_sql
+
+logger = logging.getLogger(__name__)
+
+BQML_PREDICTION_DATASET = os.getenv("BQML_PREDICTION_DATASET", "")
+BQML_PREDICTION_EXPIRATION_HOURS = float(os.getenv("BQML_PREDICTION_EXPIRATION_HOURS", "24"))
+BQML_PREDICT_SAMPLE_ROWS = int(os.getenv("BQML_PREDICT_SAMPLE_ROWS", "5"))
+BQML_PREDICT_TOP_VALUES = int(os.getenv("BQML_PREDICT_TOP_VALUES", "10"))
+
+_IDENTIFIER = re.compile(r"^[\w\-]+(\.[\w\-]+){1,2}$")
+_NUMERIC_TYPES = {"FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC"}
+_CATEGORICAL_TYPES = {"STRING", "BOOL", "BOOLEAN", "INTEGER", "INT64"}
+# Output columns of clustering and anomaly detection models.
+_PREDICTION_COLUMNS = {"centroid_id", "is_anomaly", "anomaly_probability"}
+
+
+class PredictionError(Exception):
+    """The prediction request is invalid or the prediction job failed."""
+
+
+def _check_identifier(value: str, what: str) -> str:
+    value = value.strip().strip("`")
+    if not _IDENTIFIER.match(value):
+        raise PredictionError(f"{what} must be a fully qualified ID like project.dataset.name, got {value!r}.")
+    return value
+
+
+def prediction_sql(model_id: str, input_sql: str = "", input_table: str = "") -> str:
+    """Build the ML.PREDICT query over a SELECT or a table.
+
+    Raises:
+        PredictionError: On an invalid model/table ID or a non read-only input query.
+    """
+    model_id = _check_identifier(model_id, "model_id")
+    if bool(input_sql) == bool(input_table):
+        raise PredictionError("Provide exactly one of input_sql or input_table.")
+    if input_sql:
+        input_sql = input_sql.strip().rstrip(";")
+        if not is_read_only_sql(input_sql):
+            raise PredictionError("input_sql must be a read-only SELECT query.")
+        source = f"({input_sql})"
+    else:
+        source = f"TABLE `{_check_identifier(input_table, 'input_table')}`"
+    return f"SELECT * FROM ML.PREDICT(MODEL `{model_id}`, {source})"
+
+
+def _is_prediction_column(field: bigquery.SchemaField) -> bool:
+    name = field.name.lower()
+    return name.startswith("predicted_") or name in _PREDICTION_COLUMNS
+
+
+def _summary_sql(table_id: str, fields: list[bigquery.SchemaField]) -> tuple[str, list[tuple[str, str]]]:
+    """One-scan summary query over the prediction columns of `table_id`."""
+    selects = ["COUNT(*) AS row_count"]
+    summarized = []
+    for i, field in enumerate(fields):
+        if field.mode == "REPEATED":
+            continue
+        column = f"`{field.name}`"
+        if field.field_type in _NUMERIC_TYPES:
+            selects += [
+                f"MIN({column}) AS c{i}_min",
+                f"MAX({column}) AS c{i}_max",
+                f"AVG({column}) AS c{i}_mean",
+                f"STDDEV({column}) AS c{i}_stddev",
+                f"APPROX_QUANTILES({column}, 4) AS c{i}_quartiles",
+                f"COUNTIF({column} IS NULL) AS c{i}_nulls",
+            ]
+            summarized.append((field.name, f"c{i}", "numeric"))
+        elif field.field_type in _CATEGORICAL_TYPES:
+            selects += [
+                f"APPROX_TOP_COUNT({column}, {BQML_PREDICT_TOP_VALUES}) AS c{i}_top",
+                f"APPROX_COUNT_DISTINCT({column}) AS c{i}_distinct",
+            ]
+            summarized.append((field.name, f"c{i}", "categorical"))
+    return f"SELECT {', '.join(selects)} FROM `{table_id}`", summarized
+
+
+def _round(value):
+    if isinstance(value, float):
+        return round(value, 4)
+    if isinstance(value, list):
+        return [_round(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    return value
+
+
+def summarize_predictions(table_id: str) -> dict:
+    """Row count, prediction column statistics and a sample of `table_id`."""
+    client, _ = get_clients()
+    table = client.get_table(table_id)
+    fields = [field for field in table.schema if _is_prediction_column(field)]
+    sql, summarized = _summary_sql(table_id, fields)
+    row = next(iter(client.query(sql).result(timeout=BQ_QUERY_TIMEOUT_SECONDS)))
+    columns = {}
+    for name, alias, kind in summarized:
+        if kind == "numeric":
+            columns[name] = {
+                "type": "numeric",
+                **{stat: _round(row[f"{alias}_{stat}"]) for stat in ("min", "max", "mean", "stddev", "quartiles", "nulls")},
+            }
+        else:
+            columns[name] = {
+                "type": "categorical",
+                "distinct": row[f"{alias}_distinct"],
+                "top": [{"value": item["value"], "count": item["count"]} for item in row[f"{alias}_top"]],
+            }
+    sample = [dict(r) for r in client.list_rows(table, max_results=BQML_PREDICT_SAMPLE_ROWS)]
+    return {
+        "rows": row["row_count"],
+        "prediction_columns": columns,
+        "columns": [field.name for field in table.schema],
+        # Sample values may be dates, decimals or nested probability structs.
+        "sample": json.loads(json.dumps(_round(sample), default=str)),
+    }
+
+
+def run_batch_prediction(
+    model_id: str,
+    input_sql: str = "",
+    input_table: str = "",
+    destination_table: str = "",
+    overwrite: bool = False,
+) -> dict:
+    """Run ML.PREDICT into a destination table and summarize the output.
+
+    Blocking; run it in a worker thread from async code.
+
+    Returns:
+        A dict with the destination table, job ID, duration, row count,
+        per-column prediction statistics and a sample.
+
+    Raises:
+        PredictionError: On invalid arguments, an existing destination table
+            without `overwrite`, or a failed or timed out prediction job.
+    """
+    sql = prediction_sql(model_id, input_sql, input_table)
+    client, _ = get_clients()
+    job_config = bigquery.QueryJobConfig(labels={"source": "bqml_agent", "kind": "prediction"})
+    expires = None
+    if destination_table:
+        destination_table = _check_identifier(destination_table, "destination_table")
+        if not overwrite:
+            try:
+                client.get_table(destination_table)
+            except NotFound:
+                pass
+            else:
+                raise PredictionError(
+                    f"Destination table {destination_table} already exists. Choose a new table, or ask the "
+                    "user to approve replacing it and call again with overwrite=True."
+                )
+    elif BQML_PREDICTION_DATASET:
+        destination_table = f"{BQML_PREDICTION_DATASET}.predictions_{uuid.uuid4().hex[:12]}"
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=BQML_PREDICTION_EXPIRATION_HOURS
+        )
+    if destination_table:
+        job_config.destination = destination_table
+        # WRITE_EMPTY still refuses a table created since the check above.
+        job_config.write_disposition = (
+            bigquery.WriteDisposition.WRITE_TRUNCATE if overwrite else bigquery.WriteDisposition.WRITE_EMPTY
+        )
+
+    started = time.monotonic()
+    job = client.query(sql, job_config=job_config, job_id_prefix="bqml_predict_")
+    try:
+        job.result(timeout=BQ_QUERY_TIMEOUT_SECONDS, max_results=0)
+    except Exception as e:
+        try:
+            if not job.done():
+                # Timed out: do not leave the job scanning and writing in the background.
+                job.cancel()
+        except Exception as cancel_error:
+            logger.warning("Cannot cancel prediction job %s: %s", job.job_id, cancel_error)
+        raise PredictionError(f"Prediction job {job.job_id} failed: {e}") from e
+    destination = job.destination
+    table_id = f"{destination.project}.{destination.dataset_id}.{destination.table_id}"
+    if expires is not None:
+        table = client.get_table(table_id)
+        table.expires = expires
+        client.update_table(table, ["expires"])
+
+    summary = summarize_predictions(table_id)
+    duration = time.monotonic() - started
+    logger.info("Scored %d rows with %s into %s in %.1fs", summary["rows"], model_id, table_id, duration)
+    return {
+        "destination_table": table_id,
+        "temporary": not destination_table or expires is not None,
+        "job_id": job.job_id,
+        "bytes_processed": job.total_bytes_processed,
+        "duration_s": round(duration, 1),
+        **summary,
+    }
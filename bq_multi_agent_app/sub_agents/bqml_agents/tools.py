@@ -5,87 +5,271 @@ This module provides BQML-specific tools including:
 1. check_bq_models: List BigQuery ML models in a dataset
 2. rag_response: Query BQML documentation from RAG corpus
 3. bqml_toolset: MCP toolset for executing SQL/BQML statements
+4. submit_bqml_job / check_bqml_job / list_bqml_jobs / cancel_bqml_job:
+   training and evaluation as background BigQuery jobs
+5. batch_predict: ML.PREDICT into a destination table, returning a summary
 """
 
+import asyncio
 import os
 
-from google.adk.tools.mcp_tool.mcp_session_manager import \
-    StreamableHTTPConnectionParams
-from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
-from google.cloud import bigquery
+from google.adk.tools import ToolContext
 from vertexai import rag
 
+from ...admission import AdmissionTimeout
+from ...admission import admitted
+from ...bq_storage import get_clients
+from ...singleflight import single_flight
+from ...tool_output import shape_output
+from ...tool_output import shaped_tool
+from ...toolbox import ResilientToolset
+from .jobs import JOBS_STATE_KEY
+from .jobs import JobRejected
+from .jobs import bqml_jobs
+from .predict import PredictionError
+from .predict import run_batch_prediction
 
-def check_bq_models(dataset_id: str) -> str:
-    """Lists models in a BigQuery dataset and returns them as a string.
+RAG_PASSAGE_MAX_CHARS = int(os.getenv("RAG_PASSAGE_MAX_CHARS", "1500"))
+
+
+def check_bq_models(dataset_id: str) -> dict:
+    """Lists the BQML models in a BigQuery dataset.
 
     Args:
         dataset_id: The ID of the BigQuery dataset (e.g., "project.dataset").
 
     Returns:
-        A string representation of a list of dictionaries, where each dictionary
-        contains the 'name' and 'type' of a model in the specified dataset.
-        Returns an empty string "[]" if no models are found.
+        The dataset ID and its models, each with name, type, creation and
+        last modification time; "models" is empty if there are none.
     """
     try:
-        client = bigquery.Client()
-
-        models = client.list_models(dataset_id)
-        model_list = []  # Initialize as a list
-
-        print(f"Models contained in '{dataset_id}':")
-        for model in models:
-            model_id = model.model_id
-            model_type = model.model_type
-            model_list.append({"name": model_id, "type": model_type})
-
-        return str(model_list)
-
+        client, _ = get_clients()
+        models = [
+            {
+                "name": model.model_id,
+                "type": model.model_type,
+                "created": model.created,
+                "modified": model.modified,
+            }
+            for model in client.list_models(dataset_id)
+        ]
     except Exception as e:
-        return f"An error occurred: {str(e)}"
+        return shape_output("check_bq_models", {"status": "error", "error": f"An error occurred: {e}"})
+    return shape_output(
+        "check_bq_models",
+        {"status": "success", "dataset_id": dataset_id, "count": len(models), "models": models},
+        fields=["name", "type", "created", "modified"],
+    )
 
 
-def rag_response(query: str) -> str:
+async def rag_response(query: str) -> dict:
     """Retrieves contextually relevant information from a RAG corpus.
 
     Args:
         query (str): The query string to search within the corpus.
 
     Returns:
-        str: The response containing retrieved information from the corpus.
+        dict: The retrieved passages, each with its source, relevance and text.
     """
     corpus_name = os.getenv("BQML_RAG_CORPUS_NAME")
 
     if not corpus_name:
-        return "BQML RAG corpus not configured. Please set BQML_RAG_CORPUS_NAME environment variable."
+        return {
+            "status": "error",
+            "error": "BQML RAG corpus not configured. Please set BQML_RAG_CORPUS_NAME environment variable.",
+        }
 
+    rag_retrieval_config = rag.RagRetrievalConfig(
+        top_k=3,  # Optional
+        filter=rag.Filter(vector_distance_threshold=0.5),  # Optional
+    )
+    query = " ".join(query.split())
     try:
-        rag_retrieval_config = rag.RagRetrievalConfig(
-            top_k=3,  # Optional
-            filter=rag.Filter(vector_distance_threshold=0.5),  # Optional
+        # Concurrent identical queries (from any session) share one retrieval.
+        response = await single_flight.do(
+            f"rag_response:{corpus_name}:{query}",
+            lambda: asyncio.to_thread(
+                rag.retrieval_query,
+                rag_resources=[
+                    rag.RagResource(
+                        rag_corpus=corpus_name,
+                    )
+                ],
+                text=query,
+                rag_retrieval_config=rag_retrieval_config,
+            ),
+            label="rag_response",
         )
-        response = rag.retrieval_query(
-            rag_resources=[
-                rag.RagResource(
-                    rag_corpus=corpus_name,
-                )
-            ],
-            text=query,
-            rag_retrieval_config=rag_retrieval_config,
-        )
-        return str(response)
     except Exception as e:
-        return f"Error querying RAG corpus: {str(e)}"
-
+        return shape_output("rag_response", {"status": "error", "error": f"Error querying RAG corpus: {e}"})
+    # Keep the passages, not the repr of the whole response proto.
+    passages = [
+        {
+            "source": context.source_display_name or context.source_uri,
+            "score": context.score,
+            "text": " ".join(context.text.split()),
+        }
+        for context in response.contexts.contexts
+    ]
+    return shape_output(
+        "rag_response",
+        {"status": "success", "query": query, "passages": passages},
+        max_chars=RAG_PASSAGE_MAX_CHARS,
+    )
 
-# Get toolbox URL from environment, default to local development
-TOOLBOX_URL = os.getenv("TOOLBOX_URL", "http://127.0.0.1:5000")
 
 # BQML toolset for executing SQL/BQML statements
-bqml_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with BQML toolset filter
-        url=f"{TOOLBOX_URL}/mcp/bqml_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+bqml_toolset = ResilientToolset("bqml_toolset")
+
+
+@shaped_tool
+async def submit_bqml_job(sql: str, tool_context: ToolContext) -> dict:
+    """
+    Start an approved training or evaluation statement as a background job.
+
+    Returns as soon as BigQuery has accepted the job; it keeps running after
+    the turn ends, and its outcome is posted to this session when it finishes.
+
+    Args:
+        sql: A CREATE MODEL statement, or a SELECT over ML.EVALUATE (or
+            ML.TRAINING_INFO, ML.CONFUSION_MATRIX, ML.ROC_CURVE, ...).
+        tool_context: Context of the calling agent.
+
+    Returns:
+        The job handle: job ID, kind, model and status.
+    """
+    session = tool_context.session
+    try:
+        async with admitted("bigquery", context=tool_context):
+            job = await bqml_jobs.submit(
+                sql.strip().rstrip(";"),
+                app_name=session.app_name,
+                user_id=session.user_id,
+                session_id=session.id,
+                session_service=tool_context._invocation_context.session_service,
+            )
+    except (JobRejected, AdmissionTimeout) as e:
+        return {"status": "error", "error": str(e)}
+    except Exception as e:
+        return {"status": "error", "error": f"Could not submit the job: {e}"}
+    jobs_state = dict(tool_context.state.get(JOBS_STATE_KEY) or {})
+    jobs_state[job.job_id] = job.to_dict()
+    tool_context.state[JOBS_STATE_KEY] = jobs_state
+    return {**job.to_dict(), "status": "submitted"}
+
+
+def _session_job(job_id: str, tool_context: ToolContext):
+    """The job `job_id` if it was submitted from the calling session."""
+    session = tool_context.session
+    return bqml_jobs.session_job(job_id, session.app_name, session.user_id, session.id)
+
+
+@shaped_tool
+async def check_bqml_job(job_id: str, tool_context: ToolContext) -> dict:
+    """
+    Get the current status of a background BQML job of this session.
+
+    Args:
+        job_id: ID returned by submit_bqml_job.
+        tool_context: Context of the calling agent.
+
+    Returns:
+        Status ("pending", "running", "succeeded" or "failed"), elapsed time,
+        training iterations so far, and evaluation results or the error once finished.
+    """
+    job = _session_job(job_id, tool_context)
+    if job is None:
+        return {"status": "not_found", "job_id": job_id}
+    await bqml_jobs.refresh(job)
+    bqml_jobs.ensure_polling()
+    return job.to_dict()
+
+
+@shaped_tool
+def list_bqml_jobs(tool_context: ToolContext) -> dict:
+    """
+    List the background BQML jobs submitted in this session.
+
+    Args:
+        tool_context: Context of the calling agent.
+
+    Returns:
+        The session's jobs, most recent first, with their status.
+    """
+    session = tool_context.session
+    jobs = bqml_jobs.session_jobs(session.app_name, session.user_id, session.id)
+    summaries = []
+    for job in reversed(jobs):
+        summary = job.to_dict()
+        summary.pop("result", None)
+        summaries.append(summary)
+    return {"status": "success", "jobs": summaries}
+
+
+@shaped_tool
+async def cancel_bqml_job(job_id: str, tool_context: ToolContext) -> dict:
+    """
+    Request cancellation of a running background BQML job of this session.
+
+    Args:
+        job_id: ID returned by submit_bqml_job.
+        tool_context: Context of the calling agent.
+
+    Returns:
+        Whether cancellation was requested; the job reports "failed" once stopped.
+    """
+    job = _session_job(job_id, tool_context)
+    if job is None:
+        return {"status": "not_found", "job_id": job_id}
+    if job.finished:
+        return {"status": "already_finished", **job.to_dict()}
+    try:
+        await bqml_jobs.cancel(job)
+    except Exception as e:
+        return {"status": "error", "job_id": job_id, "error": f"Could not cancel the job: {e}"}
+    bqml_jobs.ensure_polling()
+    return {"status": "cancelling", "job_id": job_id}
+
+
+@shaped_tool
+async def batch_predict(
+    model_id: str,
+    tool_context: ToolContext,
+    input_sql: str = "",
+    input_table: str = "",
+    destination_table: str = "",
+    overwrite: bool = False,
+) -> dict:
+    """
+    Score rows with a BQML model into a table, returning only a summary.
+
+    Use this instead of running ML.PREDICT with bigquery-execute-sql whenever
+    more than a few rows are scored. The predictions are written to a
+    destination table; the response holds the row count, statistics of the
+    predicted columns and a few sample rows.
+
+    Args:
+        model_id: The model, as project.dataset.model.
+        tool_context: Context of the calling agent.
+        input_sql: A read-only SELECT returning the rows to score.
+        input_table: Alternatively, a table to score (project.dataset.table).
+        destination_table: Optional new table for the predictions; a
+            temporary table is used if empty. An existing table is refused
+            unless `overwrite` is True.
+        overwrite: Replace an existing destination_table. Only set it after
+            the user explicitly approved replacing that table.
+
+    Returns:
+        Summary with the destination table ID, row count, per-column
+        prediction statistics and a sample.
+    """
+    try:
+        async with admitted("bigquery", context=tool_context):
+            result = await asyncio.to_thread(
+                run_batch_prediction, model_id, input_sql, input_table, destination_table, overwrite
+            )
+    except (PredictionError, AdmissionTimeout) as e:
+        return {"status": "error", "error": str(e)}
+    except Exception as e:
+        return {"status": "error", "error": f"Batch prediction failed: {e}"}
+    return {"status": "success", **result}
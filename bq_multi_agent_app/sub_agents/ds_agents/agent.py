@@ -13,10 +13,14 @@ from google.adk.agents import Agent
 from google.adk.code_executors.vertex_ai_code_executor import \
     VertexAiCodeExecutor
 
+from ...admission import AdmittedGemini
+from ...budget import budget_model_call
+from ...budget import record_model_usage
+from ...data_files import attach_staged_file
 from .prompts import return_instructions_ds
 
 root_agent = Agent(
-    model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro"),
+    model=AdmittedGemini(model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro")),
     name="ds_agent",
     instruction=return_instructions_ds(),
     code_executor=VertexAiCodeExecutor(
@@ -24,4 +28,9 @@ root_agent = Agent(
         # Each execution starts fresh (no variable persistence)
         stateful=False,
     ),
+    # Staged data files are kept in memory and attached for this run only
+    before_agent_callback=attach_staged_file,
+    # Runs inside call_data_science_agent; usage counts towards the caller's turn
+    before_model_callback=budget_model_call,
+    after_model_callback=record_model_usage,
 )
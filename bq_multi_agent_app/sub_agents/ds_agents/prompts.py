@@ -55,6 +55,7 @@ def return_instructions_ds() -> str:
     - **Data Inspection First**: Always start with `df.info()`, `df.describe()`, `df.head()` for unknown data
     - **Robust Indexing**: Use `.iloc` for positional access to avoid indexing errors
     - **Complete Analysis**: Design each code block to be self-contained since variables don't persist
+    - **Staged Data Files**: When the request lists a STAGED DATA FILE, the data is already available to your code as that file. Load it with the given `pd.read_parquet(...)` / `pd.read_feather(...)` line at the top of each code block. NEVER retype staged data as Python literals
 
     # Adaptive Workflow by Source
 
@@ -7,18 +7,50 @@ import os
 
 from google.adk.agents import Agent
 
+from ...admission import AdmittedGemini
+from ...admission import bind_principal
+from ...budget import budget_model_call
+from ...budget import budget_tool_call
+from ...budget import record_model_usage
+from ...budget import record_tool_latency
+from ...budget import start_turn
+from ...transfer_brief import build_transfer_brief
+from ...metadata_cache import serve_cached_metadata
+from ...metadata_cache import store_metadata
+from ...result_frames import capture_result_frame
+from ...sql_templates import inject_sql_templates
+from ...sql_templates import record_sql_outcome
+from .column_profiles import get_column_profile
+from .column_profiles import serve_column_cardinality
 from .prompts import return_instructions_pg
 from .tools import pg_sql_toolset
 from .tools import pg_data_retrieval_toolset
 from .tools import pg_stats_toolset
+from .tools import export_pg_query
+from .tools import execute_pg_batch
 
 root_agent = Agent(
-    model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro"),
+    model=AdmittedGemini(model=os.getenv("DEFAULT_GOOGLE_MODEL", "gemini-2.5-pro")),
     name="pg_agent",
     instruction=return_instructions_pg(),
     tools=[
         pg_sql_toolset,      # MCP toolset for Postgres SQL/BQML execution
         pg_data_retrieval_toolset,   # MCP toolset for retrieving database information
         pg_stats_toolset,      # MCP toolset for retrieving stats and status of database
+        get_column_profile,    # Column statistics from the persistent profile store
+        export_pg_query,       # COPY-based bulk export of large results to a Parquet artifact
+        execute_pg_batch,      # Transactional batch writes (executemany / pipelined statements)
     ],
+    # Later turns start here directly, so the principal is bound here too for
+    # admission control; per-turn budget accounting and degraded modes; inherited
+    # history is condensed into a brief before each model call, followed by validated SQL
+    # templates for the question
+    before_agent_callback=[bind_principal, start_turn],
+    before_model_callback=[budget_model_call, build_transfer_brief, inject_sql_templates],
+    after_model_callback=record_model_usage,
+    # Serve repeated schema discovery and cardinality calls from local stores
+    before_tool_callback=[budget_tool_call, serve_cached_metadata, serve_column_cardinality],
+    # Query results are kept for the root agent's local follow-ups, and
+    # successful queries validate SQL templates
+    after_tool_callback=[record_tool_latency, store_metadata, capture_result_frame, record_sql_outcome],
 )
\ No newline at end of file
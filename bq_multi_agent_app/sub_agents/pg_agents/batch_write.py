@@ -0,0 +1,158 @@
+"""
+Transactional batch writes to Postgres.
+
+`postgres-execute-sql` runs one statement per tool call, so an approved bulk
+insert or update of many rows turns into many model round-trips. A batch is
+either one parameterized statement with a list of parameter sets, executed
+with `executemany` (pipelined by psycopg), or a list of statements sent in one
+pipeline. Either way everything runs in a single transaction on a direct
+connection: if any statement fails, or the batch affects more rows than
+PG_BATCH_MAX_AFFECTED_ROWS, nothing is committed.
+
+A dry run executes the batch and rolls it back, reporting the rows it would
+affect.
+"""
+
+import logging
+import os
+import re
+import time
+from typing import Any
+
+from .connection import connect
+
+logger = logging.getLogger(__name__)
+
+PG_BATCH_MAX_PARAMETER_SETS = int(os.getenv("PG_BATCH_MAX_PARAMETER_SETS", "10000"))
+PG_BATCH_MAX_STATEMENTS = int(os.getenv("PG_BATCH_MAX_STATEMENTS", "500"))
+PG_BATCH_MAX_BYTES = int(os.getenv("PG_BATCH_MAX_BYTES", str(5 << 20)))
+PG_BATCH_MAX_AFFECTED_ROWS = int(os.getenv("PG_BATCH_MAX_AFFECTED_ROWS", "100000"))
+PG_BATCH_STATEMENT_TIMEOUT_SECONDS = int(os.getenv("PG_BATCH_STATEMENT_TIMEOUT_SECONDS", "60"))
+
+# Statements that would end or escape the batch's transaction.
+_TRANSACTION_CONTROL = re.compile(
+    r"^\s*(BEGIN|START\s+TRANSACTION|COMMIT|END|ROLLBACK|ABORT|SAVEPOINT|RELEASE|"
+    r"PREPARE\s+TRANSACTION|SET\s+(SESSION\s+)?TRANSACTION|VACUUM|CREATE\s+DATABASE|DROP\s+DATABASE)\b",
+    re.IGNORECASE,
+)
+
+
+class BatchError(Exception):
+    """A batch was rejected or failed; nothing was committed."""
+
+    def __init__(self, message: str, statement_index: int | None = None):
+        super().__init__(message)
+        self.statement_index = statement_index
+
+
+class _Rollback(Exception):
+    """Raised to roll back a dry run after counting its rows."""
+
+
+def validate_batch(
+    statement: str,
+    parameter_sets: list[Any],
+    statements: list[str],
+    payload_bytes: int,
+) -> None:
+    """Check a batch against the configured limits.
+
+    Raises:
+        BatchError: If the batch is malformed or over a limit.
+    """
+    if bool(statement) == bool(statements):
+        raise BatchError("Provide either a parameterized statement with parameter sets, or a list of statements.")
+    if payload_bytes > PG_BATCH_MAX_BYTES:
+        raise BatchError(f"Batch is {payload_bytes} bytes; the limit is {PG_BATCH_MAX_BYTES}.")
+    if statement:
+        if not parameter_sets:
+            raise BatchError("A parameterized statement needs at least one parameter set.")
+        if len(parameter_sets) > PG_BATCH_MAX_PARAMETER_SETS:
+            raise BatchError(
+                f"{len(parameter_sets)} parameter sets exceed the limit of {PG_BATCH_MAX_PARAMETER_SETS}."
+            )
+        kinds = {type(p) for p in parameter_sets}
+        if not (kinds <= {list} or kinds <= {dict}):
+            raise BatchError("Parameter sets must all be arrays (for %s) or all objects (for %(name)s).")
+        checked = [statement]
+    else:
+        if len(statements) > PG_BATCH_MAX_STATEMENTS:
+            raise BatchError(f"{len(statements)} statements exceed the limit of {PG_BATCH_MAX_STATEMENTS}.")
+        checked = statements
+    for index, sql in enumerate(checked):
+        if not sql.strip():
+            raise BatchError("Empty statement.", index)
+        if _TRANSACTION_CONTROL.match(sql):
+            raise BatchError("Transaction control statements are not allowed; the batch is one transaction.", index)
+
+
+def execute_batch(
+    statement: str = "",
+    parameter_sets: list[Any] | None = None,
+    statements: list[str] | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """Run a batch in one transaction and report the affected rows.
+
+    Returns:
+        Affected row counts (total and per statement), whether the batch was
+        committed and how long it took.
+
+    Raises:
+        BatchError: If the batch failed or exceeded PG_BATCH_MAX_AFFECTED_ROWS;
+            the transaction was rolled back.
+    """
+    started = time.monotonic()
+    statement = statement.strip().rstrip(";")
+    statements = [s.strip().rstrip(";") for s in statements or []]
+    parameter_sets = parameter_sets or []
+
+    affected: list[int] = []
+    try:
+        with connect() as conn:
+            with conn.transaction():
+                conn.execute(f"SET LOCAL statement_timeout = {PG_BATCH_STATEMENT_TIMEOUT_SECONDS * 1000}")
+                if statement:
+                    with conn.cursor() as cur:
+                        # psycopg pipelines executemany: one round trip per flush, not per row.
+                        cur.executemany(statement, parameter_sets)
+                        affected.append(max(cur.rowcount, 0))
+                else:
+                    cursors = []
+                    with conn.pipeline():
+                        for sql in statements:
+                            cur = conn.cursor()
+                            cur.execute(sql)
+                            cursors.append(cur)
+                    affected = [max(cur.rowcount, 0) for cur in cursors]
+                    for cur in cursors:
+                        cur.close()
+                total = sum(affected)
+                if PG_BATCH_MAX_AFFECTED_ROWS and total > PG_BATCH_MAX_AFFECTED_ROWS:
+                    raise BatchError(
+                        f"The batch affected {total} rows, over the limit of {PG_BATCH_MAX_AFFECTED_ROWS}; "
+                        "it was rolled back."
+                    )
+                if dry_run:
+                    raise _Rollback()
+    except _Rollback:
+        pass
+    except BatchError:
+        raise
+    except Exception as e:
+        raise BatchError(f"{type(e).__name__}: {e}".strip()) from e
+
+    result = {
+        "committed": not dry_run,
+        "affected_rows": sum(affected),
+        "duration_s": round(time.monotonic() - started, 3),
+    }
+    if statement:
+        result["parameter_sets"] = len(parameter_sets)
+    else:
+        result["affected_rows_per_statement"] = affected
+    logger.info(
+        "Postgres batch %s: %d rows in %.2fs",
+        "dry run" if dry_run else "committed", result["affected_rows"], result["duration_s"],
+    )
+    return result
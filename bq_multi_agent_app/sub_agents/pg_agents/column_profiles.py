@@ -0,0 +1,323 @@
+"""
+Persistent column-profile store for Postgres tables.
+
+Holds per-column distinct count estimates, null fractions and most common
+values, seeded from `pg_stats` through the `pg_stats_toolset` and kept in
+memory for the life of the process. Profiles are persisted to SQLite (see
+`local_store.py`), so a restarted worker starts warm and sessions share them.
+
+Refresh is incremental: at most every PG_PROFILE_CHECK_SECONDS per schema, one
+cheap call lists when each table's statistics were last gathered, and only
+tables whose ANALYZE time changed are re-read from `pg_stats`.
+
+The agent reads profiles through `get_column_profile`, and calls to
+`postgres-get-column-cardinality` are answered from the store as well.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+
+from ...local_store import open_db
+from ...metadata_cache import is_error_response
+from ...tool_output import shaped_tool
+from ...toolbox import call_toolbox_tool
+from ...toolbox import response_rows
+from ...toolbox import text_response
+from .tools import pg_stats_toolset
+
+logger = logging.getLogger(__name__)
+
+PG_PROFILE_CHECK_SECONDS = float(os.getenv("PG_PROFILE_CHECK_SECONDS", "300"))
+PG_PROFILE_TOP_VALUES = int(os.getenv("PG_PROFILE_TOP_VALUES", "10"))
+
+VERSIONS_TOOL = "postgres-get-table-stats-versions"
+STATS_TOOL = "postgres-get-column-stats"
+
+
+@dataclass
+class ColumnProfile:
+    """Planner statistics of one column."""
+
+    distinct_estimate: int | None
+    null_fraction: float
+    top_values: list[dict[str, Any]] = field(default_factory=list)
+    avg_width: int | None = None
+
+
+@dataclass
+class TableProfile:
+    """Column profiles of one table and the statistics version they came from."""
+
+    schema_name: str
+    table_name: str
+    analyzed_at: str | None
+    row_estimate: int | None
+    columns: dict[str, ColumnProfile] = field(default_factory=dict)
+    refreshed_at: float = field(default_factory=time.time)
+
+    def to_dict(self, column_name: str = "") -> dict:
+        columns = self.columns
+        if column_name:
+            columns = {k: v for k, v in columns.items() if k == column_name}
+        return {
+            "schema_name": self.schema_name,
+            "table_name": self.table_name,
+            "row_estimate": self.row_estimate,
+            "statistics_gathered_at": self.analyzed_at,
+            "columns": {name: asdict(profile) for name, profile in columns.items()},
+        }
+
+
+def parse_pg_array(text: str | None) -> list[str | None]:
+    """Parse a Postgres array literal such as `{a,"b c",NULL}`."""
+    if not text or len(text) < 2 or text[0] != "{":
+        return []
+    items, current, quoted, escaped, was_quoted = [], [], False, False, False
+    for char in text[1:-1]:
+        if escaped:
+            current.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+            was_quoted = True
+        elif char == "," and not quoted:
+            value = "".join(current)
+            items.append(None if value == "NULL" and not was_quoted else value)
+            current, was_quoted = [], False
+        else:
+            current.append(char)
+    value = "".join(current)
+    items.append(None if value == "NULL" and not was_quoted else value)
+    return items
+
+
+def _distinct_estimate(n_distinct: float | None, rows: int | None) -> int | None:
+    """Convert pg_stats.n_distinct (negative means a fraction of rows) to a count."""
+    if n_distinct is None:
+        return None
+    if n_distinct >= 0:
+        return int(n_distinct)
+    return int(-n_distinct * rows) if rows and rows > 0 else None
+
+
+def _profiles_from_rows(rows: list[dict], versions: dict[tuple[str, str], dict]) -> dict:
+    """Group pg_stats rows into TableProfiles keyed by (schema, table)."""
+    tables: dict[tuple[str, str], TableProfile] = {}
+    for row in sorted(rows, key=lambda r: bool(r.get("inherited"))):
+        key = (row["schema_name"], row["table_name"])
+        version = versions.get(key, {})
+        row_estimate = row.get("row_estimate")
+        if row_estimate is None or row_estimate < 0:
+            row_estimate = version.get("n_live_tup")
+        table = tables.setdefault(key, TableProfile(
+            schema_name=key[0],
+            table_name=key[1],
+            analyzed_at=version.get("analyzed_at"),
+            row_estimate=row_estimate,
+        ))
+        if row["column_name"] in table.columns:
+            # Partitioned parents have both plain and inherited rows; keep the first.
+            continue
+        values = parse_pg_array(row.get("most_common_vals"))
+        freqs = parse_pg_array(row.get("most_common_freqs"))
+        table.columns[row["column_name"]] = ColumnProfile(
+            distinct_estimate=_distinct_estimate(row.get("n_distinct"), row_estimate),
+            null_fraction=round(float(row.get("null_frac") or 0.0), 4),
+            top_values=[
+                {"value": value, "frequency": round(float(freq), 4)}
+                for value, freq in list(zip(values, freqs))[:PG_PROFILE_TOP_VALUES]
+            ],
+            avg_width=row.get("avg_width"),
+        )
+    return tables
+
+
+class ColumnProfileStore:
+    """In-memory column profiles backed by a SQLite table."""
+
+    def __init__(self, db_name: str = "pg_column_profiles"):
+        self._db_name = db_name
+        self._db = None
+        self._tables: dict[tuple[str, str], TableProfile] = {}
+        self._checked_at: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _conn(self):
+        if self._db is None:
+            self._db = open_db(self._db_name)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS table_profiles ("
+                " schema_name TEXT, table_name TEXT, profile TEXT,"
+                " PRIMARY KEY (schema_name, table_name))"
+            )
+            for row in self._db.execute("SELECT profile FROM table_profiles"):
+                data = json.loads(row["profile"])
+                data["columns"] = {k: ColumnProfile(**v) for k, v in data["columns"].items()}
+                table = TableProfile(**data)
+                self._tables[(table.schema_name, table.table_name)] = table
+        return self._db
+
+    def get(self, schema_name: str, table_name: str) -> TableProfile | None:
+        self._conn()
+        return self._tables.get((schema_name, table_name))
+
+    def _save(self, tables: list[TableProfile], removed: list[tuple[str, str]]) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO table_profiles VALUES (?, ?, ?)",
+            [(t.schema_name, t.table_name, json.dumps(asdict(t), default=str)) for t in tables],
+        )
+        conn.executemany("DELETE FROM table_profiles WHERE schema_name = ? AND table_name = ?", removed)
+        conn.execute("COMMIT")
+
+    async def refresh(self, schema_name: str, tool_context: ToolContext, force: bool = False) -> None:
+        """Bring the profiles of `schema_name` up to date with pg_stats.
+
+        Skipped if the schema was checked within PG_PROFILE_CHECK_SECONDS,
+        unless `force` is set.
+        """
+        self._conn()
+        lock = self._locks.setdefault(schema_name, asyncio.Lock())
+        async with lock:
+            if not force and time.monotonic() - self._checked_at.get(schema_name, -1e9) < PG_PROFILE_CHECK_SECONDS:
+                return
+            # Also throttles retries when the statistics tools are failing.
+            self._checked_at[schema_name] = time.monotonic()
+            response = await call_toolbox_tool(
+                pg_stats_toolset, VERSIONS_TOOL, {"schema_name": schema_name}, tool_context
+            )
+            if is_error_response(response):
+                raise RuntimeError(f"{VERSIONS_TOOL} failed: {response}")
+            versions = {
+                (row["schema_name"], row["table_name"]): row
+                for row in response_rows(response)
+            }
+
+            known = {key for key in self._tables if key[0] == schema_name}
+            changed = [
+                key for key, version in versions.items()
+                if key not in self._tables or self._tables[key].analyzed_at != version.get("analyzed_at")
+            ]
+            removed = sorted(known - versions.keys())
+
+            if not known:
+                # First use of the schema: seed every table with one call.
+                tables_to_read = [""]
+            elif len(changed) > len(versions) // 2:
+                tables_to_read = [""]
+            else:
+                tables_to_read = [table for _, table in changed]
+
+            updated: dict[tuple[str, str], TableProfile] = {}
+            for table_name in tables_to_read:
+                stats = await call_toolbox_tool(
+                    pg_stats_toolset,
+                    STATS_TOOL,
+                    {"schema_name": schema_name, "table_name": table_name},
+                    tool_context,
+                )
+                if is_error_response(stats):
+                    raise RuntimeError(f"{STATS_TOOL} failed: {stats}")
+                updated.update(_profiles_from_rows(response_rows(stats), versions))
+
+            # Tables without statistics yet (never analyzed) still get an entry.
+            for key in changed:
+                if key not in updated:
+                    version = versions[key]
+                    updated[key] = TableProfile(
+                        schema_name=key[0],
+                        table_name=key[1],
+                        analyzed_at=version.get("analyzed_at"),
+                        row_estimate=version.get("n_live_tup"),
+                    )
+
+            for key in removed:
+                self._tables.pop(key, None)
+            self._tables.update(updated)
+            self._save(list(updated.values()), removed)
+            if updated or removed:
+                logger.info(
+                    "Column profiles for schema %s: %d tables refreshed, %d removed",
+                    schema_name, len(updated), len(removed),
+                )
+
+
+column_profile_store = ColumnProfileStore()
+
+
+@shaped_tool
+async def get_column_profile(
+    table_name: str,
+    tool_context: ToolContext,
+    schema_name: str = "public",
+    column_name: str = "",
+) -> dict:
+    """
+    Get column statistics of a Postgres table: distinct counts, null fractions and most common values.
+
+    Served from a local profile store that is refreshed from pg_stats when the
+    table's statistics change, so it is cheap to call before planning GROUP BY
+    or filter queries.
+
+    Args:
+        table_name: Table to profile.
+        tool_context: Context for calling the statistics tools.
+        schema_name: Schema of the table (default "public").
+        column_name: Optional single column; all columns if empty.
+
+    Returns:
+        The table's row estimate, when statistics were gathered and a profile per column.
+    """
+    try:
+        await column_profile_store.refresh(schema_name, tool_context)
+    except Exception as e:
+        logger.warning("Column profile refresh for %s failed: %s", schema_name, e)
+    profile = column_profile_store.get(schema_name, table_name)
+    if profile is None:
+        return {"status": "error", "error": f"No statistics found for table {schema_name}.{table_name}."}
+    result = {"status": "success", **profile.to_dict(column_name)}
+    if not profile.columns:
+        result["note"] = "The table has no planner statistics yet; run ANALYZE on it to profile its columns."
+    return result
+
+
+async def serve_column_cardinality(
+    tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+) -> dict | None:
+    """before_tool_callback: answer postgres-get-column-cardinality from the store."""
+    if tool.name != "postgres-get-column-cardinality":
+        return None
+    schema_name = args.get("schema_name") or "public"
+    table_name = args.get("table_name")
+    if not table_name:
+        return None
+    try:
+        await column_profile_store.refresh(schema_name, tool_context)
+    except Exception as e:
+        logger.warning("Column profile refresh for %s failed: %s", schema_name, e)
+    profile = column_profile_store.get(schema_name, table_name)
+    if profile is None or not profile.columns:
+        return None
+    column_name = args.get("column_name")
+    rows = [
+        {"column_name": name, "estimated_cardinality": column.distinct_estimate}
+        for name, column in profile.columns.items()
+        if not column_name or name == column_name
+    ]
+    if not rows:
+        return None
+    rows.sort(key=lambda r: r["estimated_cardinality"] or 0, reverse=True)
+    return text_response(rows)
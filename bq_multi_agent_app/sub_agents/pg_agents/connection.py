@@ -0,0 +1,33 @@
+"""
+Direct Postgres connections for the PG agent.
+
+Most PG agent tools go through the MCP toolbox. Operations that need the
+Postgres wire protocol itself (COPY streaming, pipelined batch writes) connect
+directly, typically through the Cloud SQL Auth Proxy or the instance's private
+IP. Credentials are the same ones the toolbox uses.
+"""
+
+import os
+
+import psycopg
+
+PG_HOST = os.getenv("PG_HOST", "127.0.0.1")
+PG_PORT = int(os.getenv("PG_PORT", "5432"))
+PG_DB = os.getenv("PG_DB")
+PG_USER_NAME = os.getenv("PG_USER_NAME")
+PG_PASSWORD = os.getenv("PG_PASSWORD")
+PG_CONNECT_TIMEOUT_SECONDS = int(os.getenv("PG_CONNECT_TIMEOUT_SECONDS", "10"))
+
+
+def connect(**kwargs) -> psycopg.Connection:
+    """Open a new connection to the configured Postgres database."""
+    return psycopg.connect(
+        host=PG_HOST,
+        port=PG_PORT,
+        dbname=PG_DB,
+        user=PG_USER_NAME,
+        password=PG_PASSWORD,
+        connect_timeout=PG_CONNECT_TIMEOUT_SECONDS,
+        application_name="bq_multi_agent_app",
+        **kwargs,
+    )
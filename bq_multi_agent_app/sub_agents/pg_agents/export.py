@@ -0,0 +1,350 @@
+"""
+Streaming bulk export from Postgres into Arrow record batches.
+
+Runs `COPY (query) TO STDOUT` on a direct connection and converts the stream
+into Arrow record batches as it arrives, writing each batch to a Parquet file
+on local disk. Memory use is bounded by the batch size, not the result size.
+
+Two wire formats are supported:
+- csv: parsed by Arrow's native CSV reader with column types taken from the
+  query's result description (fastest)
+- binary: decoded by psycopg with exact Postgres types, converted to Arrow in
+  fixed-size row batches
+Either way every batch has the schema derived from the query's result
+description, so batches with all-null columns or narrower values still match
+the Parquet file's schema.
+
+`numeric` columns with a declared precision of at most 38 digits become exact
+decimals in both formats, never floats; other `numeric` columns are kept as
+text. A decimal cannot hold Postgres' special values, so NaN and +/-Infinity
+in a decimal column are exported as null.
+
+Running exports are tracked in `active_exports` so progress can be observed
+and an export can be cancelled from outside the export thread (the tool does
+so when its turn is cancelled).
+"""
+
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from dataclasses import field
+from decimal import Decimal
+from typing import Any
+from typing import Callable
+from typing import Iterable
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from .connection import connect
+
+logger = logging.getLogger(__name__)
+
+BINARY_BATCH_ROWS = 50_000
+CSV_BLOCK_SIZE = 4 << 20  # bytes of CSV parsed per Arrow batch
+PROGRESS_LOG_EVERY_ROWS = 250_000
+
+# Postgres type OIDs that map cleanly onto Arrow types when parsing CSV.
+# Everything else (timestamptz, json, arrays, ...) is kept as text.
+_ARROW_TYPES_BY_OID = {
+    16: pa.bool_(),              # bool
+    20: pa.int64(),              # int8
+    21: pa.int16(),              # int2
+    23: pa.int32(),              # int4
+    700: pa.float32(),           # float4
+    701: pa.float64(),           # float8
+    1082: pa.date32(),           # date
+    1114: pa.timestamp("us"),    # timestamp without time zone
+}
+
+# Extra exact types for values decoded from the binary format.
+_BINARY_ARROW_TYPES_BY_OID = {
+    **_ARROW_TYPES_BY_OID,
+    17: pa.binary(),                     # bytea
+    1083: pa.time64("us"),               # time
+    1184: pa.timestamp("us", tz="UTC"),  # timestamp with time zone
+    1186: pa.duration("us"),             # interval
+}
+_NUMERIC_OID = 1700
+# Special numeric values with no decimal representation.
+_NON_FINITE_NUMERICS = ["NaN", "Infinity", "-Infinity"]
+
+
+class ExportCancelled(Exception):
+    """Raised inside the export thread when the export is cancelled."""
+
+
+@dataclass
+class ExportProgress:
+    """Live state of one export."""
+
+    export_id: str
+    sql: str
+    state: str = "running"
+    rows: int = 0
+    bytes_read: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    connection: object = None
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+        if self.connection is not None:
+            try:
+                self.connection.cancel_safe()
+            except Exception as e:
+                logger.debug("Cancelling export %s: %s", self.export_id, e)
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event.is_set():
+            raise ExportCancelled(f"Export {self.export_id} was cancelled")
+
+    def add_rows(self, count: int) -> None:
+        before = self.rows
+        self.rows += count
+        if before // PROGRESS_LOG_EVERY_ROWS != self.rows // PROGRESS_LOG_EVERY_ROWS:
+            logger.info("Export %s: %d rows", self.export_id, self.rows)
+
+    def to_dict(self) -> dict:
+        return {
+            "export_id": self.export_id,
+            "state": self.state,
+            "rows": self.rows,
+            "bytes_read": self.bytes_read,
+            "elapsed_s": round(time.monotonic() - self.started_at, 2),
+        }
+
+
+# Exports currently running in this process, by export ID.
+active_exports: dict[str, ExportProgress] = {}
+
+
+def cancel_export(export_id: str) -> bool:
+    """Cancel a running export. Returns False if no such export is running."""
+    progress = active_exports.get(export_id)
+    if progress is None:
+        return False
+    progress.cancel()
+    return True
+
+
+class _CopyReader(io.RawIOBase):
+    """File-like view over the chunks produced by a COPY TO STDOUT."""
+
+    def __init__(self, chunks: Iterable, progress: ExportProgress):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._progress = progress
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            self._progress.check_cancelled()
+            try:
+                self._buffer = bytes(next(self._chunks))
+            except StopIteration:
+                return 0
+            self._progress.bytes_read += len(self._buffer)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def _describe(cursor, sql: str) -> list:
+    """Return the result columns (psycopg `Column`s) of the query."""
+    cursor.execute(f"SELECT * FROM ({sql}) AS export_query LIMIT 0")
+    return list(cursor.description)
+
+
+def _arrow_type(column, copy_format: str) -> pa.DataType:
+    if column.type_code == _NUMERIC_OID:
+        # A decimal when the column declares a precision Arrow can hold, text otherwise.
+        if column.precision is not None and column.precision <= 38:
+            return pa.decimal128(column.precision, column.scale or 0)
+        return pa.string()
+    types = _BINARY_ARROW_TYPES_BY_OID if copy_format == "binary" else _ARROW_TYPES_BY_OID
+    return types.get(column.type_code, pa.string())
+
+
+def _arrow_schema(columns, copy_format: str) -> pa.Schema:
+    """The Arrow schema every batch of the export is built with."""
+    return pa.schema([(column.name, _arrow_type(column, copy_format)) for column in columns])
+
+
+def _to_decimal(value: Decimal | None) -> Decimal | None:
+    """A decoded numeric, with NaN and +/-Infinity as null."""
+    return value if value is None or value.is_finite() else None
+
+
+def _to_text(value: Any) -> str | None:
+    """Text form of a decoded value kept as a string column (json, arrays, uuid, ...)."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def _csv_column(values: pa.Array, field: pa.Field) -> pa.Array:
+    if pa.types.is_decimal(field.type):
+        # Read as text: Arrow cannot parse NaN or Infinity as a decimal.
+        values = pc.if_else(pc.is_in(values, pa.array(_NON_FINITE_NUMERICS)), None, values)
+    return values.cast(field.type)
+
+
+def _csv_batches(cursor, copy_sql: str, schema: pa.Schema, progress: ExportProgress):
+    column_types = {f.name: pa.string() if pa.types.is_decimal(f.type) else f.type for f in schema}
+    with cursor.copy(f"COPY ({copy_sql}) TO STDOUT (FORMAT csv, HEADER true)") as copy:
+        reader = pa_csv.open_csv(
+            io.BufferedReader(_CopyReader(copy, progress), buffer_size=1 << 20),
+            read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types,
+                true_values=["t", "true"],
+                false_values=["f", "false"],
+                # COPY writes NULL as an unquoted empty field and '' as "";
+                # text such as NaN or null is a value, not a null.
+                null_values=[""],
+                strings_can_be_null=True,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+        for batch in reader:
+            yield pa.RecordBatch.from_arrays(
+                [_csv_column(column, f) for column, f in zip(batch.columns, schema)], schema=schema
+            )
+
+
+def _binary_batch(rows: list[tuple], schema: pa.Schema, converters: list[Callable | None]) -> pa.RecordBatch:
+    columns = zip(*rows) if rows else [[] for _ in schema]
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array([convert(v) for v in values] if convert else list(values), type=f.type)
+            for values, f, convert in zip(columns, schema, converters)
+        ],
+        schema=schema,
+    )
+
+
+def _binary_batches(cursor, copy_sql: str, columns, schema: pa.Schema, progress: ExportProgress):
+    converters = [
+        _to_text if pa.types.is_string(f.type) else _to_decimal if pa.types.is_decimal(f.type) else None
+        for f in schema
+    ]
+    with cursor.copy(f"COPY ({copy_sql}) TO STDOUT (FORMAT binary)") as copy:
+        copy.set_types([column.type_code for column in columns])
+        rows = []
+        for row in copy.rows():
+            rows.append(row)
+            if len(rows) >= BINARY_BATCH_ROWS:
+                progress.check_cancelled()
+                yield _binary_batch(rows, schema, converters)
+                rows = []
+        if rows:
+            yield _binary_batch(rows, schema, converters)
+
+
+def export_query(
+    sql: str,
+    max_rows: int,
+    copy_format: str = "csv",
+    export_id: str | None = None,
+) -> dict:
+    """Stream the result of `sql` into a local Parquet file.
+
+    Blocking; run it in a worker thread from async code.
+
+    Args:
+        sql: A read-only SELECT query.
+        max_rows: Stop after this many rows; the result is marked truncated.
+        copy_format: "csv" or "binary" COPY wire format.
+        export_id: ID to register the export under; generated if omitted.
+
+    Returns:
+        A dict with the Parquet file path, row count, schema, a small preview
+        and whether the result was truncated.
+
+    Raises:
+        ExportCancelled: If the export was cancelled.
+    """
+    export_id = export_id or uuid.uuid4().hex[:12]
+    progress = ExportProgress(export_id=export_id, sql=sql)
+    active_exports[export_id] = progress
+    output = tempfile.NamedTemporaryFile(prefix=f"pg_export_{export_id}_", suffix=".parquet", delete=False)
+    output.close()
+
+    writer = None
+    preview = []
+    try:
+        with connect() as conn:
+            conn.read_only = True
+            progress.connection = conn
+            with conn.cursor() as cursor:
+                columns = _describe(cursor, sql)
+                schema = _arrow_schema(columns, copy_format)
+                # One extra row tells us whether the result was truncated.
+                copy_sql = f"SELECT * FROM ({sql}) AS export_query LIMIT {max_rows + 1}"
+                if copy_format == "binary":
+                    batches = _binary_batches(cursor, copy_sql, columns, schema, progress)
+                else:
+                    batches = _csv_batches(cursor, copy_sql, schema, progress)
+                truncated = False
+                try:
+                    for batch in batches:
+                        progress.check_cancelled()
+                        remaining = max_rows - progress.rows
+                        if batch.num_rows > remaining:
+                            batch = batch.slice(0, remaining)
+                            truncated = True
+                        if writer is None:
+                            writer = pq.ParquetWriter(output.name, schema, compression="zstd")
+                        writer.write_batch(batch)
+                        if len(preview) < 3:
+                            preview.extend(batch.slice(0, 3 - len(preview)).to_pylist())
+                        progress.add_rows(batch.num_rows)
+                        if truncated:
+                            break
+                finally:
+                    # Finish the COPY while the cursor is still open.
+                    batches.close()
+        progress.state = "completed"
+    except BaseException as e:
+        if writer is not None:
+            writer.close()
+            writer = None
+        os.remove(output.name)
+        if isinstance(e, ExportCancelled) or progress.cancel_event.is_set():
+            # A server-side cancel surfaces as QueryCanceled from psycopg.
+            progress.state = "cancelled"
+            raise ExportCancelled(f"Export {export_id} was cancelled") from e
+        progress.state = "failed"
+        raise
+    finally:
+        progress.connection = None
+        active_exports.pop(export_id, None)
+
+    if writer is not None:
+        writer.close()
+    else:
+        pq.write_table(schema.empty_table(), output.name)
+    return {
+        "export_id": export_id,
+        "path": output.name,
+        "rows": progress.rows,
+        "truncated": truncated,
+        "schema": ", ".join(f"{f.name}: {f.type}" for f in schema),
+        "bytes_read": progress.bytes_read,
+        "duration_s": round(time.monotonic() - progress.started_at, 2),
+        "preview": preview,
+    }
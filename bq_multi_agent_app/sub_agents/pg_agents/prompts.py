@@ -24,8 +24,10 @@ def return_instructions_pg() -> str:
             * First, use `postgres-database-overview` to get the high-level state.
             * Then, use `postgres-list-schemas` and `postgres-list-tables` to find relevant data.
             * Check for simplified views using `postgres-list-views`.
-        2.  **Data Profiling:** If the user asks about data distribution or unique values, use `postgres-get-column-cardinality`.
+        2.  **Data Profiling:** If the user asks about data distribution or unique values, or before grouping, use `get_column_profile` (distinct counts, null fractions and most common values, served from a local profile store).
         3.  **Data Analysis:** Use the `pg_sql_toolset` (specifically `postgres-execute-sql`) to execute standard SQL queries.
+        4.  **Bulk Writes:** When an approved change touches many rows or needs several statements, use `execute_pg_batch` once instead of calling `postgres-execute-sql` repeatedly.
+        5.  **Bulk Extracts:** When the user needs a large result set (thousands of rows or more) for further analysis or download, use `export_pg_query` instead of returning rows through `postgres-execute-sql`.
 
         **Tool Usage:**
 
@@ -37,12 +39,15 @@ def return_instructions_pg() -> str:
             * `postgres-get-column-cardinality`: To understand distinct counts (useful for "group by" planning).
         * **`pg_sql_toolset`**:
             * `postgres-execute-sql`: Use this to run parameterized SQL statements. **Only use this tool AFTER the user has approved the SQL code.**
+        * **`get_column_profile`**: Column statistics of a table (`table_name`, optional `schema_name` and `column_name`): estimated distinct count, null fraction and most common values with frequencies. Cheap; prefer it over querying the table for distributions.
+        * **`export_pg_query`**: Streams the full result of a read-only SELECT into a Parquet artifact and returns the artifact name, row count, schema and a 3-row preview. Same approval rule as `postgres-execute-sql`. Report the artifact name so the parent agent can pass it to `call_data_science_agent` (`artifact_name`) for analysis.
+        * **`execute_pg_batch`**: Runs a batch of writes in a single transaction: either one parameterized `statement` (%s or %(name)s placeholders) with `parameters_json`, a JSON array of parameter sets, or a list of `statements`. Everything is committed together or rolled back on any error. Run it with `dry_run=true` first and show the user the statement(s), the number of parameter sets and the rows that would be affected; only run it for real AFTER the user approves.
 
         **IMPORTANT:**
 
-        * **User Verification is Mandatory:** NEVER use `postgres-execute-sql` without explicit user approval of the generated SQL code.
+        * **User Verification is Mandatory:** NEVER use `postgres-execute-sql` or `execute_pg_batch` (other than a dry run) without explicit user approval of the generated SQL code.
         * **Context Awareness:** Always use the `database` and `schema` provided in the session context. Do not invent table names.
-        * **Efficiency:** Be mindful of query performance. Avoid `SELECT *` on large tables without a `LIMIT`. Use `postgres-get-column-cardinality` to check if a column is suitable for grouping before running expensive aggregations.
+        * **Efficiency:** Be mindful of query performance. Avoid `SELECT *` on large tables without a `LIMIT`. Use `get_column_profile` to check if a column is suitable for grouping before running expensive aggregations; use the most common values it returns for filter literals instead of querying for them.
         * **Parent Agent Routing:** Always route back to the parent agent unless the user explicitly requests it.
         * **No "process is running":** Never use the phrase "process is running" or similar; simply present the results when ready.
         * **Source Configuration:** Ensure you are targeting the correct source defined in the toolbox configuration.
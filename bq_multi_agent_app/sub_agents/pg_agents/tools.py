@@ -4,40 +4,149 @@ Tools for PG Agent
 This module provides PG-specific tools including:
 1. pg_data_retrieval_toolset: MCP toolset for retrieving database information
 2. pg_sql_toolset: MCP toolset for executing Postgres SQL statements
+3. export_pg_query: streaming bulk export of large results into a Parquet
+   artifact (stopped, server-side query included, when the turn is cancelled)
+4. execute_pg_batch: transactional, pipelined batch writes
 """
 
+import asyncio
+import json
 import os
+import uuid
 
-from google.adk.tools.mcp_tool.mcp_session_manager import \
-    StreamableHTTPConnectionParams
-from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+from google.adk.tools import ToolContext
 
-# Get toolbox URL from environment, default to local development
-TOOLBOX_URL = os.getenv("TOOLBOX_URL", "http://127.0.0.1:5000")
+from ...data_files import save_file_artifact
+from ...progress import emit_progress
+from ...tool_output import shaped_tool
+from ...toolbox import ResilientToolset
+from ...toolbox import is_read_only_sql
+from .batch_write import BatchError
+from .batch_write import execute_batch
+from .batch_write import validate_batch
+from .export import ExportCancelled
+from .export import active_exports
+from .export import cancel_export
+from .export import export_query
 
 # PG toolset for executing SQL/BQML statements
-pg_sql_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with BQML toolset filter
-        url=f"{TOOLBOX_URL}/mcp/pg_sql_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+pg_sql_toolset = ResilientToolset("pg_sql_toolset")
 
 # PG toolset for retrieval of data
-pg_data_retrieval_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with BQML toolset filter
-        url=f"{TOOLBOX_URL}/mcp/pg_data_retrieval_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+pg_data_retrieval_toolset = ResilientToolset("pg_data_retrieval_toolset")
 
 # PG toolset for retrieval of statistics and status
-pg_stats_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with BQML toolset filter
-        url=f"{TOOLBOX_URL}/mcp/pg_stats_toolset",
-        headers={}  # Add auth headers if needed
+pg_stats_toolset = ResilientToolset("pg_stats_toolset")
+
+PG_EXPORT_MAX_ROWS = int(os.getenv("PG_EXPORT_MAX_ROWS", "5000000"))
+PG_EXPORT_PROGRESS_SECONDS = 2.0
+
+
+@shaped_tool
+async def export_pg_query(
+    sql: str,
+    tool_context: ToolContext,
+    max_rows: int = 0,
+    copy_format: str = "csv",
+) -> dict:
+    """
+    Export the full result of a read-only query into a Parquet artifact.
+
+    Streams the result with COPY instead of returning rows in the response, so
+    it is suited to large extracts that will be analyzed further (e.g. by the
+    data science agent via the returned artifact name).
+
+    Args:
+        sql: A read-only SELECT query, without a trailing semicolon.
+        tool_context: Context used to save the artifact and record the export.
+        max_rows: Maximum number of rows to export; 0 uses the configured limit.
+        copy_format: "csv" (default, fastest) or "binary" (exact types).
+
+    Returns:
+        Export summary with the artifact name, row count, schema and a 3-row preview.
+    """
+    sql = sql.strip().rstrip(";")
+    if not is_read_only_sql(sql):
+        return {"status": "error", "error": "Only read-only SELECT queries can be exported."}
+    if copy_format not in ("csv", "binary"):
+        return {"status": "error", "error": "copy_format must be 'csv' or 'binary'."}
+    max_rows = min(max_rows, PG_EXPORT_MAX_ROWS) if max_rows > 0 else PG_EXPORT_MAX_ROWS
+
+    export_id = uuid.uuid4().hex[:12]
+    task = asyncio.ensure_future(asyncio.to_thread(export_query, sql, max_rows, copy_format, export_id))
+    try:
+        while not (await asyncio.wait({task}, timeout=PG_EXPORT_PROGRESS_SECONDS))[0]:
+            progress = active_exports.get(export_id)
+            if progress is not None:
+                emit_progress(tool_context, tool="export_pg_query", **progress.to_dict())
+        result = task.result()
+    except asyncio.CancelledError:
+        # The turn was cancelled: stop the server-side query too.
+        cancel_export(export_id)
+        raise
+    except ExportCancelled as e:
+        return {"status": "cancelled", "export_id": export_id, "error": str(e)}
+    except Exception as e:
+        return {"status": "error", "export_id": export_id, "error": f"Export failed: {e}"}
+
+    artifact = await save_file_artifact(
+        result.pop("path"), f"pg_export_{export_id}.parquet", tool_context
     )
-)
\ No newline at end of file
+    summary = {
+        "status": "success",
+        **artifact,
+        **result,
+        # Preview values may be dates, decimals, etc.
+        "preview": json.loads(json.dumps(result["preview"], default=str)),
+    }
+    tool_context.state["pg_exports"] = list(tool_context.state.get("pg_exports") or []) + [
+        {k: summary[k] for k in ("export_id", "artifact_name", "rows", "truncated", "schema")}
+    ]
+    return summary
+
+
+@shaped_tool
+async def execute_pg_batch(
+    tool_context: ToolContext,
+    statement: str = "",
+    parameters_json: str = "",
+    statements: list[str] | None = None,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Run many approved write statements in one transaction.
+
+    Use this instead of repeated postgres-execute-sql calls for bulk inserts,
+    updates or deletes. Either pass one parameterized `statement` with
+    `parameters_json`, or a list of complete `statements`. All of it is
+    committed together or, on any error, not at all.
+
+    Args:
+        tool_context: Context of the calling agent.
+        statement: A parameterized statement using %s or %(name)s placeholders,
+            e.g. "UPDATE orders SET status = %s WHERE id = %s".
+        parameters_json: JSON array of parameter sets for `statement`: arrays
+            for %s placeholders or objects for %(name)s placeholders.
+        statements: Alternatively, a list of complete SQL statements.
+        dry_run: If true, execute and roll back, reporting the rows that would be affected.
+
+    Returns:
+        Whether the batch was committed and the affected row count.
+    """
+    try:
+        parameter_sets = json.loads(parameters_json) if parameters_json else []
+    except ValueError as e:
+        return {"status": "error", "error": f"parameters_json is not valid JSON: {e}"}
+    if not isinstance(parameter_sets, list):
+        return {"status": "error", "error": "parameters_json must be a JSON array of parameter sets."}
+    statements = [s for s in statements or [] if s.strip()]
+    payload_bytes = len(statement) + len(parameters_json) + sum(len(s) for s in statements)
+    try:
+        validate_batch(statement.strip(), parameter_sets, statements, payload_bytes)
+        result = await asyncio.to_thread(execute_batch, statement, parameter_sets, statements, dry_run)
+    except BatchError as e:
+        error = {"status": "error", "committed": False, "error": str(e)}
+        if e.statement_index is not None:
+            error["statement_index"] = e.statement_index
+        return error
+    return {"status": "success", "dry_run": dry_run, **result}
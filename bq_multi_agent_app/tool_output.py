@@ -0,0 +1,138 @@
+"""
+Compact, structured outputs for the app's Python tools.
+
+Whatever a tool returns lands verbatim in the model's context. `shape_output`
+turns a tool result into compact JSON-compatible data before it is returned:
+- field projection: objects in lists keep only the requested keys,
+- floats are rounded to TOOL_OUTPUT_FLOAT_DIGITS decimals,
+- strings are capped at TOOL_OUTPUT_MAX_STRING_CHARS and lists at
+  TOOL_OUTPUT_MAX_ITEMS, and both caps are tightened until the whole output
+  fits TOOL_OUTPUT_MAX_BYTES; what was cut is listed under "truncated",
+- anything else (protos, dates, decimals) is converted to a string.
+
+Tools either call `shape_output` on their result (to pass `fields`) or are
+decorated with `shaped_tool`, which shapes whatever they return.
+
+The shaped output is also attached to the current tool span (`tool.output`,
+`tool.output.bytes`, `tool.output.truncated`) and its size is recorded in the
+`agent.tool.output.size` histogram, so traces show what the model saw.
+"""
+
+import functools
+import inspect
+import json
+import math
+import os
+from typing import Any
+from typing import Callable
+
+from opentelemetry import metrics
+from opentelemetry import trace
+
+TOOL_OUTPUT_FLOAT_DIGITS = int(os.getenv("TOOL_OUTPUT_FLOAT_DIGITS", "4"))
+TOOL_OUTPUT_MAX_ITEMS = int(os.getenv("TOOL_OUTPUT_MAX_ITEMS", "50"))
+TOOL_OUTPUT_MAX_STRING_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_STRING_CHARS", "4000"))
+TOOL_OUTPUT_MAX_BYTES = int(os.getenv("TOOL_OUTPUT_MAX_BYTES", "16000"))
+
+_meter = metrics.get_meter(__name__)
+_size_histogram = _meter.create_histogram(
+    "agent.tool.output.size", unit="By", description="Size of shaped tool outputs, by tool"
+)
+
+
+class _Shaper:
+    """One shaping pass with fixed caps, collecting notes on what was cut."""
+
+    def __init__(self, fields: list[str] | None, digits: int, max_items: int, max_chars: int):
+        self.fields = set(fields) if fields else None
+        self.digits = digits
+        self.max_items = max_items
+        self.max_chars = max_chars
+        self.notes: list[str] = []
+
+    def shape(self, value: Any, path: str, in_list: bool = False) -> Any:
+        if value is None or isinstance(value, (bool, int)):
+            return value
+        if isinstance(value, float):
+            return round(value, self.digits) if math.isfinite(value) else str(value)
+        if isinstance(value, dict):
+            items = value.items()
+            if in_list and self.fields is not None:
+                items = [(k, v) for k, v in items if k in self.fields]
+            return {str(k): self.shape(v, f"{path}.{k}" if path else str(k)) for k, v in items}
+        if isinstance(value, (list, tuple)):
+            if len(value) > self.max_items:
+                self.notes.append(f"{path or 'output'}: first {self.max_items} of {len(value)} items")
+                value = value[: self.max_items]
+            return [self.shape(v, f"{path}[]", in_list=True) for v in value]
+        text = value if isinstance(value, str) else str(value)
+        if len(text) > self.max_chars:
+            self.notes.append(f"{path or 'output'}: first {self.max_chars} of {len(text)} characters")
+            text = text[: self.max_chars] + "..."
+        return text
+
+
+def _record(tool_name: str, output: Any, size: int, truncated: bool) -> None:
+    _size_histogram.record(size, {"tool": tool_name, "truncated": truncated})
+    span = trace.get_current_span()
+    span.set_attribute("tool.output", json.dumps(output))
+    span.set_attribute("tool.output.bytes", size)
+    span.set_attribute("tool.output.truncated", truncated)
+
+
+def shape_output(
+    tool_name: str,
+    output: Any,
+    fields: list[str] | None = None,
+    digits: int = TOOL_OUTPUT_FLOAT_DIGITS,
+    max_items: int = TOOL_OUTPUT_MAX_ITEMS,
+    max_chars: int = TOOL_OUTPUT_MAX_STRING_CHARS,
+    max_bytes: int = TOOL_OUTPUT_MAX_BYTES,
+) -> Any:
+    """Shape a tool result into compact JSON-compatible data and record it.
+
+    Args:
+        tool_name: Name of the tool, for telemetry.
+        output: The tool result, typically a dict with a "status" key.
+        fields: Keys kept in each object inside a list (e.g. the rows of a
+            listing); all keys if empty.
+        digits: Decimals kept for floats.
+        max_items: Initial cap on list lengths.
+        max_chars: Initial cap on string lengths.
+        max_bytes: Cap on the size of the whole output as JSON.
+
+    Returns:
+        The shaped output. For dict outputs, a "truncated" list describes what was cut.
+    """
+    while True:
+        shaper = _Shaper(fields, digits, max_items, max_chars)
+        shaped = shaper.shape(output, "")
+        if shaper.notes and isinstance(shaped, dict):
+            shaped["truncated"] = shaper.notes
+        size = len(json.dumps(shaped))
+        if size <= max_bytes or (max_items <= 1 and max_chars <= 100):
+            break
+        max_items = max(1, max_items // 2)
+        max_chars = max(100, max_chars // 2)
+    _record(tool_name, shaped, size, bool(shaper.notes))
+    return shaped
+
+
+def shaped_tool(func: Callable) -> Callable:
+    """Decorate a Python tool so that its result goes through `shape_output`.
+
+    The wrapper keeps the tool's name, docstring and signature, from which ADK
+    builds the function declaration.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            return shape_output(func.__name__, await func(*args, **kwargs))
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return shape_output(func.__name__, func(*args, **kwargs))
+
+    return wrapper
@@ -0,0 +1,478 @@
+"""
+MCP toolbox connectivity.
+
+This module provides:
+1. ResilientToolset: an MCP toolset backed by one or more toolbox endpoints,
+   with per-tool timeouts, jittered retries for read-only tools, hedged
+   metadata requests to alternate endpoints and per-endpoint circuit
+   breakers; calls are admitted through the shared "toolbox" (and
+   "bigquery") limiters, and identical read-only calls in flight are coalesced
+2. call_toolbox_tool: invoke a toolbox tool directly from Python code, e.g.
+   for speculative prefetch or background refresh
+
+Endpoints come from TOOLBOX_URLS (comma-separated, first is preferred) and fall
+back to the single TOOLBOX_URL used for local development.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Any
+
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools import ToolContext
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.mcp_tool.mcp_session_manager import \
+    StreamableHTTPConnectionParams
+from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
+from google.genai import types
+
+from .admission import AdmissionTimeout
+from .admission import admitted
+from .metadata_cache import canonical_args
+from .singleflight import single_flight
+
+logger = logging.getLogger(__name__)
+
+# Get toolbox URL(s) from environment, default to local development
+TOOLBOX_URL = os.getenv("TOOLBOX_URL", "http://127.0.0.1:5000")
+TOOLBOX_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("TOOLBOX_URLS", TOOLBOX_URL).split(",")
+    if url.strip()
+]
+
+TOOLBOX_CONNECT_TIMEOUT_SECONDS = float(os.getenv("TOOLBOX_CONNECT_TIMEOUT_SECONDS", "5"))
+TOOLBOX_TIMEOUT_SECONDS = float(os.getenv("TOOLBOX_TIMEOUT_SECONDS", "60"))
+TOOLBOX_RETRIES = int(os.getenv("TOOLBOX_RETRIES", "2"))
+# Delay before hedging when there are too few samples to estimate the p95.
+TOOLBOX_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("TOOLBOX_HEDGE_DEFAULT_DELAY_SECONDS", "2"))
+TOOLBOX_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("TOOLBOX_HEDGE_MIN_DELAY_SECONDS", "0.2"))
+TOOLBOX_BREAKER_FAILURES = int(os.getenv("TOOLBOX_BREAKER_FAILURES", "5"))
+TOOLBOX_BREAKER_COOLDOWN_SECONDS = float(os.getenv("TOOLBOX_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Slow tools get a longer timeout; override with TOOLBOX_TOOL_TIMEOUTS as JSON,
+# e.g. '{"bigquery-forecast": 600}'.
+TOOL_TIMEOUTS = {
+    "bigquery-execute-sql": 300.0,
+    "bigquery-conversational-analytics": 180.0,
+    "bigquery-forecast": 300.0,
+    "bigquery-analyze-contribution": 300.0,
+    "postgres-execute-sql": 120.0,
+}
+TOOL_TIMEOUTS.update(json.loads(os.getenv("TOOLBOX_TOOL_TIMEOUTS", "{}")))
+
+# Tools without side effects, safe to retry.
+READ_ONLY_TOOLS = {
+    "bigquery-conversational-analytics",
+    "bigquery-forecast",
+    "bigquery-analyze-contribution",
+    "bigquery-get-dataset-info",
+    "bigquery-get-table-info",
+    "bigquery-list-dataset-ids",
+    "bigquery-list-table-ids",
+    "bigquery-search-catalog",
+    "postgres-list-tables",
+    "postgres-list-active-queries",
+    "postgres-list-available-extensions",
+    "postgres-list-installed-extensions",
+    "postgres-list-views",
+    "postgres-list-schemas",
+    "postgres-database-overview",
+    "postgres-list-triggers",
+    "postgres-list-indexes",
+    "postgres-list-sequences",
+    "postgres-long-running-transactions",
+    "postgres-list-locks",
+    "postgres-replication-stats",
+    "postgres-list-query-stats",
+    "postgres-get-column-cardinality",
+    "postgres-list-publication-tables",
+    "postgres-list-tablespaces",
+    "postgres-get-table-stats-versions",
+    "postgres-get-column-stats",
+    "postgres-get-catalog",
+}
+
+# SQL tools are read-only only when the statement is a query.
+SQL_TOOLS = {"bigquery-execute-sql", "postgres-execute-sql"}
+_READ_ONLY_SQL = re.compile(r"^\s*(\(\s*)*(SELECT|WITH)\b", re.IGNORECASE)
+# INTO covers SELECT ... INTO new_table; FOR UPDATE/SHARE take row locks.
+_WRITE_KEYWORDS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE|GRANT|REVOKE|CALL|EXPORT|INTO|COPY|"
+    r"FOR\s+(?:KEY\s+)?SHARE)\b",
+    re.IGNORECASE,
+)
+# Functions that change state even when called from a SELECT.
+_SIDE_EFFECT_FUNCTIONS = re.compile(
+    r"\b(NEXTVAL|SETVAL|SET_CONFIG|PG_TERMINATE_BACKEND|PG_CANCEL_BACKEND|PG_RELOAD_CONF|"
+    r"PG_ROTATE_LOGFILE|PG_SWITCH_WAL|PG_CREATE_RESTORE_POINT|PG_NOTIFY|PG_ADVISORY_\w*LOCK\w*|"
+    r"PG_TRY_ADVISORY_\w*LOCK\w*|PG_(?:CREATE|DROP)_\w*REPLICATION_SLOT|PG_STAT_RESET\w*|"
+    r"LO_IMPORT|LO_EXPORT|LO_UNLINK|DBLINK_EXEC|DBLINK_SEND_QUERY)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def is_read_only_sql(sql: str) -> bool:
+    """Return True if `sql` is a plain query.
+
+    SELECT/WITH only, without DML, DDL, SELECT INTO, row locks or calls to
+    functions with side effects (sequences, backend control, advisory locks).
+    """
+    return (
+        bool(_READ_ONLY_SQL.match(sql))
+        and not _WRITE_KEYWORDS.search(sql)
+        and not _SIDE_EFFECT_FUNCTIONS.search(sql)
+    )
+
+
+# Read-only tools that run a billed query job. Cancelling the losing call of a
+# hedge does not cancel its job on the server, so these are never hedged.
+QUERY_JOB_TOOLS = {
+    "bigquery-execute-sql",
+    "bigquery-conversational-analytics",
+    "bigquery-forecast",
+    "bigquery-analyze-contribution",
+    "postgres-execute-sql",
+}
+
+
+def is_read_only_call(tool_name: str, args: dict[str, Any]) -> bool:
+    """Return True if calling `tool_name` with `args` has no side effects."""
+    if tool_name in READ_ONLY_TOOLS:
+        return True
+    if tool_name in SQL_TOOLS:
+        return is_read_only_sql(str(args.get("sql", "")))
+    return False
+
+
+def error_response(message: str) -> dict[str, Any]:
+    """Build an MCP-shaped error result the model can read and react to."""
+    return {"content": [{"type": "text", "text": message}], "isError": True}
+
+
+def text_response(payload: Any) -> dict[str, Any]:
+    """Build an MCP-shaped successful result carrying `payload` as JSON text."""
+    return {
+        "content": [{"type": "text", "text": json.dumps(payload, default=str)}],
+        "isError": False,
+    }
+
+
+def response_rows(tool_response: Any) -> list[dict[str, Any]]:
+    """Decode the row objects of an MCP tool result.
+
+    The toolbox returns query results either as one JSON array or as one
+    JSON object per text content item; both are handled.
+    """
+    rows = []
+    for item in (tool_response or {}).get("content") or []:
+        if not isinstance(item, dict) or item.get("type") != "text":
+            continue
+        try:
+            value = json.loads(item["text"])
+        except ValueError:
+            continue
+        if isinstance(value, list):
+            rows.extend(v for v in value if isinstance(v, dict))
+        elif isinstance(value, dict):
+            rows.append(value)
+    return rows
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one toolbox endpoint."""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allows_request(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half-open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies for one tool."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def p95(self) -> float | None:
+        if len(self.samples) < 20:
+            return None
+        ordered = sorted(self.samples)
+        # Nearest rank: the smallest sample with at least 95% of samples at or below it.
+        return ordered[math.ceil(len(ordered) * 0.95) - 1]
+
+
+class Endpoint:
+    """One toolbox deployment serving a toolset."""
+
+    def __init__(self, base_url: str, toolset_name: str):
+        self.base_url = base_url
+        self.toolset = McpToolset(
+            connection_params=StreamableHTTPConnectionParams(
+                # MCP endpoint with toolset filter
+                url=f"{base_url}/mcp/{toolset_name}",
+                headers={},  # Add auth headers if needed
+                timeout=TOOLBOX_CONNECT_TIMEOUT_SECONDS,
+            )
+        )
+        self.breaker = _breakers.setdefault(
+            base_url,
+            CircuitBreaker(TOOLBOX_BREAKER_FAILURES, TOOLBOX_BREAKER_COOLDOWN_SECONDS),
+        )
+
+
+# Breakers are per deployment, shared by every toolset served from it.
+_breakers: dict[str, CircuitBreaker] = {}
+_latencies: dict[str, LatencyTracker] = {}
+
+
+class ResilientTool(BaseTool):
+    """A toolbox tool that can be served by any of the toolset's endpoints."""
+
+    def __init__(self, toolset: "ResilientToolset", tool: BaseTool):
+        super().__init__(name=tool.name, description=tool.description)
+        self._toolset = toolset
+        self._declaration_tool = tool
+
+    def _get_declaration(self) -> types.FunctionDeclaration | None:
+        return self._declaration_tool._get_declaration()
+
+    async def _call_endpoint(
+        self, endpoint: Endpoint, args: dict[str, Any], tool_context: ToolContext, primary: bool = True
+    ) -> Any:
+        """Call the tool on `endpoint`, recording the outcome on its breaker.
+
+        A cancelled primary call timed out or lost to a hedged request: the
+        endpoint was too slow, which counts as a failure. A cancelled hedged
+        call only lost the race and does not.
+        """
+        tool = await get_toolbox_tool(endpoint.toolset, self.name)
+        if tool is None:
+            raise LookupError(f"Tool '{self.name}' not served by {endpoint.base_url}")
+        started = time.monotonic()
+        try:
+            result = await tool.run_async(args=args, tool_context=tool_context)
+        except asyncio.CancelledError:
+            if primary:
+                endpoint.breaker.record_failure()
+            raise
+        except Exception:
+            endpoint.breaker.record_failure()
+            raise
+        endpoint.breaker.record_success()
+        _latencies.setdefault(self.name, LatencyTracker()).record(time.monotonic() - started)
+        return result
+
+    def _hedge_delay(self) -> float:
+        p95 = _latencies.setdefault(self.name, LatencyTracker()).p95()
+        if p95 is None:
+            return TOOLBOX_HEDGE_DEFAULT_DELAY_SECONDS
+        return max(p95, TOOLBOX_HEDGE_MIN_DELAY_SECONDS)
+
+    async def _attempt(
+        self, args: dict[str, Any], tool_context: ToolContext, hedge: bool, attempt: int = 1
+    ) -> Any:
+        """Call the preferred endpoint, hedging to an alternate after the p95 delay.
+
+        Retries start from the next endpoint, so a slow replica whose breaker
+        has not opened yet is not picked again right away.
+        """
+        endpoints = self._toolset.available_endpoints()
+        shift = (attempt - 1) % len(endpoints)
+        endpoints = endpoints[shift:] + endpoints[:shift]
+        if not hedge or len(endpoints) < 2:
+            return await self._call_endpoint(endpoints[0], args, tool_context)
+
+        primary = asyncio.ensure_future(self._call_endpoint(endpoints[0], args, tool_context))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=self._hedge_delay())
+            if done and primary.exception() is None:
+                return primary.result()
+
+            # Primary is slow (past its p95) or already failed: try the alternate.
+            hedged = asyncio.ensure_future(self._call_endpoint(endpoints[1], args, tool_context, primary=False))
+            pending.add(hedged)
+            error = primary.exception() if done else None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run_async(self, *, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        if is_read_only_call(self.name, args):
+            # Identical read-only calls already in flight (from any session) share one result.
+            return await single_flight.do(
+                f"{self.name}:{canonical_args(args)}",
+                lambda: self._run_admitted(args, tool_context),
+                label=self.name,
+            )
+        return await self._run_admitted(args, tool_context)
+
+    async def _run_admitted(self, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        # BigQuery tools also run a job, so they take a BigQuery slot too.
+        resources = ("toolbox", "bigquery") if self.name.startswith("bigquery-") else ("toolbox",)
+        try:
+            async with admitted(*resources, context=tool_context):
+                return await self._run_with_retries(args, tool_context)
+        except AdmissionTimeout as e:
+            return error_response(f"Toolbox call '{self.name}' not started: {e}")
+
+    async def _run_with_retries(self, args: dict[str, Any], tool_context: ToolContext) -> Any:
+        read_only = is_read_only_call(self.name, args)
+        timeout = TOOL_TIMEOUTS.get(self.name, TOOLBOX_TIMEOUT_SECONDS)
+        attempts = 1 + (TOOLBOX_RETRIES if read_only else 0)
+        hedge = read_only and self.name not in QUERY_JOB_TOOLS
+
+        error = None
+        for attempt in range(1, attempts + 1):
+            try:
+                return await asyncio.wait_for(
+                    self._attempt(args, tool_context, hedge=hedge, attempt=attempt), timeout
+                )
+            except asyncio.TimeoutError:
+                error = f"timed out after {timeout}s"
+            except Exception as e:
+                error = f"{type(e).__name__}: {str(e)}"
+            logger.warning("Toolbox call %s attempt %d failed: %s", self.name, attempt, error)
+            if attempt < attempts:
+                # Full jitter backoff: 0.25s, 0.5s, 1s ... capped at 5s.
+                await asyncio.sleep(random.uniform(0, min(5.0, 0.25 * 2 ** (attempt - 1))))
+
+        return error_response(f"Toolbox call '{self.name}' failed: {error}")
+
+
+class ResilientToolset(BaseToolset):
+    """MCP toolbox toolset spread over one or more toolbox endpoints."""
+
+    def __init__(self, toolset_name: str, urls: list[str] | None = None):
+        super().__init__()
+        self.toolset_name = toolset_name
+        self.endpoints = [Endpoint(url, toolset_name) for url in (urls or TOOLBOX_URLS)]
+        self._tools: list[ResilientTool] | None = None
+
+    def available_endpoints(self) -> list[Endpoint]:
+        """Endpoints in preference order, skipping those with an open breaker.
+
+        If every breaker is open, all endpoints are returned so the call still
+        gets a chance instead of failing without trying.
+        """
+        healthy = [e for e in self.endpoints if e.breaker.allows_request()]
+        return healthy or list(self.endpoints)
+
+    async def get_tools(
+        self, readonly_context: ReadonlyContext | None = None
+    ) -> list[BaseTool]:
+        if self._tools is None:
+            error = None
+            for endpoint in self.available_endpoints():
+                try:
+                    tools = await endpoint.toolset.get_tools(readonly_context)
+                except Exception as e:
+                    endpoint.breaker.record_failure()
+                    error = e
+                    continue
+                self._tools = [ResilientTool(self, tool) for tool in tools]
+                break
+            else:
+                raise ConnectionError(
+                    f"No toolbox endpoint could list '{self.toolset_name}': {error}"
+                )
+        return list(self._tools)
+
+    async def warm_up(self) -> dict[str, str]:
+        """List the tools on every endpoint, opening their MCP sessions.
+
+        Returns:
+            "ok" or the error message, by endpoint URL.
+        """
+        results = {}
+        for endpoint in self.endpoints:
+            # A separate task: on connection failure the MCP client cancels the
+            # task that opened the session, which must not be the caller.
+            task = asyncio.ensure_future(endpoint.toolset.get_tools())
+            await asyncio.wait({task})
+            if task.cancelled() or task.exception() is not None:
+                endpoint.breaker.record_failure()
+                error = task.exception() if not task.cancelled() else None
+                results[endpoint.base_url] = f"{type(error).__name__}: {error}" if error else "connection failed"
+                continue
+            tools = task.result()
+            _tool_index[id(endpoint.toolset)] = {tool.name: tool for tool in tools}
+            if self._tools is None:
+                self._tools = [ResilientTool(self, tool) for tool in tools]
+            results[endpoint.base_url] = "ok"
+        return results
+
+    async def close(self) -> None:
+        for endpoint in self.endpoints:
+            await endpoint.toolset.close()
+
+
+# Tool lists per toolset, keyed by id(toolset); listing tools is a remote call.
+_tool_index: dict[int, dict[str, BaseTool]] = {}
+
+
+async def get_toolbox_tool(toolset: BaseToolset, tool_name: str) -> BaseTool | None:
+    """Return the tool named `tool_name` from `toolset`, or None if absent."""
+    index = _tool_index.get(id(toolset))
+    if index is None:
+        tools = await toolset.get_tools()
+        index = {tool.name: tool for tool in tools}
+        _tool_index[id(toolset)] = index
+    return index.get(tool_name)
+
+
+async def call_toolbox_tool(
+    toolset: BaseToolset,
+    tool_name: str,
+    args: dict[str, Any],
+    tool_context: ToolContext,
+) -> Any:
+    """Invoke a toolbox tool directly, outside of a model function call.
+
+    Raises:
+        LookupError: If the toolset does not expose `tool_name`.
+    """
+    tool = await get_toolbox_tool(toolset, tool_name)
+    if tool is None:
+        raise LookupError(f"Tool '{tool_name}' is not available in the toolset")
+    return await tool.run_async(args=args, tool_context=tool_context)
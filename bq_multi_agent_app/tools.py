@@ -4,78 +4,160 @@ Tools for BigQuery Multi-Agent Application
 This module provides:
 1. BigQuery toolset via MCP for database operations
 2. Data science agent wrapper for analysis with code execution
+3. export_bq_data: Storage Read API fast path for large extracts
 """
 
-import os
+import asyncio
+import json
+import re
+import uuid
 
 from google.adk.tools import ToolContext
 from google.adk.tools.agent_tool import AgentTool
-from google.adk.tools.mcp_tool.mcp_session_manager import \
-    StreamableHTTPConnectionParams
-from google.adk.tools.mcp_tool.mcp_toolset import McpToolset
 
+from .admission import AdmissionTimeout
+from .admission import admitted
+from .bq_storage import BQ_READ_MAX_ROWS
+from .bq_storage import read_table
+from .bq_storage import run_query
+from .data_files import save_file_artifact
+from .data_files import stage_data
+from .data_files import stage_file
 from .sub_agents import ds_agent
+from .tool_output import shape_output
+from .tool_output import shaped_tool
+from .toolbox import ResilientToolset
+from .toolbox import is_read_only_sql
 
-# Get toolbox URL from environment, default to local development
-TOOLBOX_URL = os.getenv("TOOLBOX_URL", "http://127.0.0.1:5000")
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
 
 # BigQuery tools via MCP toolbox
-# Use McpToolset with StreamableHTTPConnectionParams for proper MCP integration
+# ResilientToolset wraps McpToolset with timeouts, retries and endpoint failover
 
 # Conversational toolset for quick insights and answers
-bq_conversational_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with toolset filter
-        url=f"{TOOLBOX_URL}/mcp/bq_conversational_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+bq_conversational_toolset = ResilientToolset("bq_conversational_toolset")
 
 # Data retrieval toolset for raw data extraction and analysis
-bq_data_retrieval_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with toolset filter
-        url=f"{TOOLBOX_URL}/mcp/bq_data_retrieval_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+bq_data_retrieval_toolset = ResilientToolset("bq_data_retrieval_toolset")
 
 # ML analysis toolset for forecasting and contribution analysis
-bqml_analysis_toolset = McpToolset(
-    connection_params=StreamableHTTPConnectionParams(
-        # MCP endpoint with toolset filter
-        url=f"{TOOLBOX_URL}/mcp/bqml_analysis_toolset",
-        headers={}  # Add auth headers if needed
-    )
-)
+bqml_analysis_toolset = ResilientToolset("bqml_analysis_toolset")
+
+
+@shaped_tool
+async def export_bq_data(
+    tool_context: ToolContext,
+    sql: str = "",
+    table_id: str = "",
+    columns: str = "",
+    row_filter: str = "",
+    max_rows: int = 0,
+) -> dict:
+    """
+    Extract a large BigQuery result into a Parquet artifact via the Storage Read API.
+
+    Use this instead of bigquery-execute-sql when the result is large (many
+    thousands of rows or more) and will be analyzed by the data science agent.
+    Either runs `sql` and reads its result table, or reads `table_id` directly.
+
+    Args:
+        tool_context: Context used to save the artifact.
+        sql: A read-only SELECT query whose full result should be extracted.
+        table_id: Alternatively, a table to read directly (project.dataset.table).
+        columns: Optional comma-separated columns to read (projection).
+        row_filter: Optional SQL predicate applied server-side, e.g. "country = 'US'".
+        max_rows: Maximum number of rows, keeping the first ones in the
+            query's order; 0 uses the configured limit.
+
+    Returns:
+        Summary with the artifact name (pass it to call_data_science_agent as
+        artifact_name), row count, schema and a 3-row preview. "ordered" is
+        False when rows were read in parallel, in no particular order; if such
+        a result is "truncated", the rows kept are an arbitrary subset.
+    """
+    if bool(sql) == bool(table_id):
+        return {"status": "error", "error": "Provide exactly one of sql or table_id."}
+    if sql and not is_read_only_sql(sql):
+        return {"status": "error", "error": "Only read-only SELECT queries can be extracted."}
+    # Parallel streams interleave rows: read ordered results and "first N rows" over one stream.
+    ordered = max_rows > 0 or bool(_ORDER_BY.search(sql))
+    max_rows = min(max_rows, BQ_READ_MAX_ROWS) if max_rows > 0 else BQ_READ_MAX_ROWS
+    selected = [c.strip() for c in columns.split(",") if c.strip()]
+
+    try:
+        async with admitted("bigquery", context=tool_context):
+            if sql:
+                table_id = await asyncio.to_thread(run_query, sql)
+            result = await asyncio.to_thread(
+                read_table, table_id, selected, row_filter, max_rows, ordered=ordered
+            )
+    except AdmissionTimeout as e:
+        return {"status": "error", "error": str(e)}
+    except Exception as e:
+        return {"status": "error", "error": f"BigQuery extract failed: {e}"}
+
+    artifact_name = f"bq_extract_{uuid.uuid4().hex[:12]}.parquet"
+    artifact = await save_file_artifact(result.pop("path"), artifact_name, tool_context)
+    return {
+        "status": "success",
+        **artifact,
+        **result,
+        "preview": json.loads(json.dumps(result["preview"], default=str)),
+    }
 
 
 async def call_data_science_agent(
     question: str,
     data: str,
     tool_context: ToolContext,
-) -> str:
+    artifact_name: str = "",
+) -> dict:
     """
     Call DS agent to analyze data using Python code execution.
 
     This function wraps the DS agent as a tool to prevent code execution errors
     that would occur if used as a sub-agent.
 
+    Tabular data (JSON rows or CSV) is staged as a compressed Parquet file in
+    the code executor instead of being embedded in the request; the DS agent
+    loads it by file name. Parquet artifacts (e.g. from a Postgres bulk export)
+    are staged as-is by passing `artifact_name`.
+
     Args:
         question: The analytical question to answer
-        data: The data to analyze (CSV, JSON, query results, etc.)
+        data: The data to analyze (CSV, JSON, query results, etc.); may be a
+            short description when `artifact_name` is given
         tool_context: Context for sharing state between tools
+        artifact_name: Optional name of a Parquet artifact to analyze
 
     Returns:
-        Analysis result with insights, visualizations, and conclusions
+        The analysis with insights and conclusions; charts are saved as artifacts
     """
+    if artifact_name:
+        artifact = await tool_context.load_artifact(artifact_name)
+        if artifact is None or artifact.inline_data is None:
+            return shape_output(
+                "call_data_science_agent",
+                {"status": "error", "error": f"Error in data science analysis: artifact '{artifact_name}' not found"},
+            )
+        staged = stage_file(artifact.inline_data.data, "parquet", tool_context, name_prefix="artifact")
+    else:
+        staged = stage_data(data, tool_context)
+    if staged:
+        data_section = f"""STAGED DATA FILE: `{staged.name}`
+    Rows: {staged.num_rows}
+    Columns: {staged.schema}
+    Load it at the top of every code block with: {staged.load_snippet()}"""
+    else:
+        data_section = f"""DATA TO ANALYZE:
+    {data}"""
+
     full_request = f"""
     Please analyze the provided data to answer the following question:
 
     QUESTION: {question}
 
-    DATA TO ANALYZE:
-    {data}
+    {data_section}
 
     Please provide:
     1. Data exploration and cleaning if needed
@@ -88,15 +170,23 @@ async def call_data_science_agent(
     agent_tool = AgentTool(agent=ds_agent)
 
     try:
-        result = await agent_tool.run_async(
-            args={"request": full_request},
-            tool_context=tool_context
-        )
-        # Store result for potential use by other tools
-        tool_context.state["ds_analysis_result"] = result
-        return result
-
+        # Each run opens a code execution session, a shared quota.
+        async with admitted("code_execution", context=tool_context):
+            result = await agent_tool.run_async(
+                args={"request": full_request},
+                tool_context=tool_context
+            )
+    except AdmissionTimeout as e:
+        return shape_output("call_data_science_agent", {"status": "error", "error": str(e)})
     except Exception as e:
         error_message = f"Error in data science analysis: {str(e)}"
         tool_context.state["ds_analysis_error"] = error_message
-        return error_message
+        return shape_output("call_data_science_agent", {"status": "error", "error": error_message})
+
+    output = {"status": "success", "analysis": result.strip() if isinstance(result, str) else result}
+    if staged:
+        output["data_file"] = staged.name
+    output = shape_output("call_data_science_agent", output)
+    # Store result for potential use by other tools
+    tool_context.state["ds_analysis_result"] = output["analysis"]
+    return output
@@ -0,0 +1,262 @@
+"""
+Compact context for sub-agents reached by transfer.
+
+When the root agent transfers to `bqml_agent` or `pg_agent`, ADK sends the
+sub-agent the whole session history: every earlier turn, discovery JSON and
+result dumps of other agents. `build_transfer_brief` replaces that history
+with one brief, built from the session events, containing:
+- the user's goal (the current question),
+- what happened earlier in this turn before the transfer,
+- a schema digest condensed from discovery tool results,
+- the most recent turns (question and answer),
+- this sub-agent's own last answer, verbatim, since a follow-up such as "yes"
+  acts on the exact code or dry run it showed, and
+- the questions of older turns, while budget remains.
+The brief is capped at TRANSFER_BRIEF_TOKEN_BUDGET tokens. The sub-agent's own
+calls and results in the current turn are kept as they are, so its tool loop
+is unaffected. Requests whose history is already under budget are untouched.
+"""
+
+import json
+import logging
+import os
+from typing import Any
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.events import Event
+from google.adk.models import LlmRequest
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from .metadata_cache import CACHEABLE_TOOLS
+from .metadata_cache import canonical_args
+from .metadata_cache import result_text
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_BRIEF_TOKEN_BUDGET = int(os.getenv("TRANSFER_BRIEF_TOKEN_BUDGET", "3000"))
+TRANSFER_BRIEF_RECENT_TURNS = int(os.getenv("TRANSFER_BRIEF_RECENT_TURNS", "3"))
+
+# Tools whose results describe schema rather than data.
+SCHEMA_TOOLS = CACHEABLE_TOOLS | {
+    "postgres-get-column-cardinality",
+    "get_column_profile",
+    "check_bq_models",
+}
+
+# Rough size of a token, for budgeting without a tokenizer call.
+CHARS_PER_TOKEN = 4
+MAX_ANSWER_CHARS = 600
+MAX_QUESTION_CHARS = 200
+MAX_RESULT_CHARS = 300
+MAX_DIGEST_CHARS = 800
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def _content_chars(content: types.Content) -> int:
+    size = 0
+    for part in content.parts or []:
+        if part.text:
+            size += len(part.text)
+        elif part.function_call:
+            size += len(json.dumps(part.function_call.args or {}, default=str))
+        elif part.function_response:
+            size += len(json.dumps(part.function_response.response or {}, default=str))
+    return size
+
+
+def _payload(response: Any) -> Any:
+    """Decode a tool response into JSON data where possible."""
+    text = result_text(response) if isinstance(response, dict) and "content" in response else None
+    if text is None:
+        return response
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _schema_digest(response: Any) -> str:
+    """Condense a discovery result to names and types."""
+    data = _payload(response)
+    if isinstance(data, dict) and isinstance(data.get("result"), (dict, list)):
+        data = data["result"]
+    if isinstance(data, dict):
+        fields = (data.get("Schema") or data.get("schema") or {})
+        fields = fields.get("fields") if isinstance(fields, dict) else fields
+        if isinstance(fields, list) and fields and isinstance(fields[0], dict):
+            columns = ", ".join(
+                f"{f.get('name') or f.get('Name')} {f.get('type') or f.get('Type') or ''}".strip()
+                for f in fields
+            )
+            return _clip(f"columns: {columns}", MAX_DIGEST_CHARS)
+        if isinstance(data.get("columns"), dict):
+            return _clip(f"columns: {', '.join(data['columns'])}", MAX_DIGEST_CHARS)
+        return _clip(json.dumps(data, default=str), MAX_DIGEST_CHARS)
+    if isinstance(data, list):
+        items = []
+        for item in data:
+            if isinstance(item, dict):
+                # The first value is the object's name in every discovery listing.
+                values = list(item.values())
+                items.append(str(values[0]) if len(values) == 1 else json.dumps(item, default=str))
+            else:
+                items.append(str(item))
+        return _clip(", ".join(items), MAX_DIGEST_CHARS)
+    return _clip(str(data), MAX_DIGEST_CHARS)
+
+
+def _text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text or "" for part in event.content.parts if not part.thought).strip()
+
+
+class _Turn:
+    """The parts of one past invocation that matter for a brief."""
+
+    def __init__(self):
+        self.question = ""
+        self.answer = ""
+        # Last text the brief's own agent wrote in this turn, kept verbatim.
+        self.own_answer = ""
+        self.activity: list[str] = []
+
+
+def _collect(events: list[Event], current_invocation: str, agent_name: str):
+    """Split the session into past turns, pre-transfer activity and schema results."""
+    turns: dict[str, _Turn] = {}
+    schema: dict[str, str] = {}
+    calls = {call.id: call for event in events for call in event.get_function_calls()}
+    for event in events:
+        if event.partial or not event.content:
+            continue
+        if event.invocation_id == current_invocation and event.author == agent_name:
+            continue
+        turn = turns.setdefault(event.invocation_id, _Turn())
+        text = _text(event)
+        if event.author == "user" and text and not event.get_function_responses():
+            turn.question = text
+            continue
+        if text:
+            turn.answer = text
+            if event.author == agent_name:
+                turn.own_answer = text
+            turn.activity.append(f"[{event.author}] {_clip(text, MAX_RESULT_CHARS)}")
+        for call in event.get_function_calls():
+            if call.name == "transfer_to_agent":
+                continue
+            turn.activity.append(
+                f"[{event.author}] called {call.name}({_clip(canonical_args(call.args or {}), MAX_RESULT_CHARS)})"
+            )
+        for response in event.get_function_responses():
+            call = calls.get(response.id)
+            args = canonical_args(call.args or {}) if call else ""
+            if response.name in SCHEMA_TOOLS:
+                # Newest result wins; dict order keeps the latest at the end.
+                key = f"{response.name}({args})"
+                schema.pop(key, None)
+                schema[key] = _schema_digest(response.response)
+            else:
+                turn.activity.append(
+                    f"[{event.author}] {response.name} returned: "
+                    f"{_clip(json.dumps(_payload(response.response), default=str), MAX_RESULT_CHARS)}"
+                )
+    current = turns.pop(current_invocation, _Turn())
+    past = [turn for turn in turns.values() if turn.question]
+    return current, past, schema
+
+
+def _brief_text(
+    goal: str, current: _Turn, past: list[_Turn], schema: dict[str, str], budget_chars: int
+) -> str:
+    sections: list[tuple[str, list[str]]] = []
+    own = next((turn for turn in reversed(past) if turn.own_answer), None)
+    # The own answer is never clipped; it is charged against the budget first.
+    own_text = own.own_answer if own else ""
+    remaining = budget_chars - len(goal) - len(own_text)
+
+    def take(lines: list[str]) -> list[str]:
+        nonlocal remaining
+        kept = []
+        for line in lines:
+            if len(line) + 1 > remaining:
+                break
+            kept.append(line)
+            remaining -= len(line) + 1
+        return kept
+
+    sections.append(("Earlier in this request", take(current.activity)))
+    sections.append(("Known schema (from discovery)", take([
+        f"- {key}: {digest}" for key, digest in reversed(schema.items())
+    ])))
+    recent = past[-TRANSFER_BRIEF_RECENT_TURNS:] if TRANSFER_BRIEF_RECENT_TURNS else []
+    # Newest turns get the budget first; both lists are shown oldest first.
+    recent_lines = take([
+        f"- User: {_clip(turn.question, MAX_QUESTION_CHARS)}\n  Answer: "
+        + ("(your last answer, quoted below)" if turn is own and turn.answer == own_text
+           else _clip(turn.answer, MAX_ANSWER_CHARS))
+        for turn in reversed(recent)
+    ])
+    sections.append(("Recent conversation", recent_lines[::-1]))
+    older = past[:len(past) - len(recent)]
+    older_lines = take([f"- {_clip(turn.question, MAX_QUESTION_CHARS)}" for turn in reversed(older)])[::-1]
+    if len(older_lines) < len(older):
+        older_lines.insert(0, f"- ({len(older) - len(older_lines)} earlier questions omitted)")
+    sections.append(("Earlier questions", older_lines))
+
+    lines = ["Brief from the coordinating agent (earlier history was condensed).", "", f"User goal: {goal}"]
+    for title, items in sections:
+        if items:
+            lines += ["", f"{title}:", *items]
+    if own_text:
+        lines += ["", "Your last answer (verbatim):", own_text]
+    return "\n".join(lines)
+
+
+def _own_suffix(contents: list[types.Content]) -> list[types.Content]:
+    """The trailing contents produced by the current agent's own tool loop."""
+    start = len(contents)
+    while start > 0:
+        content = contents[start - 1]
+        parts = content.parts or []
+        is_own_response = content.role == "user" and parts and all(p.function_response for p in parts)
+        if content.role != "model" and not is_own_response:
+            break
+        start -= 1
+    return contents[start:]
+
+
+def build_transfer_brief(callback_context: CallbackContext, llm_request: LlmRequest) -> LlmResponse | None:
+    """before_model_callback: replace inherited history with a compact brief."""
+    if not TRANSFER_BRIEF_TOKEN_BUDGET:
+        return None
+    contents = llm_request.contents or []
+    before_chars = sum(_content_chars(c) for c in contents)
+    budget_chars = TRANSFER_BRIEF_TOKEN_BUDGET * CHARS_PER_TOKEN
+    if before_chars <= budget_chars:
+        return None
+
+    own = _own_suffix(contents)
+    if own and own[0].role != "model":
+        # Never split a function call from its response.
+        return None
+    user_content = callback_context.user_content
+    parts = user_content.parts if user_content and user_content.parts else []
+    goal = " ".join(part.text for part in parts if part.text).strip()
+    current, past, schema = _collect(
+        callback_context.session.events, callback_context.invocation_id, callback_context.agent_name
+    )
+    brief = _brief_text(goal, current, past, schema, budget_chars)
+    llm_request.contents = [types.Content(role="user", parts=[types.Part(text=brief)]), *own]
+    logger.info(
+        "Transfer brief for %s: ~%d -> ~%d tokens of history",
+        callback_context.agent_name,
+        before_chars // CHARS_PER_TOKEN,
+        sum(_content_chars(c) for c in llm_request.contents) // CHARS_PER_TOKEN,
+    )
+    return None
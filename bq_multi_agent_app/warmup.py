@@ -0,0 +1,83 @@
+"""
+Startup warmup for serving processes.
+
+Importing `agent` builds `root_agent` and its sub-agents. Before a worker
+reports ready, `warm_up` also does the work that would otherwise land on the
+first user request:
+- opens the MCP session of every toolbox toolset on every endpoint and caches
+  its tool manifest,
+- creates the shared BigQuery clients (credentials, HTTP pools),
+- loads the persistent local stores (analysis results, column profiles,
+  catalog index, SQL templates).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterator
+
+from google.adk.agents import BaseAgent
+
+from .agent import root_agent
+from .analysis_cache import analysis_cache
+from .bq_storage import get_clients
+from .catalog_index import catalog_index
+from .sql_templates import sql_templates
+from .sub_agents import ds_agent
+from .sub_agents.pg_agents.column_profiles import column_profile_store
+from .toolbox import ResilientToolset
+
+logger = logging.getLogger(__name__)
+
+
+def iter_agents(agent: BaseAgent) -> Iterator[BaseAgent]:
+    """The agent and all of its sub-agents, depth first."""
+    yield agent
+    for sub_agent in agent.sub_agents:
+        yield from iter_agents(sub_agent)
+
+
+def toolbox_toolsets() -> list[ResilientToolset]:
+    """Toolbox toolsets used by any agent, including the DS agent (run as a tool)."""
+    toolsets = {}
+    for agent in [*iter_agents(root_agent), ds_agent]:
+        for tool in getattr(agent, "tools", []):
+            if isinstance(tool, ResilientToolset):
+                toolsets[id(tool)] = tool
+    return list(toolsets.values())
+
+
+async def _timed(name: str, coro) -> dict:
+    started = time.monotonic()
+    try:
+        detail = await coro
+        if isinstance(detail, dict):
+            status = "ok" if all(v == "ok" for v in detail.values()) else "error"
+        else:
+            detail, status = "ok", "ok"
+    except Exception as e:
+        detail, status = f"{type(e).__name__}: {e}", "error"
+    return {"name": name, "status": status, "detail": detail, "duration_s": round(time.monotonic() - started, 3)}
+
+
+async def warm_up(include_local_stores: bool = True) -> list[dict]:
+    """Warm every dependency concurrently.
+
+    Returns:
+        One entry per step with its name, status ("ok" or "error"), detail and duration.
+    """
+    steps = [
+        _timed(f"toolset:{toolset.toolset_name}", toolset.warm_up())
+        for toolset in toolbox_toolsets()
+    ]
+    steps.append(_timed("bigquery_clients", asyncio.to_thread(get_clients)))
+    if include_local_stores:
+        steps.append(_timed("analysis_cache", asyncio.to_thread(analysis_cache.entries)))
+        steps.append(_timed("column_profiles", asyncio.to_thread(column_profile_store.get, "", "")))
+        steps.append(_timed("catalog_index", asyncio.to_thread(catalog_index.load)))
+        steps.append(_timed("sql_templates", asyncio.to_thread(sql_templates.load)))
+    results = await asyncio.gather(*steps)
+    for result in results:
+        log = logger.info if result["status"] == "ok" else logger.warning
+        log("Warmup %s: %s in %.2fs", result["name"], result["status"], result["duration_s"])
+    return results
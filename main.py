@@ -1,5 +1,194 @@
+"""
+Command line entry point for the BigQuery and CloudSQL multi-agent app.
+
+Usage:
+    python main.py batch questions.jsonl results.jsonl --concurrency 16
+    python main.py stream "Show me last month's sales by region"
+    python main.py precompute --loop
+    python main.py catalog --search "customer churn"
+    python main.py serve --workers 4 --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+
+from dotenv import load_dotenv
+
+
+def run_batch_command(args):
+    """Run a JSONL file of questions through the root agent."""
+    from bq_multi_agent_app.batch import run_batch
+
+    # Per-question progress is logged by the batch module.
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    counts = asyncio.run(
+        run_batch(
+            args.input,
+            args.output,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+            retries=args.retries,
+        )
+    )
+    print(f"\n✓ Batch completed: {counts['ok']} succeeded, {counts['error']} failed")
+
+
+def run_stream_command(args):
+    """Run one question and print its progress events as they arrive."""
+    if args.profile:
+        # A local --profile is the operator's own request, not a client's.
+        os.environ["PROFILE_ALLOW_REQUESTS"] = "true"
+    from bq_multi_agent_app.runner import build_runner
+    from bq_multi_agent_app.streaming import stream_turn
+
+    async def run():
+        runner = build_runner()
+        session_id = args.session_id or f"stream-{uuid.uuid4().hex}"
+        streamed_text = False
+        async for event in stream_turn(runner, args.user_id, session_id, args.question, profile=args.profile):
+            if args.json:
+                print(json.dumps(event, default=str), flush=True)
+            elif event["type"] == "token":
+                streamed_text = True
+                print(event["text"], end="", flush=True)
+            elif event["type"] == "answer":
+                # Already printed token by token unless the model did not stream.
+                if not streamed_text:
+                    print(event["text"], flush=True)
+                streamed_text = False
+            elif event["type"] != "heartbeat":
+                print(f"\n[{event['t']:7.2f}s] {event['type']}: "
+                      f"{json.dumps({k: v for k, v in event.items() if k not in ('type', 't')}, default=str)}",
+                      flush=True)
+        await runner.close()
+
+    asyncio.run(run())
+    print()
+
+
+def run_precompute_command(args):
+    """Recompute cached forecasts and contribution analyses of hot series."""
+    from bq_multi_agent_app.analysis_cache import precompute_hot_series
+    from bq_multi_agent_app.analysis_cache import run_precompute_loop
+
+    if args.loop:
+        print(f"Precomputing hot series every {args.interval:.0f}s (Ctrl+C to stop)")
+        try:
+            asyncio.run(run_precompute_loop(args.interval))
+        except KeyboardInterrupt:
+            pass
+        return
+    counts = asyncio.run(precompute_hot_series())
+    print(f"✓ Precompute completed: {counts['refreshed']} refreshed, "
+          f"{counts['fresh']} already fresh, {counts['failed']} failed")
+
+
+def run_catalog_command(args):
+    """Crawl the BigQuery and Postgres catalogs into the local index, or search it."""
+    from bq_multi_agent_app.catalog_index import catalog_index
+
+    async def run():
+        if not args.search or args.crawl or not catalog_index.load():
+            result = await catalog_index.crawl()
+            print(f"✓ Catalog crawl completed: {json.dumps(result)}")
+        if args.search:
+            for table in await catalog_index.search(args.search, args.source):
+                columns = ", ".join(c["name"] for c in table["matched_columns"])
+                print(f"{table['score']:8.3f}  {table['source']:9} {table['table']}"
+                      f"{f'  [{columns}]' if columns else ''}")
+
+    asyncio.run(run())
+
+
+def run_serve_command(args):
+    """Serve the agent over HTTP with preloaded, warmed-up worker processes."""
+    import uvicorn
+
+    if args.concurrency:
+        # Read by each worker process when it imports the server module.
+        os.environ["SERVER_MAX_CONCURRENT_TURNS"] = str(args.concurrency)
+    print(f"Serving on {args.host}:{args.port} with {args.workers} worker(s)")
+    uvicorn.run(
+        "bq_multi_agent_app.server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        log_level=args.log_level,
+    )
+
+
 def main():
-    print("Hello from bq-pg-agent-app!")
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="BigQuery and CloudSQL multi-agent app")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Run a JSONL file of questions non-interactively")
+    batch_parser.add_argument("input", help="Input JSONL file of questions")
+    batch_parser.add_argument("output", help="Output JSONL file for results")
+    batch_parser.add_argument("--concurrency", type=int, default=8,
+                              help="Maximum questions in flight (default: 8)")
+    batch_parser.add_argument("--timeout", type=float, default=300.0,
+                              help="Per-question timeout in seconds (default: 300)")
+    batch_parser.add_argument("--retries", type=int, default=1,
+                              help="Retries per failed question (default: 1)")
+    batch_parser.set_defaults(func=run_batch_command)
+
+    stream_parser = subparsers.add_parser(
+        "stream", help="Run one question, printing progress events as they happen")
+    stream_parser.add_argument("question", help="Question to ask")
+    stream_parser.add_argument("--session-id", help="Session to continue (default: new session)")
+    stream_parser.add_argument("--user-id", default="stream_user", help="User ID (default: stream_user)")
+    stream_parser.add_argument("--json", action="store_true",
+                               help="Print every event as a JSON line")
+    stream_parser.add_argument("--profile", action="store_true",
+                               help="Profile the turn; set PROFILE_OUTPUT_DIR to keep the flamegraphs")
+    stream_parser.set_defaults(func=run_stream_command)
+
+    precompute_parser = subparsers.add_parser(
+        "precompute", help="Refresh cached forecasts and contribution analyses of hot series")
+    precompute_parser.add_argument("--loop", action="store_true",
+                                   help="Keep running, refreshing every --interval seconds")
+    precompute_parser.add_argument("--interval", type=float, default=3600.0,
+                                   help="Seconds between refreshes with --loop (default: 3600)")
+    precompute_parser.set_defaults(func=run_precompute_command)
+
+    catalog_parser = subparsers.add_parser(
+        "catalog", help="Crawl table and column metadata into the local catalog index, or search it")
+    catalog_parser.add_argument("--search", help="Show the tables most relevant to this concept")
+    catalog_parser.add_argument("--source", default="", choices=["", "bigquery", "postgres"],
+                                help="Search one system only (default: both)")
+    catalog_parser.add_argument("--crawl", action="store_true",
+                                help="Crawl before searching even if the index is not empty")
+    catalog_parser.set_defaults(func=run_catalog_command)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Serve the agent over HTTP (run, stream, websocket, health and readiness)")
+    serve_parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"),
+                              help="Interface to bind (default: 0.0.0.0)")
+    serve_parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8080")),
+                              help="Port to bind (default: $PORT or 8080)")
+    serve_parser.add_argument("--workers", type=int, default=int(os.getenv("SERVER_WORKERS", "1")),
+                              help="Worker processes (default: $SERVER_WORKERS or 1)")
+    serve_parser.add_argument("--concurrency", type=int, default=0,
+                              help="Maximum concurrent turns per worker (default: $SERVER_MAX_CONCURRENT_TURNS or 16)")
+    serve_parser.add_argument("--graceful-timeout", type=int, default=60,
+                              help="Seconds to let running requests finish on shutdown (default: 60)")
+    serve_parser.add_argument("--keep-alive", type=int, default=75,
+                              help="HTTP keep-alive timeout in seconds (default: 75)")
+    serve_parser.add_argument("--log-level", default="info", help="Log level (default: info)")
+    serve_parser.set_defaults(func=run_serve_command)
+
+    args = parser.parse_args()
+    args.func(args)
 
 
 if __name__ == "__main__":
@@ -5,11 +5,17 @@ This script creates a Vertex AI RAG corpus containing BQML documentation
 and reference guides for use by the BQML agent.
 """
 
+import argparse
+import hashlib
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
 from pathlib import Path
 
 from dotenv import load_dotenv
 from dotenv import set_key
+import fsspec
 import vertexai
 from vertexai import rag
 
@@ -31,6 +37,14 @@ paths = [
     "gs://cloud-samples-data/adk-samples/data-science/bqml"
 ]  # Supports Google Cloud Storage and Google Drive Links
 
+# Local record of what has been ingested: gs:// URI -> content hash, RagFile name
+manifest_path = Path(__file__).parent / "bqml_corpus_manifest.json"
+
+# Import tuning: the RAG API accepts up to 25 paths per import request
+IMPORT_BATCH_SIZE = 25
+MAX_PARALLEL_BATCHES = 4
+MAX_EMBEDDING_REQUESTS_PER_MIN = 1000
+
 # Initialize Vertex AI API once per session
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
@@ -58,8 +72,95 @@ def create_RAG_corpus():
     return bqml_corpus.name
 
 
-def ingest_files(corpus_name):
-    """Ingest BQML documentation files into the RAG corpus."""
+def list_source_files():
+    """List source documents with a content hash for each.
+
+    Uses the object's MD5 (or CRC32C for composite objects) reported by GCS,
+    so files are not downloaded just to detect changes.
+
+    Returns:
+        A dict mapping gs:// URI to content hash.
+    """
+    fs = fsspec.filesystem("gcs")
+    files = {}
+    for path in paths:
+        for name, info in fs.find(path, detail=True).items():
+            if info.get("type") == "directory":
+                continue
+            content_hash = info.get("md5Hash") or info.get("crc32c")
+            if not content_hash:
+                with fs.open(name, "rb") as f:
+                    content_hash = hashlib.sha256(f.read()).hexdigest()
+            files[f"gs://{name}"] = content_hash
+    return files
+
+
+def load_manifest(corpus_name):
+    """Load the ingestion manifest for `corpus_name`, or an empty one."""
+    if manifest_path.exists():
+        manifest = json.loads(manifest_path.read_text())
+        if manifest.get("corpus_name") == corpus_name:
+            return manifest
+        print(f"Manifest {manifest_path} belongs to another corpus, starting fresh")
+    return {"corpus_name": corpus_name, "files": {}}
+
+
+def save_manifest(manifest):
+    """Atomically write the ingestion manifest."""
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(tmp_path, manifest_path)
+
+
+def list_corpus_files(corpus_name):
+    """Return a dict mapping display name to RagFile resource name."""
+    return {f.display_name: f.name for f in rag.list_files(corpus_name)}
+
+
+def plan_ingestion(source_files, manifest, corpus_files, full=False):
+    """Work out which documents to import and which RagFiles to delete.
+
+    Files already in the corpus but missing from the manifest (e.g. from a run
+    before manifests existed) are adopted when their display name matches.
+
+    Returns:
+        A tuple (to_import, to_delete) of gs:// URIs and RagFile names.
+    """
+    known = manifest["files"]
+    for uri, content_hash in source_files.items():
+        display_name = uri.rsplit("/", 1)[-1]
+        if uri not in known and display_name in corpus_files:
+            known[uri] = {"hash": content_hash, "rag_file": corpus_files[display_name]}
+
+    to_import, to_delete = [], []
+    for uri, content_hash in source_files.items():
+        entry = known.get(uri)
+        if full or entry is None or entry["hash"] != content_hash:
+            to_import.append(uri)
+            if entry and entry.get("rag_file"):
+                to_delete.append(entry["rag_file"])
+
+    for uri, entry in list(known.items()):
+        if uri not in source_files:
+            if entry.get("rag_file"):
+                to_delete.append(entry["rag_file"])
+            del known[uri]
+
+    return to_import, to_delete
+
+
+def ingest_files(corpus_name, full=False, dry_run=False):
+    """Incrementally ingest BQML documentation files into the RAG corpus.
+
+    Only new or changed documents (by content hash) are imported; documents
+    removed from the source are deleted from the corpus. Imports run in
+    parallel batches that share the max_embedding_requests_per_min budget.
+
+    Args:
+        corpus_name: The RAG corpus resource name.
+        full: Re-import every document regardless of the manifest.
+        dry_run: Print the plan without changing the corpus.
+    """
     transformation_config = rag.TransformationConfig(
         chunking_config=rag.ChunkingConfig(
             chunk_size=512,
@@ -67,15 +168,75 @@ def ingest_files(corpus_name):
         ),
     )
 
-    rag.import_files(
-        corpus_name,
-        paths,
-        transformation_config=transformation_config,  # Optional
-        max_embedding_requests_per_min=1000,  # Optional
+    manifest = load_manifest(corpus_name)
+    source_files = list_source_files()
+    to_import, to_delete = plan_ingestion(
+        source_files, manifest, list_corpus_files(corpus_name), full
     )
 
-    # List the files in the rag corpus
-    rag.list_files(corpus_name)
+    print(f"Source documents: {len(source_files)}")
+    print(f"To import (new or changed): {len(to_import)}")
+    print(f"To delete (changed or removed): {len(to_delete)}")
+
+    if dry_run or not (to_import or to_delete):
+        return
+
+    def delete_file(rag_file_name):
+        try:
+            rag.delete_file(rag_file_name)
+        except Exception as e:
+            print(f"Error deleting {rag_file_name}: {e}")
+
+    # Delete stale RagFiles first so changed documents are not duplicated.
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_BATCHES) as executor:
+        list(executor.map(delete_file, to_delete))
+    for uri in to_import:
+        manifest["files"].pop(uri, None)
+    save_manifest(manifest)
+
+    batches = [
+        to_import[i:i + IMPORT_BATCH_SIZE]
+        for i in range(0, len(to_import), IMPORT_BATCH_SIZE)
+    ]
+    workers = min(MAX_PARALLEL_BATCHES, len(batches)) or 1
+    # Concurrent imports share the embedding quota.
+    requests_per_min = max(1, MAX_EMBEDDING_REQUESTS_PER_MIN // workers)
+
+    def import_batch(batch):
+        rag.import_files(
+            corpus_name,
+            batch,
+            transformation_config=transformation_config,  # Optional
+            max_embedding_requests_per_min=requests_per_min,  # Optional
+        )
+        return batch
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(import_batch, batch): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                future.result()
+                print(f"Imported batch of {len(batch)} files")
+            except Exception as e:
+                failed.extend(batch)
+                print(f"Error importing batch of {len(batch)} files: {e}")
+
+    # Record RagFile names for the imported documents.
+    corpus_files = list_corpus_files(corpus_name)
+    for uri in to_import:
+        if uri in failed:
+            manifest["files"].pop(uri, None)
+            continue
+        manifest["files"][uri] = {
+            "hash": source_files[uri],
+            "rag_file": corpus_files.get(uri.rsplit("/", 1)[-1]),
+        }
+    save_manifest(manifest)
+
+    if failed:
+        print(f"{len(failed)} files failed to import; rerun to retry them")
 
 
 def rag_response(query: str) -> str:
@@ -119,6 +280,14 @@ def write_to_env(corpus_name):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the BQML RAG corpus and ingest new or changed documents")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-import every document, ignoring the manifest")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Show what would be imported or deleted")
+    args = parser.parse_args()
+
     # Check if corpus already exists
     corpus_name = os.getenv("BQML_RAG_CORPUS_NAME")
 
@@ -130,5 +299,5 @@ if __name__ == "__main__":
         print(f"Using existing corpus: {corpus_name}")
 
     print(f"Importing files to corpus: {corpus_name}")
-    ingest_files(corpus_name)
+    ingest_files(corpus_name, full=args.full, dry_run=args.dry_run)
     print(f"Files imported to corpus: {corpus_name}")
@@ -4,28 +4,21 @@ Simple script to clean up Vertex AI Code Interpreter extensions.
 """
 
 import argparse
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List
 
-from utils import get_access_token
+from utils import api_base_url
 from utils import get_project_id
+from utils import list_paginated
 from utils import make_api_request
 
 
 def list_vertex_extensions(project_id: str, region: str = "us-central1") -> List[Dict[str, Any]]:
-    """List all Vertex AI extensions in the project."""
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    url = f"https://{region}-aiplatform.googleapis.com/v1beta1/projects/{project_id}/locations/{region}/extensions"
+    """List all Vertex AI extensions in the project, across all pages."""
+    url = f"{api_base_url(region)}/v1beta1/projects/{project_id}/locations/{region}/extensions"
 
     print(f"Listing extensions in project {project_id}...")
-    response = make_api_request("GET", url, headers)
-
-    if "error" in response:
-        return []
-
-    return response.get("extensions", [])
+    return list(list_paginated(url, "extensions"))
 
 
 def filter_code_interpreter_extensions(extensions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -48,13 +41,9 @@ def delete_extension(project_id: str, region: str, extension_id: str, dry_run: b
         print(f"[DRY RUN] Would delete extension {extension_id}")
         return True
 
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    url = f"https://{region}-aiplatform.googleapis.com/v1beta1/projects/{project_id}/locations/{region}/extensions/{extension_id}"
+    url = f"{api_base_url(region)}/v1beta1/projects/{project_id}/locations/{region}/extensions/{extension_id}"
 
-    print(f"Deleting extension {extension_id}...")
-    response = make_api_request("DELETE", url, headers)
+    response = make_api_request("DELETE", url)
 
     if "error" in response:
         print(f"✗ Failed to delete extension {extension_id}")
@@ -69,38 +58,13 @@ def extract_extension_id(extension_name: str) -> str:
     return extension_name.split("/")[-1]
 
 
-def main():
-    """Main function to clean up extensions."""
-    parser = argparse.ArgumentParser(
-        description="Clean up Vertex AI Code Interpreter extensions")
-    parser.add_argument("--dry-run", action="store_true",
-                        help="Preview what would be deleted without actually deleting")
-    parser.add_argument("--keep-id", required=True,
-                        help="Extension ID to keep")
-
-    args = parser.parse_args()
-
-    print("Vertex AI Extension Cleanup Tool")
-    print("=" * 50)
-
-    if args.dry_run:
-        print("🔍 DRY RUN MODE - No actual deletions")
-        print()
-
-    # Get project ID
-    project_id = get_project_id()
-    region = "us-central1"
-
-    print(f"Project: {project_id}")
-    print(f"Extension to keep: {args.keep_id}")
-    print()
-
-    # List all extensions
+def find_extensions_to_delete(project_id: str, region: str, keep_id: str, dry_run: bool) -> List[str]:
+    """List Code Interpreter extensions in a project and return the IDs to delete."""
     extensions = list_vertex_extensions(project_id, region)
 
     if not extensions:
         print("No extensions found.")
-        return
+        return []
 
     # Filter for Code Interpreter extensions
     code_interpreter_extensions = filter_code_interpreter_extensions(
@@ -108,30 +72,70 @@ def main():
 
     if not code_interpreter_extensions:
         print("No Code Interpreter extensions found.")
-        return
+        return []
 
     print(
         f"Found {len(code_interpreter_extensions)} Code Interpreter extensions:")
     print()
 
-    # Process extensions
     extensions_to_delete = []
-    keep_extension_found = False
-
     for ext in code_interpreter_extensions:
         ext_id = extract_extension_id(ext.get("name", ""))
         display_name = ext.get("displayName", "N/A")
 
         print(f"ID: {ext_id} - {display_name}")
 
-        if ext_id == args.keep_id:
+        if ext_id == keep_id:
             print("  Status: ✓ KEEPING")
-            keep_extension_found = True
         else:
             print(
-                f"  Status: ✗ {'WOULD DELETE' if args.dry_run else 'WILL DELETE'}")
+                f"  Status: ✗ {'WOULD DELETE' if dry_run else 'WILL DELETE'}")
             extensions_to_delete.append(ext_id)
 
+    return extensions_to_delete
+
+
+def main():
+    """Main function to clean up extensions."""
+    parser = argparse.ArgumentParser(
+        description="Clean up Vertex AI Code Interpreter extensions")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Preview what would be deleted without actually deleting")
+    parser.add_argument("--keep-id", required=True,
+                        help="Extension ID to keep")
+    parser.add_argument("--project", action="append", dest="projects",
+                        help="Project to clean up (repeatable, defaults to the gcloud project)")
+    parser.add_argument("--region", default="us-central1",
+                        help="Region of the extensions (default: us-central1)")
+    parser.add_argument("--workers", type=int, default=16,
+                        help="Number of concurrent deletes (default: 16)")
+    parser.add_argument("--yes", action="store_true",
+                        help="Skip the confirmation prompt")
+
+    args = parser.parse_args()
+
+    print("Vertex AI Extension Cleanup Tool")
+    print("=" * 50)
+
+    if args.dry_run:
+        print("🔍 DRY RUN MODE - No actual deletions")
+        print()
+
+    projects = args.projects or [get_project_id()]
+    region = args.region
+
+    print(f"Projects: {', '.join(projects)}")
+    print(f"Extension to keep: {args.keep_id}")
+    print()
+
+    # Collect deletions across all projects before asking for confirmation
+    extensions_to_delete = []
+    for project_id in projects:
+        extensions_to_delete.extend(
+            (project_id, ext_id)
+            for ext_id in find_extensions_to_delete(project_id, region, args.keep_id, args.dry_run)
+        )
+
     if not extensions_to_delete:
         print("\nNo extensions to delete.")
         return
@@ -143,18 +147,23 @@ def main():
         return
 
     # Confirm deletion
-    response = input("\nProceed with deletion? (yes/no): ").lower().strip()
+    if not args.yes:
+        response = input("\nProceed with deletion? (yes/no): ").lower().strip()
 
-    if response not in ["yes", "y"]:
-        print("Cancelled.")
-        return
+        if response not in ["yes", "y"]:
+            print("Cancelled.")
+            return
 
-    # Delete extensions
+    # Delete extensions concurrently over the shared HTTP session
     print("\nDeleting...")
-    for ext_id in extensions_to_delete:
-        delete_extension(project_id, region, ext_id, args.dry_run)
-
-    print("\n✓ Cleanup completed!")
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(
+            lambda item: delete_extension(item[0], region, item[1], args.dry_run),
+            extensions_to_delete,
+        ))
+
+    failed = results.count(False)
+    print(f"\n✓ Cleanup completed! Deleted {len(results) - failed}, failed {failed}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Local mock of the Vertex AI extensions API for exercising the setup scripts.
+
+Implements list (paginated), import and delete for extensions, keeping state
+in memory. Point the scripts at it with:
+
+    python setup/vertex_extensions/mock_vertex_api.py --port 8089 --extensions 300
+    export VERTEX_API_ENDPOINT=http://127.0.0.1:8089
+    export VERTEX_ACCESS_TOKEN=mock-token
+    python setup/vertex_extensions/cleanup_vertex_extensions.py --project mock-project --keep-id 1 --yes
+"""
+
+import argparse
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+_COLLECTION = re.compile(r"^/v1beta1/projects/([^/]+)/locations/([^/]+)/extensions$")
+_IMPORT = re.compile(r"^/v1beta1/projects/([^/]+)/locations/([^/]+)/extensions:import$")
+_ITEM = re.compile(r"^/v1beta1/projects/([^/]+)/locations/([^/]+)/extensions/([^/]+)$")
+
+
+class MockVertexState:
+    """In-memory extensions, keyed by resource name in creation order."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.extensions = {}
+        self.ids = itertools.count(1)
+        self.requests = 0
+
+    def create(self, project, region, body):
+        with self.lock:
+            ext_id = str(next(self.ids))
+            name = f"projects/{project}/locations/{region}/extensions/{ext_id}"
+            self.extensions[name] = {
+                "name": name,
+                "displayName": body.get("displayName", ""),
+                "description": body.get("description", ""),
+            }
+            return self.extensions[name]
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _read_body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            state.requests += 1
+            url = urlparse(self.path)
+            match = _COLLECTION.match(url.path)
+            if not match:
+                return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+            prefix = f"projects/{match[1]}/locations/{match[2]}/extensions/"
+            query = parse_qs(url.query)
+            page_size = int(query.get("pageSize", ["100"])[0])
+            offset = int(query.get("pageToken", ["0"])[0])
+            with state.lock:
+                items = [e for n, e in state.extensions.items() if n.startswith(prefix)]
+            body = {"extensions": items[offset:offset + page_size]}
+            if offset + page_size < len(items):
+                body["nextPageToken"] = str(offset + page_size)
+            self._send(200, body)
+
+        def do_POST(self):
+            state.requests += 1
+            match = _IMPORT.match(urlparse(self.path).path)
+            if not match:
+                return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+            self._send(200, state.create(match[1], match[2], self._read_body()))
+
+        def do_DELETE(self):
+            state.requests += 1
+            match = _ITEM.match(urlparse(self.path).path)
+            name = f"projects/{match[1]}/locations/{match[2]}/extensions/{match[3]}" if match else None
+            with state.lock:
+                removed = state.extensions.pop(name, None) if name else None
+            if removed is None:
+                return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+            self._send(200, {"name": f"{name}/operations/delete", "done": True})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_mock_server(port=0, project="mock-project", region="us-central1", extensions=0):
+    """Start the mock in a background thread.
+
+    Returns:
+        The server (use server.server_address for the bound port) and its state.
+    """
+    state = MockVertexState()
+    for i in range(extensions):
+        state.create(project, region, {
+            "displayName": "Code Interpreter Extension",
+            "description": f"Code Interpreter for data analysis #{i}",
+        })
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Vertex AI extensions API")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--project", default="mock-project")
+    parser.add_argument("--region", default="us-central1")
+    parser.add_argument("--extensions", type=int, default=0,
+                        help="Number of Code Interpreter extensions to seed")
+    args = parser.parse_args()
+
+    server, _ = start_mock_server(args.port, args.project, args.region, args.extensions)
+    print(f"Mock Vertex AI API listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
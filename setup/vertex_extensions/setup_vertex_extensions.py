@@ -9,7 +9,7 @@ https://cloud.google.com/vertex-ai/generative-ai/docs/extensions/code-interprete
 import sys
 from typing import Any, Dict
 
-from utils import get_access_token
+from utils import api_base_url
 from utils import get_project_id
 from utils import get_project_number
 from utils import make_api_request
@@ -17,10 +17,7 @@ from utils import make_api_request
 
 def create_code_interpreter_extension(project_id: str, region: str = "us-central1") -> Dict[str, Any]:
     """Create a new Code Interpreter extension."""
-    access_token = get_access_token()
-    headers = {"Authorization": f"Bearer {access_token}"}
-
-    url = f"https://{region}-aiplatform.googleapis.com/v1beta1/projects/{project_id}/locations/{region}/extensions:import"
+    url = f"{api_base_url(region)}/v1beta1/projects/{project_id}/locations/{region}/extensions:import"
 
     # Extension configuration
     extension_data = {
@@ -43,7 +40,7 @@ def create_code_interpreter_extension(project_id: str, region: str = "us-central
     }
 
     print(f"Creating Code Interpreter extension in project {project_id}...")
-    response = make_api_request("POST", url, headers, extension_data)
+    response = make_api_request("POST", url, data=extension_data)
 
     if "error" in response:
         print(f"Error creating extension: {response['error']}")
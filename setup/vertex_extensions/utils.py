@@ -1,16 +1,75 @@
 #!/usr/bin/env python3
 """
 Shared utilities for Vertex AI Code Interpreter extension management.
+
+API calls go through one pooled HTTP session and a cached access token that is
+refreshed shortly before it expires. Set VERTEX_API_ENDPOINT (and optionally
+VERTEX_ACCESS_TOKEN) to point the scripts at a local mock such as
+mock_vertex_api.py instead of the real service.
 """
 
-import json
+import os
 import subprocess
 import sys
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
 
+import requests
+from requests.adapters import HTTPAdapter
+
+# Refresh the token this many seconds before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+# gcloud tokens are valid for one hour; used when the expiry is unknown
+GCLOUD_TOKEN_LIFETIME_SECONDS = 3600
+HTTP_POOL_SIZE = 32
+HTTP_TIMEOUT_SECONDS = 60
+
+_session: Optional[requests.Session] = None
+_token_lock = threading.Lock()
+_token: Optional[str] = None
+_token_expiry = 0.0
+_credentials = None
+
+
+def api_base_url(region: str) -> str:
+    """Return the Vertex AI API base URL for a region (or the mock override)."""
+    override = os.getenv("VERTEX_API_ENDPOINT")
+    if override:
+        return override.rstrip("/")
+    return f"https://{region}-aiplatform.googleapis.com"
+
+
+def get_http_session() -> requests.Session:
+    """Return the shared HTTP session, reusing connections across requests."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def _fetch_token() -> tuple:
+    """Fetch a fresh token, preferring Application Default Credentials."""
+    global _credentials
+    try:
+        import google.auth
+        import google.auth.transport.requests
+
+        if _credentials is None:
+            _credentials, _ = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        _credentials.refresh(google.auth.transport.requests.Request())
+        if _credentials.expiry:
+            lifetime = _credentials.expiry.timestamp() - time.time()
+        else:
+            lifetime = GCLOUD_TOKEN_LIFETIME_SECONDS
+        return _credentials.token, time.time() + lifetime
+    except Exception:
+        pass
 
-def get_access_token() -> str:
-    """Get access token using gcloud auth."""
     try:
         result = subprocess.run(
             ["gcloud", "auth", "print-access-token"],
@@ -18,12 +77,25 @@ def get_access_token() -> str:
             text=True,
             check=True
         )
-        return result.stdout.strip()
+        return result.stdout.strip(), time.time() + GCLOUD_TOKEN_LIFETIME_SECONDS
     except subprocess.CalledProcessError as e:
         print(f"Error getting access token: {e.stderr}")
         sys.exit(1)
 
 
+def get_access_token() -> str:
+    """Get an access token, cached until shortly before it expires."""
+    global _token, _token_expiry
+    static_token = os.getenv("VERTEX_ACCESS_TOKEN")
+    if static_token:
+        return static_token
+
+    with _token_lock:
+        if _token is None or time.time() >= _token_expiry - TOKEN_REFRESH_MARGIN_SECONDS:
+            _token, _token_expiry = _fetch_token()
+        return _token
+
+
 def get_project_id() -> str:
     """Get the current project ID from gcloud config."""
     try:
@@ -60,33 +132,46 @@ def get_project_number(project_id: str) -> str:
         sys.exit(1)
 
 
-def make_api_request(method: str, url: str, headers: Dict[str, str], data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """Make an API request using curl."""
-    curl_command = [
-        "curl", "-s", "-X", method,
-        "-H", f"Authorization: {headers['Authorization']}",
-        "-H", "Content-Type: application/json"
-    ]
-
-    if data:
-        curl_command.extend(["-d", json.dumps(data)])
+def make_api_request(method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                     data: Optional[Dict[str, Any]] = None,
+                     params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Make an API request over the shared HTTP session.
 
-    curl_command.append(url)
+    If no Authorization header is given, the cached access token is used.
+    """
+    request_headers = {"Content-Type": "application/json"}
+    request_headers.update(headers or {})
+    request_headers.setdefault("Authorization", f"Bearer {get_access_token()}")
 
     try:
-        result = subprocess.run(
-            curl_command,
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        response = get_http_session().request(
+            method, url, headers=request_headers, json=data, params=params,
+            timeout=HTTP_TIMEOUT_SECONDS)
+    except requests.RequestException as e:
+        print(f"Error making API request: {e}")
+        return {"error": str(e)}
 
-        if result.stdout.strip():
-            return json.loads(result.stdout)
-        return {}
-    except subprocess.CalledProcessError as e:
-        print(f"Error making API request: {e.stderr}")
-        return {"error": e.stderr}
-    except json.JSONDecodeError as e:
+    try:
+        body = response.json() if response.content.strip() else {}
+    except ValueError as e:
         print(f"Error parsing JSON response: {e}")
         return {"error": "Invalid JSON response"}
+
+    if response.status_code >= 400 and "error" not in body:
+        return {"error": f"HTTP {response.status_code}: {response.text}"}
+    return body
+
+
+def list_paginated(url: str, key: str, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """Yield every item of a paginated list endpoint, following nextPageToken."""
+    params: Dict[str, Any] = {"pageSize": page_size}
+    while True:
+        response = make_api_request("GET", url, params=params)
+        if "error" in response:
+            print(f"Error listing {url}: {response['error']}")
+            return
+        yield from response.get(key, [])
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return
+        params["pageToken"] = page_token
@@ -0,0 +1,19 @@
+"""Import the app without Google Cloud credentials.
+
+Importing `bq_multi_agent_app` builds every agent, and the data science agent's
+code executor resolves its Vertex AI extension when it is constructed. The
+tests only exercise local logic, so a placeholder project is set, that lookup
+is skipped and the local stores are written to a temporary directory. Both
+`python -m unittest` and pytest import this package before any test module.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "test-project")
+os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "us-central1")
+os.environ.setdefault("APP_DATA_DIR", tempfile.mkdtemp(prefix="bq-agent-tests-"))
+
+from google.adk.code_executors import vertex_ai_code_executor  # noqa: E402
+
+vertex_ai_code_executor._get_code_interpreter_extension = lambda resource_name=None: None
@@ -0,0 +1,88 @@
+"""Fair admission to shared resources."""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from bq_multi_agent_app import admission
+from bq_multi_agent_app.admission import ResourceLimiter
+
+
+class ResourceLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def admit_in_order(
+        self, limiter: ResourceLimiter, holder: tuple[str, str], waiters: list[tuple[str, str]]
+    ) -> list[tuple[str, str]]:
+        """Queue `waiters` behind `holder` and return the order in which they are admitted."""
+        await limiter.acquire(*holder)
+        order = []
+
+        async def wait(principal):
+            await limiter.acquire(*principal)
+            order.append(principal)
+
+        tasks = []
+        for principal in waiters:
+            tasks.append(asyncio.create_task(wait(principal)))
+            await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting, len(waiters))
+        limiter.release(*holder)
+        for _ in waiters:
+            await asyncio.sleep(0)
+            limiter.release(*order[-1])
+        await asyncio.gather(*tasks)
+        return order
+
+    async def test_users_are_admitted_round_robin(self):
+        limiter = ResourceLimiter("test", capacity=1, rate=0, burst=1, user_share=1.0)
+        order = await self.admit_in_order(
+            limiter, ("t", "heavy"), [("t", "heavy"), ("t", "heavy"), ("t", "heavy"), ("t", "light")]
+        )
+        # The light user queued last but goes second, not behind the heavy user's backlog.
+        self.assertEqual(order[:2], [("t", "heavy"), ("t", "light")])
+
+    async def test_tenants_are_admitted_round_robin(self):
+        limiter = ResourceLimiter("test", capacity=1, rate=0, burst=1, user_share=1.0)
+        order = await self.admit_in_order(
+            limiter, ("a", "u0"), [("a", "u1"), ("a", "u2"), ("a", "u3"), ("b", "u4")]
+        )
+        # Tenant a's many users do not crowd out tenant b's single user.
+        self.assertEqual([tenant for tenant, _ in order], ["a", "b", "a", "a"])
+
+    async def test_user_share_caps_one_user(self):
+        limiter = ResourceLimiter("test", capacity=4, rate=0, burst=1, user_share=0.5)
+        await limiter.acquire("t", "heavy")
+        await limiter.acquire("t", "heavy")
+        third = asyncio.create_task(limiter.acquire("t", "heavy"))
+        await asyncio.sleep(0)
+        # Free slots remain, but the heavy user holds its share.
+        self.assertFalse(third.done())
+        await asyncio.wait_for(limiter.acquire("t", "other"), 1)
+        limiter.release("t", "heavy")
+        await asyncio.wait_for(third, 1)
+        self.assertEqual(limiter.in_flight, 3)
+
+    async def test_queue_timeout(self):
+        limiter = ResourceLimiter("test", capacity=1, rate=0, burst=1, user_share=1.0)
+        await limiter.acquire("t", "u1")
+        with mock.patch.object(admission, "ADMISSION_QUEUE_TIMEOUT_SECONDS", 0.01):
+            with self.assertRaises(admission.AdmissionTimeout):
+                await limiter.acquire("t", "u2")
+        self.assertEqual(limiter.timeouts, 1)
+        # The timed-out caller is skipped when the slot frees up.
+        limiter.release("t", "u1")
+        self.assertEqual(limiter.in_flight, 0)
+
+    async def test_cancelled_waiter_does_not_take_a_slot(self):
+        limiter = ResourceLimiter("test", capacity=1, rate=0, burst=1, user_share=1.0)
+        await limiter.acquire("t", "u1")
+        waiter = asyncio.create_task(limiter.acquire("t", "u2"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        limiter.release("t", "u1")
+        self.assertEqual(limiter.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
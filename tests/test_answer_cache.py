@@ -0,0 +1,46 @@
+"""Matching of cached answers."""
+
+import unittest
+
+import numpy as np
+
+from bq_multi_agent_app.answer_cache import AnswerCache
+from bq_multi_agent_app.answer_cache import question_literals
+
+
+class QuestionLiteralsTest(unittest.TestCase):
+    def test_paraphrases_share_literals(self):
+        self.assertEqual(
+            question_literals("Revenue for EMEA in 2024?"), question_literals("what was the 2024 revenue for EMEA")
+        )
+        self.assertEqual(question_literals("Show me last month's revenue by region"), [])
+
+    def test_values_are_literals(self):
+        self.assertEqual(question_literals("orders since 2024-01-05 in Germany"), ["2024-01-05", "germany"])
+        self.assertIn("home & garden", question_literals("top 5 products in 'Home & Garden'"))
+        self.assertNotEqual(
+            question_literals("revenue for EMEA in 2024"), question_literals("revenue for APAC in 2023")
+        )
+
+
+class AnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = AnswerCache(f"answer_cache_{self.id()}")
+        self.embedding = np.ones(4, dtype=np.float32) / 2
+        self.cache.add("acme", "revenue for EMEA in 2024", "EMEA: 100", {"p.d.sales"}, self.embedding)
+
+    def test_same_tenant_and_literals_match(self):
+        literals = question_literals("What was revenue for EMEA in 2024?")
+        self.assertEqual(len(self.cache.candidates(self.embedding, "acme", literals)), 1)
+
+    def test_other_literals_do_not_match(self):
+        literals = question_literals("revenue for APAC in 2023")
+        self.assertEqual(self.cache.candidates(self.embedding, "acme", literals), [])
+
+    def test_other_tenants_do_not_match(self):
+        literals = question_literals("revenue for EMEA in 2024")
+        self.assertEqual(self.cache.candidates(self.embedding, "globex", literals), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Staging of data files for the DS agent's code executor."""
+
+import unittest
+from types import SimpleNamespace
+
+import pyarrow as pa
+
+from bq_multi_agent_app import data_files
+from bq_multi_agent_app.data_files import CODE_EXECUTOR_INPUT_FILES_KEY
+from bq_multi_agent_app.data_files import STAGED_FILE_KEY
+from bq_multi_agent_app.data_files import attach_staged_file
+from bq_multi_agent_app.data_files import stage_table
+
+TABLE = pa.table({"region": ["EMEA", "APAC"], "revenue": [50, 40]})
+
+
+def ds_run_context(state: dict) -> SimpleNamespace:
+    """Callback context of a DS agent run started from a session with `state`."""
+    session = SimpleNamespace(state=dict(state))
+    return SimpleNamespace(state=session.state, _invocation_context=SimpleNamespace(session=session))
+
+
+class StageFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tool_context = SimpleNamespace(state={})
+
+    def test_state_holds_only_the_file_name(self):
+        staged = stage_table(TABLE, self.tool_context)
+        self.assertEqual(self.tool_context.state, {STAGED_FILE_KEY: staged.name})
+        self.assertTrue(stage_table(TABLE, self.tool_context).reused)
+
+    def test_staged_file_is_attached_to_the_ds_run_only(self):
+        staged = stage_table(TABLE, self.tool_context)
+        context = ds_run_context(self.tool_context.state)
+        attach_staged_file(context)
+        files = context._invocation_context.session.state[CODE_EXECUTOR_INPUT_FILES_KEY]
+        self.assertEqual([f["name"] for f in files], [staged.name])
+        self.assertNotIn(CODE_EXECUTOR_INPUT_FILES_KEY, self.tool_context.state)
+
+    def test_inline_data_detaches_the_previous_file(self):
+        stage_table(TABLE, self.tool_context)
+        self.assertIsNone(data_files.stage_data("region,revenue\nEMEA,50", self.tool_context))
+        context = ds_run_context(self.tool_context.state)
+        attach_staged_file(context)
+        self.assertEqual(context._invocation_context.session.state[CODE_EXECUTOR_INPUT_FILES_KEY], [])
+
+    def test_legacy_payload_is_dropped_from_the_state(self):
+        self.tool_context.state[CODE_EXECUTOR_INPUT_FILES_KEY] = [{"name": "old.parquet", "content": "..."}]
+        stage_table(TABLE, self.tool_context)
+        self.assertEqual(self.tool_context.state[CODE_EXECUTOR_INPUT_FILES_KEY], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Conversion of Postgres COPY output to Arrow."""
+
+import unittest
+from contextlib import contextmanager
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pyarrow as pa
+
+from bq_multi_agent_app.sub_agents.pg_agents import export
+
+COLUMNS = [
+    SimpleNamespace(name="id", type_code=20, precision=None, scale=None),
+    SimpleNamespace(name="amount", type_code=1700, precision=12, scale=2),
+    SimpleNamespace(name="ratio", type_code=1700, precision=None, scale=None),
+]
+
+
+class FakeCopyCursor:
+    """Cursor whose COPY yields `chunks` (CSV) or `rows` (binary)."""
+
+    def __init__(self, chunks: list[bytes] = (), rows: list[tuple] = ()):
+        self.chunks = chunks
+        self.rows = rows
+
+    @contextmanager
+    def copy(self, statement: str):
+        copy = SimpleNamespace(set_types=lambda types: None, rows=lambda: iter(self.rows))
+        yield self.chunks if "csv" in statement else copy
+
+
+def progress() -> export.ExportProgress:
+    return export.ExportProgress(export_id="test", sql="")
+
+
+class NumericExportTest(unittest.TestCase):
+    def test_numeric_is_decimal_in_both_formats(self):
+        for copy_format in ("csv", "binary"):
+            with self.subTest(copy_format=copy_format):
+                schema = export._arrow_schema(COLUMNS, copy_format)
+                self.assertEqual(schema.field("amount").type, pa.decimal128(12, 2))
+                self.assertEqual(schema.field("ratio").type, pa.string())
+
+    def test_csv_keeps_exact_values_and_nulls_special_values(self):
+        schema = export._arrow_schema(COLUMNS, "csv")
+        csv = b"id,amount,ratio\n1,1234567890.12,0.1\n2,NaN,NaN\n3,,Infinity\n"
+        batches = list(export._csv_batches(FakeCopyCursor(chunks=[csv]), "", schema, progress()))
+        rows = pa.Table.from_batches(batches, schema).to_pylist()
+        self.assertEqual([r["amount"] for r in rows], [Decimal("1234567890.12"), None, None])
+        self.assertEqual([r["ratio"] for r in rows], ["0.1", "NaN", "Infinity"])
+
+    def test_binary_nulls_special_values(self):
+        schema = export._arrow_schema(COLUMNS, "binary")
+        rows = [(1, Decimal("0.10"), Decimal("0.1")), (2, Decimal("NaN"), Decimal("NaN"))]
+        cursor = FakeCopyCursor(rows=rows)
+        batches = list(export._binary_batches(cursor, "", COLUMNS, schema, progress()))
+        rows = pa.Table.from_batches(batches, schema).to_pylist()
+        self.assertEqual([r["amount"] for r in rows], [Decimal("0.10"), None])
+        self.assertEqual([r["ratio"] for r in rows], ["0.1", "NaN"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Local follow-up transforms over stored query results."""
+
+import unittest
+from types import SimpleNamespace
+
+import pyarrow as pa
+
+from bq_multi_agent_app import result_frames
+from bq_multi_agent_app.result_frames import transform_result
+
+SALES = {
+    "region": ["EMEA", "EMEA", "APAC", "EMEA", "AMER", None],
+    "product": ["a", "b", "a", "c", "b", "a"],
+    "revenue": [50, 20, 40, 30, 60, 5],
+}
+
+
+class TransformResultTest(unittest.TestCase):
+    def setUp(self):
+        self.session_id = self.id()
+        self.context = SimpleNamespace(session=SimpleNamespace(id=self.session_id), state={})
+        self.source = result_frames.result_frames.add(
+            self.session_id, pa.table(SALES), source="bigquery-execute-sql", query="SELECT * FROM sales"
+        )
+
+    def transform(self, **kwargs) -> dict:
+        return transform_result(self.context, **kwargs)
+
+    def test_filter(self):
+        result = self.transform(filter="region IN ('EMEA', 'APAC') AND revenue >= 30")
+        self.assertEqual(result["status"], "success")
+        self.assertEqual([r["revenue"] for r in result["rows"]], [50, 40, 30])
+
+    def test_filter_like_between_and_null_checks(self):
+        source = self.source.result_id
+        self.assertEqual(self.transform(result_id=source, filter="region LIKE 'E%'")["row_count"], 3)
+        self.assertEqual(self.transform(result_id=source, filter="revenue BETWEEN 20 AND 40")["row_count"], 3)
+        self.assertEqual(self.transform(result_id=source, filter="region IS NULL")["row_count"], 1)
+
+    def test_filter_rejects_null_literals_and_malformed_in_lists(self):
+        for condition in ("region = NULL", "region IN ('EMEA', NULL)", "region IN ('EMEA'", "region IN ()"):
+            with self.subTest(condition=condition):
+                self.assertEqual(self.transform(filter=condition)["status"], "error")
+
+    def test_group_and_aggregate(self):
+        result = self.transform(group_by="region", aggregations="sum(revenue) as total, count(*) as n")
+        totals = {r["region"]: (r["total"], r["n"]) for r in result["rows"]}
+        self.assertEqual(totals["EMEA"], (100, 3))
+        self.assertEqual(totals["APAC"], (40, 1))
+
+    def test_sort_and_limit(self):
+        result = self.transform(sort_by="revenue desc", limit=2, columns="region, revenue")
+        self.assertEqual(result["rows"], [{"region": "AMER", "revenue": 60}, {"region": "EMEA", "revenue": 50}])
+        self.assertEqual(result["columns"], ["region", "revenue"])
+
+    def test_pivot(self):
+        result = self.transform(
+            filter="region IS NOT NULL", group_by="region", pivot_column="product", aggregations="sum(revenue)"
+        )
+        emea = next(r for r in result["rows"] if r["region"] == "EMEA")
+        self.assertEqual((emea["a"], emea["b"], emea["c"]), (50, 20, 30))
+
+    def test_transforms_chain_on_the_latest_result(self):
+        self.transform(filter="region = 'EMEA'")
+        result = self.transform(group_by="region", aggregations="sum(revenue) as total")
+        self.assertEqual(result["rows"], [{"region": "EMEA", "total": 100}])
+
+    def test_limited_transform_is_not_aggregated_again(self):
+        self.transform(sort_by="revenue desc", limit=2)
+        result = self.transform(group_by="region", aggregations="sum(revenue) as total")
+        self.assertEqual(result["status"], "needs_requery")
+        # The full source result can still be used explicitly.
+        result = self.transform(result_id=self.source.result_id, group_by="region", aggregations="sum(revenue)")
+        self.assertEqual(result["status"], "success")
+
+    def test_limited_query_needs_requery(self):
+        result_frames.result_frames.add(
+            self.session_id, pa.table(SALES), source="bigquery-execute-sql", complete=False
+        )
+        self.assertEqual(self.transform(filter="region = 'EMEA'")["status"], "needs_requery")
+        # Truncating further is still answered locally.
+        self.assertEqual(self.transform(limit=3)["status"], "success")
+
+    def test_unknown_column_needs_requery(self):
+        result = self.transform(group_by="country")
+        self.assertEqual(result["status"], "needs_requery")
+        self.assertIn("region", result["available_columns"])
+
+
+if __name__ == "__main__":
+    unittest.main()
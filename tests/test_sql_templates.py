@@ -0,0 +1,84 @@
+"""Question shapes and SQL templates."""
+
+import unittest
+
+from bq_multi_agent_app.sql_templates import SqlTemplate
+from bq_multi_agent_app.sql_templates import parameterize
+
+
+def template_for(question: str, sql: str) -> SqlTemplate:
+    shape, sql_template, slots, relative = parameterize(question, sql)
+    return SqlTemplate(
+        template_id="t",
+        tool="bigquery-execute-sql",
+        question=question,
+        shape=shape,
+        sql=sql_template,
+        slots=slots,
+        tables=[],
+        relative=relative,
+        validated_on="2026-01-01",
+    )
+
+
+class ParameterizeTest(unittest.TestCase):
+    def test_string_and_year_slots(self):
+        shape, sql, slots, relative = parameterize(
+            "Revenue for EMEA in 2024?",
+            "SELECT SUM(revenue) FROM `p.d.sales` WHERE region = 'EMEA' AND EXTRACT(YEAR FROM day) = 2024;",
+        )
+        self.assertEqual(shape, "revenue for {p1} in {p2}")
+        self.assertEqual(
+            sql, "SELECT SUM(revenue) FROM `p.d.sales` WHERE region = '{p1}' AND EXTRACT(YEAR FROM day) = {p2}"
+        )
+        self.assertEqual([(s["kind"], s["case"]) for s in slots], [("string", "upper"), ("year", "")])
+        self.assertFalse(relative)
+
+    def test_date_and_number_slots_leave_unrelated_numbers(self):
+        shape, sql, slots, _ = parameterize(
+            "orders since 2024-01-05 for the top 10 customers",
+            "SELECT customer, COUNT(1) FROM orders WHERE day >= '2024-01-05' GROUP BY 1 ORDER BY 2 DESC LIMIT 10",
+        )
+        self.assertEqual(shape, "orders since {p1} for the top {p2} customers")
+        self.assertIn("COUNT(1)", sql)
+        self.assertIn("GROUP BY 1 ORDER BY 2 DESC LIMIT {p2}", sql)
+        self.assertEqual([s["kind"] for s in slots], ["date", "number"])
+
+    def test_literals_not_in_the_question_mark_the_template_relative(self):
+        shape, sql, slots, relative = parameterize(
+            "revenue last year", "SELECT SUM(revenue) FROM t WHERE EXTRACT(YEAR FROM day) = 2025"
+        )
+        self.assertEqual(slots, [])
+        self.assertTrue(relative)
+
+
+class InstantiateTest(unittest.TestCase):
+    def setUp(self):
+        self.template = template_for(
+            "Revenue for EMEA in 2024",
+            "SELECT SUM(revenue) FROM t WHERE region = 'EMEA' AND EXTRACT(YEAR FROM day) = 2024",
+        )
+
+    def test_fills_slots_in_the_original_case(self):
+        self.assertEqual(
+            self.template.instantiate("revenue for apac in 2023?"),
+            "SELECT SUM(revenue) FROM t WHERE region = 'APAC' AND EXTRACT(YEAR FROM day) = 2023",
+        )
+
+    def test_title_case_slot(self):
+        template = template_for("sales in germany", "SELECT * FROM t WHERE country = 'Germany'")
+        self.assertEqual(
+            template.instantiate("Sales in united kingdom"), "SELECT * FROM t WHERE country = 'United Kingdom'"
+        )
+
+    def test_other_shapes_do_not_match(self):
+        self.assertIsNone(self.template.instantiate("revenue for EMEA in 2024 by product"))
+        self.assertIsNone(self.template.instantiate("revenue for EMEA in last year"))
+
+    def test_values_cannot_break_out_of_literals(self):
+        self.assertIsNone(self.template.instantiate("revenue for x' OR '1'='1 in 2024"))
+        self.assertIsNone(self.template.instantiate("revenue for emea\\ in 2024"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""Read-only detection, circuit breaking and retries of toolbox calls."""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from google.adk.tools.base_tool import BaseTool
+
+from bq_multi_agent_app import toolbox
+
+
+class SlowTool(BaseTool):
+    """Toolbox tool stand-in that takes `delay` seconds on every call."""
+
+    def __init__(self, delay: float, name: str = "bigquery-execute-sql"):
+        super().__init__(name=name, description="")
+        self.delay = delay
+        self.calls = 0
+
+    async def run_async(self, *, args, tool_context):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return {"rows": []}
+
+
+class ReadOnlySqlTest(unittest.TestCase):
+    def test_queries_are_read_only(self):
+        for sql in (
+            "SELECT region, SUM(revenue) FROM sales GROUP BY region",
+            "  with t AS (SELECT 1 AS x) SELECT * FROM t",
+            "(SELECT 1) UNION ALL (SELECT 2)",
+            "SELECT market_share, updated_at FROM shares",
+            "SELECT COUNT(*) FROM pg_stat_activity",
+        ):
+            with self.subTest(sql=sql):
+                self.assertTrue(toolbox.is_read_only_sql(sql))
+
+    def test_writes_and_side_effects_are_not(self):
+        for sql in (
+            "INSERT INTO t VALUES (1)",
+            "SELECT 1; DELETE FROM t",
+            "WITH d AS (DELETE FROM t RETURNING *) SELECT * FROM d",
+            "SELECT * INTO new_table FROM t",
+            "SELECT * FROM t FOR UPDATE",
+            "SELECT * FROM t FOR KEY SHARE",
+            "SELECT nextval('orders_id_seq')",
+            "SELECT setval('s', 1)",
+            "SELECT pg_terminate_backend(pid) FROM pg_stat_activity",
+            "SELECT pg_advisory_lock(1)",
+            "SELECT set_config('search_path', 'x', false)",
+            "EXPORT DATA OPTIONS(uri='gs://b/*') AS SELECT 1",
+            "CALL proc()",
+            "",
+        ):
+            with self.subTest(sql=sql):
+                self.assertFalse(toolbox.is_read_only_sql(sql))
+
+    def test_query_job_tools_are_retried_but_not_hedged(self):
+        self.assertTrue(toolbox.is_read_only_call("bigquery-execute-sql", {"sql": "SELECT 1"}))
+        self.assertTrue(toolbox.is_read_only_call("bigquery-forecast", {}))
+        self.assertIn("bigquery-forecast", toolbox.QUERY_JOB_TOOLS)
+        self.assertNotIn("bigquery-get-table-info", toolbox.QUERY_JOB_TOOLS)
+
+    def test_p95_uses_the_nearest_rank(self):
+        tracker = toolbox.LatencyTracker()
+        for seconds in range(1, 20):
+            tracker.record(seconds)
+        self.assertIsNone(tracker.p95())
+        for seconds in (20, 21):
+            tracker.record(seconds)
+        self.assertEqual(tracker.p95(), 20)
+
+
+class ToolboxBreakerTest(unittest.TestCase):
+    def setUp(self):
+        toolbox._breakers.clear()
+        toolbox._latencies.clear()
+        patches = [
+            mock.patch.object(toolbox, "TOOL_TIMEOUTS", {"bigquery-execute-sql": 0.05, "bigquery-get-table-info": 0.5}),
+            mock.patch.object(toolbox, "TOOLBOX_HEDGE_DEFAULT_DELAY_SECONDS", 0.01),
+            mock.patch.object(toolbox, "TOOLBOX_RETRIES", 2),
+            mock.patch.object(toolbox.random, "uniform", lambda a, b: 0),
+            mock.patch("bq_multi_agent_app.singleflight.SINGLEFLIGHT_ENABLED", False),
+            mock.patch("bq_multi_agent_app.admission.ADMISSION_ENABLED", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _toolset(
+        self, delays: dict[str, float], name: str = "bigquery-execute-sql"
+    ) -> tuple[toolbox.ResilientToolset, dict[str, SlowTool]]:
+        toolset = toolbox.ResilientToolset("test", urls=list(delays))
+        tools = {}
+        for endpoint in toolset.endpoints:
+            tools[endpoint.base_url] = SlowTool(delays[endpoint.base_url], name)
+            toolbox._tool_index[id(endpoint.toolset)] = {name: tools[endpoint.base_url]}
+        return toolset, tools
+
+    def _call(self, toolset: toolbox.ResilientToolset, name: str = "bigquery-execute-sql"):
+        tool = toolbox.ResilientTool(toolset, SlowTool(0, name))
+        return asyncio.run(tool.run_async(args={"sql": "SELECT 1"}, tool_context=None))
+
+    def test_timeouts_open_the_breaker(self):
+        toolset, _ = self._toolset({"http://slow": 1.0})
+        breaker = toolset.endpoints[0].breaker
+        for _ in range(2):
+            result = self._call(toolset)
+            self.assertTrue(result["isError"])
+        # Each call is one attempt plus two retries, each timing out.
+        self.assertGreaterEqual(breaker.failures, toolbox.TOOLBOX_BREAKER_FAILURES)
+        self.assertEqual(breaker.state, "open")
+
+    def test_retry_moves_to_the_next_endpoint(self):
+        toolset, tools = self._toolset({"http://slow": 1.0, "http://fast": 0.0})
+        # SQL calls are not hedged, so only the retry reaches the fast endpoint.
+        result = self._call(toolset)
+        self.assertEqual(result, {"rows": []})
+        self.assertEqual(tools["http://slow"].calls, 1)
+        self.assertEqual(tools["http://fast"].calls, 1)
+        self.assertEqual(toolset.endpoints[0].breaker.failures, 1)
+
+    def test_slow_metadata_call_is_hedged(self):
+        toolset, tools = self._toolset({"http://slow": 0.3, "http://fast": 0.0}, "bigquery-get-table-info")
+        result = self._call(toolset, "bigquery-get-table-info")
+        self.assertEqual(result, {"rows": []})
+        # Answered by the hedge within the first attempt, well before the timeout.
+        self.assertEqual(tools["http://slow"].calls, 1)
+        self.assertEqual(tools["http://fast"].calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
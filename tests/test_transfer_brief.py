@@ -0,0 +1,86 @@
+"""Condensed history for sub-agents."""
+
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from google.adk.events import Event
+from google.adk.models import LlmRequest
+from google.genai import types
+
+from bq_multi_agent_app import transfer_brief
+from bq_multi_agent_app.transfer_brief import build_transfer_brief
+
+
+def text_event(invocation_id: str, author: str, text: str) -> Event:
+    role = "user" if author == "user" else "model"
+    content = types.Content(role=role, parts=[types.Part(text=text)])
+    return Event(invocation_id=invocation_id, author=author, content=content)
+
+
+def history(turns: list[tuple[str, str, str]]) -> list[Event]:
+    """Events for past turns given as (question, answering agent, answer)."""
+    events = []
+    for number, (question, author, answer) in enumerate(turns):
+        events += [text_event(f"i{number}", "user", question), text_event(f"i{number}", author, answer)]
+    return events
+
+
+class TransferBriefTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(transfer_brief, "TRANSFER_BRIEF_TOKEN_BUDGET", 500),
+            mock.patch.object(transfer_brief, "TRANSFER_BRIEF_RECENT_TURNS", 2),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def brief(self, events: list[Event], question: str, agent_name: str = "pg_agent") -> LlmRequest:
+        events = [*events, text_event("now", "user", question)]
+        context = SimpleNamespace(
+            session=SimpleNamespace(events=events),
+            invocation_id="now",
+            agent_name=agent_name,
+            user_content=events[-1].content,
+        )
+        request = LlmRequest(contents=[event.content for event in events])
+        build_transfer_brief(context, request)
+        return request
+
+    def test_short_history_is_untouched(self):
+        events = history([("how many orders?", "root_agent", "42")])
+        request = self.brief(events, "and yesterday?")
+        self.assertEqual(len(request.contents), 3)
+
+    def test_long_history_is_condensed_within_budget(self):
+        events = history([(f"question {n}", "root_agent", f"answer {n} " + "x" * 900) for n in range(10)])
+        request = self.brief(events, "what next?")
+        self.assertEqual(len(request.contents), 1)
+        brief = request.contents[0].parts[0].text
+        self.assertLessEqual(len(brief), 500 * transfer_brief.CHARS_PER_TOKEN + 200)
+        self.assertIn("User goal: what next?", brief)
+        # The last two turns come with their answers, newest last, clipped.
+        self.assertLess(brief.index("question 8"), brief.index("question 9"))
+        self.assertIn("Answer: answer 9", brief)
+        self.assertNotIn("x" * (transfer_brief.MAX_ANSWER_CHARS + 1), brief)
+        # Older questions are listed while the budget lasts.
+        self.assertIn("- question 7", brief)
+
+    def test_omitted_questions_are_counted(self):
+        events = history([(f"question {n} " + "q" * 150, "root_agent", "ok") for n in range(60)])
+        brief = self.brief(events, "go on").contents[0].parts[0].text
+        self.assertRegex(brief, r"\(\d+ earlier questions omitted\)")
+
+    def test_own_last_answer_is_kept_verbatim(self):
+        code = "CREATE MODEL `p.d.m`\n  OPTIONS(model_type='linear_reg') AS\nSELECT  x,   y FROM t" + "\n-- col" * 150
+        events = history([("old question", "root_agent", "y" * 3000), ("train a model", "bqml_agent", code)])
+        # Longer than an answer would be clipped to, and its whitespace matters.
+        self.assertGreater(len(code), transfer_brief.MAX_ANSWER_CHARS)
+        brief = self.brief(events, "yes", agent_name="bqml_agent").contents[0].parts[0].text
+        self.assertIn(code, brief)
+        self.assertIn("Answer: (your last answer, quoted below)", brief)
+
+
+if __name__ == "__main__":
+    unittest.main()